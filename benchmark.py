@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Client Benchmarks
+Connect, send, receive, node-query, worker and MCP round-trip latencies against
+mesh_simulator.py, reported as p50/p95/p99 and saved as JSON for comparison
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+
+from delivery_tracker import percentile
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+DEFAULT_TCP_PORT = 14403
+REGRESSION_THRESHOLD = 20    # percent slower at p95 before --compare flags a metric
+
+
+def summarize(samples_ms, **extra):
+    """p50/p95/p99 (plus min/max/mean) of latency samples in milliseconds"""
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {'n': 0, **extra}
+    return {
+        'n': len(ordered),
+        'p50': round(percentile(ordered, 50), 4),
+        'p95': round(percentile(ordered, 95), 4),
+        'p99': round(percentile(ordered, 99), 4),
+        'min': round(ordered[0], 4),
+        'max': round(ordered[-1], 4),
+        'mean': round(sum(ordered) / len(ordered), 4),
+        **extra,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+class Benchmarks:
+    def __init__(self, args):
+        from mesh_simulator import SimulatedMesh
+
+        self.args = args
+        self.results = {}
+        self.skipped = {}
+        self.tmp = tempfile.mkdtemp(prefix='heltec-bench-')
+        self.link = os.path.join(self.tmp, 'sim-pty')
+        # No background traffic and instant acks: the numbers are our own overhead
+        self.mesh = SimulatedMesh(nodes=args.nodes, text_rate=0, position_rate=0, telemetry_rate=0,
+                                  ack_delay=0, preset=args.preset, seed=1)
+        self.mesh.running = True
+        self.server = self.mesh.open_tcp(args.port)
+        self.mesh.open_pty(self.link)
+        threading.Thread(target=self.mesh.run, name="bench-sim", daemon=True).start()
+        # Child processes talk to the simulator directly, never to a running daemon
+        self.child_env = dict(os.environ, HELTEC_DEVICE=self.link,
+                              HELTEC_MESHD_SOCKET=os.path.join(self.tmp, 'no-daemon.sock'))
+
+    def close(self):
+        self.mesh.stop()
+        self.server.shutdown()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def connect_tcp(self):
+        """TCPInterface that has processed config_complete (the constructor can return just before)"""
+        import meshtastic.tcp_interface
+        interface = meshtastic.tcp_interface.TCPInterface('127.0.0.1', portNumber=self.args.port)
+        interface.isConnected.wait(10)
+        return interface
+
+    def record(self, name, samples_ms, **extra):
+        self.results[name] = summarize(samples_ms, **extra)
+        r = self.results[name]
+        if r['n']:
+            print(f"  ⏱️  {name}: p50 {r['p50']:.3f}ms  p95 {r['p95']:.3f}ms  p99 {r['p99']:.3f}ms  (n={r['n']})")
+
+    def bench_connect(self):
+        """Open + want_config handshake + close, over TCP"""
+        samples = []
+        for _ in range(self.args.connects):
+            start = time.perf_counter()
+            interface = self.connect_tcp()
+            samples.append((time.perf_counter() - start) * 1000)
+            # The library sends its first heartbeat right after connecting; closing under it logs a broken pipe
+            time.sleep(0.05)
+            interface.close()
+        self.record('connect', samples, nodes=self.args.nodes + 1)
+
+    def bench_send(self, interface):
+        """interface.sendText call latency and raw throughput into the device"""
+        before = self.mesh.received
+        samples = []
+        started = time.perf_counter()
+        for i in range(self.args.sends):
+            start = time.perf_counter()
+            interface.sendText(f"bench {i}")
+            samples.append((time.perf_counter() - start) * 1000)
+        # Throughput counts until the simulator has parsed every frame
+        deadline = time.time() + 10
+        while self.mesh.received - before < self.args.sends and time.time() < deadline:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - started
+        self.record('send_call', samples,
+                    throughput_per_s=round((self.mesh.received - before) / elapsed, 1))
+
+    def bench_delivery(self, interface):
+        """SendQueue + DeliveryTracker: submit -> routing ack, including airtime pacing"""
+        from delivery_tracker import DeliveryTracker
+        from packet_handlers import HandlerRegistry
+        from receive_pipeline import ReceivePipeline
+        from send_queue import SendQueue
+
+        handlers = HandlerRegistry()
+        pipeline = ReceivePipeline(interface)
+        pipeline.run_dispatcher(handlers.dispatch)
+        queue = SendQueue(interface, preset=self.args.preset).start()
+        tracker = DeliveryTracker(queue, handlers, max_retries=0, ack_timeout=10).start()
+        target = next(iter(self.mesh.nodes.values())).id
+        samples = []
+        try:
+            for i in range(self.args.acks):
+                start = time.perf_counter()
+                delivery = tracker.send(f"ack bench {i}", target)
+                delivery.wait(10)
+                if delivery.state == 'acked':
+                    samples.append((time.perf_counter() - start) * 1000)
+        finally:
+            tracker.stop()
+            queue.stop(drain_timeout=0)
+            pipeline.stop()
+        self.record('delivery_ack', samples, preset=self.args.preset, failed=self.args.acks - len(samples))
+
+    def bench_receive(self, interface):
+        """Simulator frame out -> our HandlerRegistry handler, at a fixed packet rate"""
+        from packet_handlers import HandlerRegistry, TEXT_MESSAGE
+        from receive_pipeline import ReceivePipeline
+
+        sent_at = {}
+        samples = []
+        done = threading.Event()
+        count = self.args.receives
+
+        def on_text(packet, decoded):
+            start = sent_at.pop(packet.get('id'), None)
+            if start is not None:
+                samples.append((time.perf_counter() - start) * 1000)
+            if len(samples) >= count:
+                done.set()
+
+        handlers = HandlerRegistry()
+        handlers.register(TEXT_MESSAGE, on_text)
+        pipeline = ReceivePipeline(interface)
+        pipeline.run_dispatcher(handlers.dispatch)
+        interval = 1 / self.args.rx_rate
+        try:
+            next_at = time.perf_counter()
+            for _ in range(count):
+                packet = self.mesh.random_packet('text')
+                sent_at[packet.id] = time.perf_counter()
+                self.mesh.deliver(packet)
+                next_at += interval
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            done.wait(10)
+        finally:
+            pipeline.stop()
+        self.record('receive_to_handler', samples, rate_per_s=self.args.rx_rate,
+                    lost=count - len(samples), dropped=pipeline.dropped)
+
+    def bench_node_queries(self, interface):
+        """NodeIndex lookups over the simulated node DB"""
+        from node_index import NodeIndex
+
+        index = NodeIndex()
+        start = time.perf_counter()
+        index.seed(interface.nodes)
+        seed_ms = (time.perf_counter() - start) * 1000
+        ids = [node['user']['id'] for node in interface.nodes.values() if 'user' in node]
+
+        queries = {
+            'recent': lambda i: index.recent(20),
+            'heard_since': lambda i: index.heard_since(900),
+            'get': lambda i: index.get(ids[i % len(ids)]),
+        }
+        for name, query in queries.items():
+            samples = []
+            for i in range(self.args.queries):
+                start = time.perf_counter()
+                query(i)
+                samples.append((time.perf_counter() - start) * 1000)
+            self.record(f"node_{name}", samples, nodes=len(index), seed_ms=round(seed_ms, 3))
+
+    def rpc_session(self, argv, cwd=PROJECT_ROOT):
+        return subprocess.Popen(argv, cwd=cwd, env=self.child_env, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
+
+    def bench_worker(self):
+        """mcp_worker.py JSON-RPC round trips (cached status, node list) over its pipes"""
+        worker = self.rpc_session([sys.executable, str(PROJECT_ROOT / 'mcp_worker.py')])
+        try:
+            json.loads(worker.stdout.readline())       # ready notification
+
+            def call(request_id, method, params=None):
+                start = time.perf_counter()
+                worker.stdin.write(json.dumps({'jsonrpc': '2.0', 'id': request_id, 'method': method,
+                                               'params': params or {}}) + '\n')
+                reply = json.loads(worker.stdout.readline())
+                if 'error' in reply:
+                    raise RuntimeError(reply['error']['message'])
+                return (time.perf_counter() - start) * 1000
+
+            first = call(0, 'status')
+            for method, params in (('status', {}), ('nodes', {'limit': 20})):
+                samples = [call(i + 1, method, params) for i in range(self.args.rpcs)]
+                self.record(f"worker_{method}", samples, first_call_ms=round(first, 3))
+        finally:
+            worker.stdin.close()
+            worker.wait(timeout=10)
+
+    def bench_mcp(self):
+        """tools/call through heltec-mcp-server (node) -> worker -> simulator"""
+        server_dir = PROJECT_ROOT / 'heltec-mcp-server'
+        if not shutil.which('node'):
+            self.skipped['mcp_tool'] = "node not installed"
+            return
+        if not (server_dir / 'node_modules' / '@modelcontextprotocol').exists():
+            self.skipped['mcp_tool'] = "run npm install in heltec-mcp-server first"
+            return
+        if not (PROJECT_ROOT / '.venv' / 'bin' / 'python').exists():
+            self.skipped['mcp_tool'] = "the MCP server needs .venv/bin/python"
+            return
+
+        server = self.rpc_session(['node', 'index.mjs'], cwd=server_dir)
+        try:
+            def request(request_id, method, params):
+                server.stdin.write(json.dumps({'jsonrpc': '2.0', 'id': request_id, 'method': method,
+                                               'params': params}) + '\n')
+                while True:
+                    reply = json.loads(server.stdout.readline())
+                    if reply.get('id') == request_id:
+                        return reply
+
+            request(0, 'initialize', {'protocolVersion': '2024-11-05', 'capabilities': {},
+                                      'clientInfo': {'name': 'benchmark', 'version': '1.0'}})
+            server.stdin.write(json.dumps({'jsonrpc': '2.0', 'method': 'notifications/initialized'}) + '\n')
+            call = {'name': 'check_device_status', 'arguments': {}}
+            request(1, 'tools/call', call)     # opens the device
+            samples = []
+            for i in range(self.args.rpcs):
+                start = time.perf_counter()
+                request(i + 2, 'tools/call', call)
+                samples.append((time.perf_counter() - start) * 1000)
+            self.record('mcp_tool', samples, tool='check_device_status')
+        finally:
+            server.stdin.close()
+            server.terminate()
+            server.wait(timeout=10)
+
+    def run(self, only=None):
+        print(f"🧪 Simulator: {len(self.mesh.nodes)} nodes on 127.0.0.1:{self.args.port} and {self.link}")
+        steps = ['connect', 'send', 'delivery', 'receive', 'nodes', 'worker', 'mcp']
+        steps = [s for s in steps if not only or s in only]
+        if 'connect' in steps:
+            self.bench_connect()
+        if {'send', 'delivery', 'receive', 'nodes'} & set(steps):
+            interface = self.connect_tcp()
+            try:
+                if 'send' in steps:
+                    self.bench_send(interface)
+                if 'delivery' in steps:
+                    self.bench_delivery(interface)
+                if 'receive' in steps:
+                    self.bench_receive(interface)
+                if 'nodes' in steps:
+                    self.bench_node_queries(interface)
+            finally:
+                interface.close()
+        if 'worker' in steps:
+            self.bench_worker()
+        if 'mcp' in steps:
+            self.bench_mcp()
+        for name, reason in self.skipped.items():
+            print(f"  ⏭️  {name}: skipped ({reason})")
+
+        return {
+            'meta': {
+                'commit': git_commit(),
+                'time': time.time(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'params': vars(self.args),
+            },
+            'results': self.results,
+            'skipped': self.skipped,
+        }
+
+
+def compare(old, new, threshold=REGRESSION_THRESHOLD):
+    """Print p50/p95 changes per metric; returns the metrics that regressed"""
+    regressed = []
+    print(f"\n📊 {old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    for name, result in new['results'].items():
+        before = old['results'].get(name)
+        if not before or not before.get('n') or not result.get('n'):
+            continue
+        changes = []
+        for key in ('p50', 'p95'):
+            delta = (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            changes.append(f"{key} {before[key]:.3f} -> {result[key]:.3f}ms ({delta:+.0f}%)")
+            if key == 'p95' and delta > threshold:
+                regressed.append(name)
+        marker = "🔻" if name in regressed else "  "
+        print(f"{marker} {name}: {', '.join(changes)}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Heltec client stack against the mesh simulator")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--compare', help="Earlier results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="p95 slowdown in percent that counts as a regression (exit code 1)")
+    parser.add_argument('--only', nargs='+',
+                        choices=['connect', 'send', 'delivery', 'receive', 'nodes', 'worker', 'mcp'])
+    parser.add_argument('--port', type=int, default=DEFAULT_TCP_PORT, help="Simulator TCP port")
+    parser.add_argument('--nodes', type=int, default=100, help="Virtual nodes in the simulated mesh")
+    parser.add_argument('--preset', default='SHORT_TURBO', help="Modem preset (send queue airtime pacing)")
+    parser.add_argument('--connects', type=int, default=10)
+    parser.add_argument('--sends', type=int, default=500)
+    parser.add_argument('--acks', type=int, default=50)
+    parser.add_argument('--receives', type=int, default=1000)
+    parser.add_argument('--rx-rate', type=float, default=200, help="Packets/second for the receive benchmark")
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--rpcs', type=int, default=200)
+    args = parser.parse_args()
+
+    print("🏁 Heltec V2 Client Benchmarks")
+    print("=" * 40)
+    bench = Benchmarks(args)
+    try:
+        report = bench.run(set(args.only) if args.only else None)
+    finally:
+        bench.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(json.load(f), report, args.threshold)
+        if regressed:
+            print(f"❌ Slower than {args.threshold:.0f}% at p95: {', '.join(regressed)}")
+            return 1
+        print("✅ No p95 regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,14 +19,43 @@ For a platform other than ESP32, use the -p option, e.g.:
 $ bin/exception_decoder.py -p ESP32S3 backtrace.txt
 To specify a specific .elf file, use the -e option, e.g.:
 $ bin/exception_decoder.py -e firmware.elf backtrace.txt
+
+Addresses are resolved in-process from the ELF symbol table and DWARF info when
+pyelftools is installed (pip install pyelftools), including inlined frames; the
+toolchain's addr2line is only needed without it, or with --addr2line. The index is
+cached per firmware build id in ~/.cache/meshtastic/exception_decoder (--cache-dir,
+--no-cache) and memory-mapped on the next run against the same build.
+
+To decode every crash in a whole serial log (or live from a serial port) as NDJSON:
+$ bin/exception_decoder.py --stream device.log > crashes.ndjson
+$ bin/exception_decoder.py --stream /dev/ttyUSB0
+ESP32-C3 panics print no Backtrace line; in this mode their MEPC/RA registers and
+"Stack memory:" dump are decoded instead.
+To triage logs from many devices and firmware builds, list them in a manifest (see
+read_manifest) and get unique crashes ranked by how often they occur:
+$ bin/exception_decoder.py --bulk --top 20 manifest.txt
 """
 
 import argparse
+import hashlib
+import json
+import mmap
 import os
 import re
+import stat
+import struct
 import subprocess
 import sys
+from array import array
+from bisect import bisect_right
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from elftools.common.exceptions import ELFError
+    from elftools.elf.elffile import ELFFile
+except ImportError:
+    ELFFile = None
 
 EXCEPTIONS = [
     "Illegal instruction",
@@ -74,9 +103,8 @@ TOOLS = {
     "ESP32C3": "riscv32-esp",
 }
 
-BACKTRACE_REGEX = re.compile(
-    r"(?:\s+(0x40[0-2](?:\d|[a-f]|[A-F]){5}):0x(?:\d|[a-f]|[A-F]){8})\b"
-)
+# PC:SP pairs; any code address, so ESP32-S3 flash/IRAM (0x42..., 0x4037...) match too
+BACKTRACE_REGEX = re.compile(r"(?:\s+(0x[0-9a-fA-F]{8}):0x[0-9a-fA-F]{8})\b")
 EXCEPTION_REGEX = re.compile("^Exception \\((?P<exc>[0-9]*)\\):$")
 COUNTER_REGEX = re.compile(
     "^epc1=(?P<epc1>0x[0-9a-f]+) epc2=(?P<epc2>0x[0-9a-f]+) epc3=(?P<epc3>0x[0-9a-f]+) "
@@ -92,6 +120,29 @@ STACK_REGEX = re.compile(
     "^(?P<off>[0-9a-f]+):\W+(?P<c1>[0-9a-f]+) (?P<c2>[0-9a-f]+) (?P<c3>[0-9a-f]+) (?P<c4>[0-9a-f]+)(\W.*)?$"
 )
 
+GURU_REGEX = re.compile(
+    r"Guru Meditation Error: Core\s+(?P<core>\d+) panic'ed \((?P<reason>[^)]+)\)"
+)
+ABORT_REGEX = re.compile(
+    r"abort\(\) was called at PC (?P<pc>0x[0-9a-fA-F]+) on core (?P<core>\d+)"
+)
+PC_REGEX = re.compile(r"\bPC\s*:\s*(0x[0-9a-fA-F]{8})")
+EXCVADDR_REGEX = re.compile(r"\bEXCVADDR\s*:\s*(0x[0-9a-fA-F]{8})")
+# RISC-V (ESP32-C3) panics dump registers and raw stack memory instead of a Backtrace
+MEPC_REGEX = re.compile(r"\bMEPC\s*:\s*(0x[0-9a-fA-F]{8})")
+RA_REGEX = re.compile(r"\bRA\s*:\s*(0x[0-9a-fA-F]{8})")
+MTVAL_REGEX = re.compile(r"\bMTVAL\s*:\s*(0x[0-9a-fA-F]{8})")
+STACK_MEMORY = "Stack memory:"
+STACK_MEMORY_REGEX = re.compile(r"^[0-9a-fA-F]{8}:((?:\s+0x[0-9a-fA-F]{8})+)\s*$")
+FRAME_REGEX = re.compile(
+    r"^(?P<function>.+?) at (?P<file>.+?):(?P<line>\d+|\?)(?: \(discriminator \d+\))?$"
+)
+CONTEXT_LINES = 64  # panic header lines older than this don't belong to a Backtrace
+MAX_BLOCK_LINES = 1024  # an ESP8266 dump that never reaches <<<stack<<< is cut here
+LOOKUP_BATCH = 1000  # addresses per addr2line invocation
+SIGNATURE_FRAMES = 8  # top frames that identify a crash across reports
+MAX_EXAMPLES = 5  # (file, line) occurrences kept per unique crash
+
 StackLine = namedtuple("StackLine", ["offset", "content"])
 
 
@@ -197,13 +248,663 @@ class ExceptionDataParser(object):
             sys.exit(1)
 
 
+class CrashScanner(object):
+    """Finds every crash in a log, one line at a time.
+
+    feed() returns a crash dict when a Backtrace line (ESP32, ESP32-S3), the end of
+    a "Stack memory:" dump (ESP32-C3) or a complete Exception/stack dump (ESP8266)
+    has been read, otherwise None.
+    """
+
+    def __init__(self, platform):
+        self.platform = platform
+        self.line_number = 0
+        self._context = {}
+        self._context_line = 0
+        self._parser = None
+        self._state = None
+        self._block_start = 0
+        self._stack = None  # ESP32-C3 "Stack memory:" words while inside the dump
+
+    def feed(self, line):
+        self.line_number += 1
+        if self.platform == "ESP8266":
+            return self._feed_esp8266(line.strip())
+        if self.platform == "ESP32C3":
+            return self._feed_riscv(line.strip())
+
+        if "Backtrace:" in line:
+            crash = self._esp32_crash(line[line.index("Backtrace:") :])
+            self._context = {}
+            return crash
+        self._track_context(line, (("pc", PC_REGEX), ("excvaddr", EXCVADDR_REGEX)))
+        return None
+
+    def _track_context(self, line, registers):
+        """Remember the panic header and the registers dumped after it"""
+        match = GURU_REGEX.search(line) or ABORT_REGEX.search(line)
+        if match is not None:
+            self._context = match.groupdict()
+            self._context["core"] = int(self._context["core"])
+            if "reason" not in self._context:
+                self._context["reason"] = "abort()"
+            self._context_line = self.line_number
+        elif self._context:
+            if self.line_number - self._context_line > CONTEXT_LINES:
+                self._context = {}
+                return
+            for key, regex in registers:
+                match = regex.search(line)
+                if match is not None and key not in self._context:
+                    self._context[key] = match.group(1)
+
+    def _feed_riscv(self, line):
+        crash = None
+        if self._stack is not None:
+            match = STACK_MEMORY_REGEX.match(line)
+            if match is not None:
+                self._stack.extend(match.group(1).split())
+                if self.line_number - self._block_start <= MAX_BLOCK_LINES:
+                    return None
+                return self._riscv_crash(truncated=True)
+            # The first line after the dump ends it, and may start the next panic
+            crash = self._riscv_crash(truncated=False)
+        if line.startswith(STACK_MEMORY) and self._context:
+            self._stack = []
+            self._block_start = self.line_number
+            return crash
+        self._track_context(
+            line, (("pc", MEPC_REGEX), ("ra", RA_REGEX), ("excvaddr", MTVAL_REGEX))
+        )
+        return crash
+
+    def _riscv_crash(self, truncated):
+        crash = {
+            "line": self._context_line,
+            "platform": self.platform,
+            "reason": None,
+            "core": None,
+            "pc": None,
+            "excvaddr": None,
+        }
+        crash.update(self._context)
+        # No unwound backtrace: MEPC, the return address, then code words on the stack
+        ra = crash.pop("ra", None)
+        crash["stack"] = [a for a in (crash["pc"], ra) if a] + self._stack
+        crash["truncated"] = truncated
+        self._context, self._stack = {}, None
+        return crash
+
+    def _esp32_crash(self, line):
+        crash = {
+            "line": self.line_number,
+            "platform": self.platform,
+            "reason": None,
+            "core": None,
+            "pc": None,
+            "excvaddr": None,
+        }
+        crash.update(self._context)
+        crash["backtrace"] = BACKTRACE_REGEX.findall(line)
+        crash["corrupted"] = "CORRUPTED" in line
+        return crash
+
+    def _feed_esp8266(self, line):
+        if line.startswith("Exception ("):
+            partial = self.finish()
+            self._parser = ExceptionDataParser()
+            self._state = self._parser._parse_exception(line)
+            self._block_start = self.line_number
+            return partial
+        if self._parser is None:
+            return None
+        self._state = self._state(line)
+        if self._state is None:
+            return self._esp8266_crash(truncated=False)
+        if self.line_number - self._block_start > MAX_BLOCK_LINES:
+            return self._esp8266_crash(truncated=True)
+        return None
+
+    def _esp8266_crash(self, truncated):
+        parser, self._parser, self._state = self._parser, None, None
+        exception = parser.exception
+        reason = None
+        if exception is not None and exception < len(EXCEPTIONS):
+            reason = EXCEPTIONS[exception].split(":")[0]
+        return {
+            "line": self._block_start,
+            "platform": self.platform,
+            "reason": reason,
+            "exception": exception,
+            "pc": parser.epc1,
+            "excvaddr": parser.excvaddr,
+            "ctx": parser.ctx,
+            "stack": [addr for line in parser.stack for addr in line.content],
+            "truncated": truncated,
+        }
+
+    def finish(self):
+        """The crash still being read at end of input (cut short), if any"""
+        if self._stack is not None:
+            return self._riscv_crash(truncated=True)
+        if self._parser is None:
+            return None
+        return self._esp8266_crash(truncated=True)
+
+
+INDEX_MAGIC = b"MTSYMIDX"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<8sHHI")  # magic, version, little-endian flag, tables
+INDEX_TABLE = struct.Struct("<24scBQQ")  # name, typecode, itemsize, offset, count
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", "~/.cache"), "meshtastic", "exception_decoder"
+)
+CACHE_ENTRIES = 16
+
+SCOPE_TAGS = {
+    "DW_TAG_namespace",
+    "DW_TAG_class_type",
+    "DW_TAG_structure_type",
+    "DW_TAG_union_type",
+}
+
+
+class StringTable(object):
+    """Read-only list of strings packed into one UTF-8 buffer"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    @staticmethod
+    def pack(strings):
+        encoded = [value.encode("utf-8") for value in strings]
+        offsets = array("Q", [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        return array("B", b"".join(encoded)), offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return bytes(self._blob[start:end]).decode("utf-8", "replace")
+
+
+class ElfIndex(object):
+    """Sorted address-range index over an ELF's symbols and DWARF line/inline info.
+
+    Everything is parsed once into flat arrays; a lookup is a few binary searches.
+    save() writes the arrays to one file that load() memory-maps without parsing.
+    """
+
+    ARRAYS = (
+        "sym_lo",
+        "sym_hi",
+        "sym_name",
+        "sym_file",
+        "line_addr",
+        "line_file",
+        "line_num",
+        "scope_name",
+        "scope_parent",
+        "scope_call_file",
+        "scope_call_line",
+        "seg_start",
+        "seg_scope",
+    )
+
+    def __init__(self, elf_path):
+        self.names = []
+        self.files = []
+        self._name_ids = {}
+        self._file_ids = {}
+        self._die_names = {}
+
+        # .symtab functions: [lo, hi) -> name (and source file for local symbols)
+        self.sym_lo = array("Q")
+        self.sym_hi = array("Q")
+        self.sym_name = array("i")
+        self.sym_file = array("i")
+        # DWARF line table rows; file -1 marks the end of a sequence
+        self.line_addr = array("Q")
+        self.line_file = array("i")
+        self.line_num = array("I")
+        # Subprogram and inlined-subroutine scopes; a scope's caller is its parent
+        self.scope_name = array("i")
+        self.scope_parent = array("i")
+        self.scope_call_file = array("i")
+        self.scope_call_line = array("I")
+        # Non-overlapping segments, each owned by its innermost scope (-1 = none)
+        self.seg_start = array("Q")
+        self.seg_scope = array("i")
+
+        with open(elf_path, "rb") as f:
+            elf = ELFFile(f)
+            self._thumb = elf["e_machine"] == "EM_ARM"
+            self._load_symbols(elf)
+            if elf.has_dwarf_info():
+                dwarf = elf.get_dwarf_info()
+                ranges = []
+                for cu in dwarf.iter_CUs():
+                    self._load_cu(dwarf, cu, ranges)
+                self._sort_lines()
+                self._build_segments(ranges)
+        self._die_names = None
+
+    def _intern(self, table, ids, value):
+        index = ids.get(value)
+        if index is None:
+            index = ids[value] = len(table)
+            table.append(value)
+        return index
+
+    def _load_symbols(self, elf):
+        symtab = elf.get_section_by_name(".symtab")
+        if symtab is None:
+            return
+        symbols = []
+        section_ends = {}
+        source = -1
+        for sym in symtab.iter_symbols():
+            section = sym["st_shndx"]
+            if sym["st_info"]["type"] == "STT_FILE":
+                # Local symbols follow the STT_FILE entry of their translation unit
+                source = self._intern(self.files, self._file_ids, sym.name)
+                continue
+            if sym["st_info"]["type"] != "STT_FUNC" or not sym.name:
+                continue
+            if not isinstance(section, int):
+                continue
+            if section not in section_ends:
+                header = elf.get_section(section).header
+                section_ends[section] = header["sh_addr"] + header["sh_size"]
+            lo = sym["st_value"] & ~1 if self._thumb else sym["st_value"]
+            local = sym["st_info"]["bind"] == "STB_LOCAL"
+            symbols.append(
+                (lo, sym["st_size"], section, sym.name, source if local else -1)
+            )
+        symbols.sort()
+        for i, (lo, size, section, name, source) in enumerate(symbols):
+            if size:
+                hi = lo + size
+            else:
+                # Assembly entry points often have no size: they run to the next symbol
+                hi = section_ends[section]
+                j = i + 1
+                while j < len(symbols):
+                    if symbols[j][0] > lo and symbols[j][2] == section:
+                        hi = symbols[j][0]
+                        break
+                    j += 1
+            self.sym_lo.append(lo)
+            self.sym_hi.append(hi)
+            self.sym_name.append(self._intern(self.names, self._name_ids, name))
+            self.sym_file.append(source)
+
+    def _load_cu(self, dwarf, cu, ranges):
+        top = cu.get_top_DIE()
+        comp_dir = top.attributes.get("DW_AT_comp_dir")
+        comp_dir = comp_dir.value.decode("utf-8", "replace") if comp_dir else ""
+        program = dwarf.line_program_for_CU(cu)
+        file_ids = self._line_files(program, comp_dir) if program else []
+        if program:
+            self._load_lines(program, file_ids)
+
+        low_pc = top.attributes.get("DW_AT_low_pc")
+        base = low_pc.value if low_pc else 0
+        stack = [(child, -1, 0) for child in top.iter_children()]
+        while stack:
+            die, parent, depth = stack.pop()
+            scope = parent
+            if die.tag in ("DW_TAG_subprogram", "DW_TAG_inlined_subroutine"):
+                pcs = self._die_ranges(dwarf, cu, die, base)
+                if pcs:
+                    scope = len(self.scope_name)
+                    self.scope_name.append(self._die_name(die))
+                    self.scope_parent.append(parent)
+                    call_file = die.attributes.get("DW_AT_call_file")
+                    call_line = die.attributes.get("DW_AT_call_line")
+                    self.scope_call_file.append(
+                        self._file_id(file_ids, program, call_file.value)
+                        if call_file
+                        else -1
+                    )
+                    self.scope_call_line.append(call_line.value if call_line else 0)
+                    ranges.extend((lo, hi, depth, scope) for lo, hi in pcs)
+                    depth += 1
+            if die.has_children:
+                stack.extend((child, scope, depth) for child in die.iter_children())
+
+    def _line_files(self, program, comp_dir):
+        """Line-program file table as indices into self.files"""
+        header = program.header
+        dirs = [d.decode("utf-8", "replace") for d in header["include_directory"]]
+        if header["version"] < 5:
+            dirs.insert(0, comp_dir)
+        ids = []
+        for entry in header["file_entry"]:
+            directory = dirs[entry.dir_index] if entry.dir_index < len(dirs) else ""
+            path = os.path.join(
+                comp_dir, directory, entry.name.decode("utf-8", "replace")
+            )
+            ids.append(self._intern(self.files, self._file_ids, os.path.normpath(path)))
+        return ids
+
+    def _file_id(self, file_ids, program, index):
+        # DWARF 5 numbers files from 0, earlier versions from 1
+        if program is not None and program.header["version"] < 5:
+            index -= 1
+        return file_ids[index] if 0 <= index < len(file_ids) else -1
+
+    def _load_lines(self, program, file_ids):
+        for entry in program.get_entries():
+            state = entry.state
+            if state is None:
+                continue
+            self.line_addr.append(state.address)
+            if state.end_sequence:
+                self.line_file.append(-1)
+                self.line_num.append(0)
+            else:
+                self.line_file.append(self._file_id(file_ids, program, state.file))
+                self.line_num.append(state.line)
+
+    def _sort_lines(self):
+        # Rows come per sequence; at equal addresses an end marker sorts before the row
+        # that starts the next sequence, and the last row for an address wins a lookup
+        rows = sorted(
+            zip(self.line_addr, self.line_file, self.line_num),
+            key=lambda row: (row[0], row[1] >= 0),
+        )
+        self.line_addr = array("Q", (row[0] for row in rows))
+        self.line_file = array("i", (row[1] for row in rows))
+        self.line_num = array("I", (row[2] for row in rows))
+
+    def _die_ranges(self, dwarf, cu, die, base):
+        attrs = die.attributes
+        if "DW_AT_low_pc" in attrs and "DW_AT_high_pc" in attrs:
+            lo = attrs["DW_AT_low_pc"].value
+            high = attrs["DW_AT_high_pc"]
+            hi = high.value if high.form.startswith("DW_FORM_addr") else lo + high.value
+            if self._thumb:
+                lo, hi = lo & ~1, hi & ~1
+            return [(lo, hi)] if hi > lo else []
+        if "DW_AT_ranges" in attrs and dwarf.range_lists() is not None:
+            pcs = []
+            for entry in dwarf.range_lists().get_range_list_at_offset(
+                attrs["DW_AT_ranges"].value, cu=cu
+            ):
+                if hasattr(entry, "base_address"):
+                    base = entry.base_address
+                elif entry.end_offset > entry.begin_offset:
+                    offset = 0 if entry.is_absolute else base
+                    pcs.append((entry.begin_offset + offset, entry.end_offset + offset))
+            return pcs
+        return []
+
+    def _die_name(self, die):
+        """Qualified name of a subprogram, following abstract_origin/specification"""
+        if die.offset in self._die_names:
+            return self._die_names[die.offset]
+        target = die
+        for _ in range(8):
+            if "DW_AT_name" in target.attributes:
+                break
+            for ref in ("DW_AT_abstract_origin", "DW_AT_specification"):
+                if ref in target.attributes:
+                    target = target.get_DIE_from_attribute(ref)
+                    break
+            else:
+                break
+        name = target.attributes.get("DW_AT_name")
+        name = name.value.decode("utf-8", "replace") if name else "??"
+        parent = target.get_parent()
+        while parent is not None and parent.tag in SCOPE_TAGS:
+            scope = parent.attributes.get("DW_AT_name")
+            if scope:
+                scope = scope.value.decode("utf-8", "replace")
+            else:
+                scope = "(anonymous namespace)"
+            name = scope + "::" + name
+            parent = parent.get_parent()
+        index = self._intern(self.names, self._name_ids, name)
+        self._die_names[die.offset] = index
+        return index
+
+    def _build_segments(self, ranges):
+        """Flatten nested scope ranges into segments owned by the innermost scope"""
+        def emit(start, scope):
+            if self.seg_start and self.seg_start[-1] == start:
+                self.seg_scope[-1] = scope
+            else:
+                self.seg_start.append(start)
+                self.seg_scope.append(scope)
+
+        open_ranges = []
+        for lo, hi, _, scope in sorted(ranges, key=lambda r: (r[0], r[2])):
+            while open_ranges and open_ranges[-1][0] <= lo:
+                end, _ = open_ranges.pop()
+                emit(end, open_ranges[-1][1] if open_ranges else -1)
+            emit(lo, scope)
+            open_ranges.append((hi, scope))
+        while open_ranges:
+            end, _ = open_ranges.pop()
+            emit(end, open_ranges[-1][1] if open_ranges else -1)
+
+    def _line(self, address):
+        i = bisect_right(self.line_addr, address) - 1
+        if i < 0 or self.line_file[i] < 0:
+            return None, 0
+        return self.files[self.line_file[i]], self.line_num[i]
+
+    def save(self, path):
+        """Write every array to path, atomically"""
+        tables = [(name, getattr(self, name)) for name in self.ARRAYS]
+        for name in ("names", "files"):
+            blob, offsets = StringTable.pack(getattr(self, name))
+            tables += [(name + "_blob", blob), (name + "_offsets", offsets)]
+
+        offset = INDEX_HEADER.size + INDEX_TABLE.size * len(tables)
+        entries = []
+        for name, values in tables:
+            offset += -offset % 8
+            entries.append((name, values, offset))
+            offset += len(values) * values.itemsize
+
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "wb") as f:
+            little = sys.byteorder == "little"
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, little, len(tables)))
+            for name, values, offset in entries:
+                f.write(
+                    INDEX_TABLE.pack(
+                        name.encode(),
+                        values.typecode.encode(),
+                        values.itemsize,
+                        offset,
+                        len(values),
+                    )
+                )
+            for name, values, offset in entries:
+                f.write(b"\0" * (offset - f.tell()))
+                values.tofile(f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map an index written by save(); arrays become zero-copy views"""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)
+        magic, version, little, count = INDEX_HEADER.unpack_from(mm, 0)
+        if (magic, version) != (INDEX_MAGIC, INDEX_VERSION):
+            raise ValueError("not a symbol index of this version")
+        if bool(little) != (sys.byteorder == "little"):
+            raise ValueError("symbol index has the wrong byte order")
+
+        tables = {}
+        for i in range(count):
+            name, typecode, itemsize, offset, length = INDEX_TABLE.unpack_from(
+                mm, INDEX_HEADER.size + i * INDEX_TABLE.size
+            )
+            typecode = typecode.decode()
+            if array(typecode).itemsize != itemsize:
+                raise ValueError("symbol index has a different item size")
+            end = offset + length * itemsize
+            if end > len(mm):
+                raise ValueError("symbol index is truncated")
+            tables[name.rstrip(b"\0").decode()] = view[offset:end].cast(typecode)
+
+        required = cls.ARRAYS + tuple(
+            name + suffix for name in ("names", "files") for suffix in ("_blob", "_offsets")
+        )
+        missing = [name for name in required if name not in tables]
+        if missing:
+            raise ValueError("symbol index is missing " + ", ".join(missing))
+
+        index = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(index, name, tables[name])
+        for name in ("names", "files"):
+            blob, offsets = tables[name + "_blob"], tables[name + "_offsets"]
+            setattr(index, name, StringTable(blob, offsets))
+        return index
+
+    def lookup(self, address):
+        """Frames for an address as (function, file, line), innermost first.
+
+        Like addr2line, an address past the end of a function's symbol that
+        still has a DWARF line is named after the nearest preceding symbol.
+        Unlike it, padding with no line info gets no frame at all (so stack
+        words pointing between functions are not misattributed), and names are
+        DWARF-qualified without parameter lists.
+        """
+        path, line = self._line(address)
+        i = bisect_right(self.seg_start, address) - 1
+        scope = self.seg_scope[i] if i >= 0 else -1
+        if scope < 0:
+            i = bisect_right(self.sym_lo, address) - 1
+            if i < 0 or (address >= self.sym_hi[i] and path is None):
+                return [] if path is None else [("??", path, line)]
+            if path is None and self.sym_file[i] >= 0:
+                path = self.files[self.sym_file[i]]
+            return [(self.names[self.sym_name[i]], path, line)]
+
+        frames = [(self.names[self.scope_name[scope]], path, line)]
+        while self.scope_parent[scope] >= 0:
+            call_file = self.scope_call_file[scope]
+            call_line = self.scope_call_line[scope]
+            scope = self.scope_parent[scope]
+            frames.append(
+                (
+                    self.names[self.scope_name[scope]],
+                    self.files[call_file] if call_file >= 0 else None,
+                    call_line,
+                )
+            )
+        return frames
+
+
+def elf_cache_key(elf_path):
+    """GNU build-id of the ELF, or the SHA-256 of the file when it has none"""
+    with open(elf_path, "rb") as f:
+        section = ELFFile(f).get_section_by_name(".note.gnu.build-id")
+        if section is not None:
+            for note in section.iter_notes():
+                if note["n_type"] == "NT_GNU_BUILD_ID":
+                    return "build-" + note["n_desc"]
+        f.seek(0)
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return "sha256-" + digest.hexdigest()
+
+
+def evict_cache(cache_dir, entries=CACHE_ENTRIES):
+    """Drop least recently used index files beyond the newest entries"""
+    paths = [
+        os.path.join(cache_dir, name)
+        for name in os.listdir(cache_dir)
+        if name.endswith(".idx")
+    ]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[entries:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_index(elf_path, cache_dir=CACHE_DIR, entries=CACHE_ENTRIES):
+    """ElfIndex for elf_path, or None when pyelftools or the ELF is unavailable.
+
+    With a cache_dir the index is stored per build id and memory-mapped on reuse.
+    """
+    if ELFFile is None or not os.path.exists(elf_path):
+        return None
+    cache_path = None
+    if cache_dir:
+        cache_dir = os.path.expanduser(cache_dir)
+        try:
+            cache_path = os.path.join(cache_dir, elf_cache_key(elf_path) + ".idx")
+        except (ELFError, OSError):
+            return None
+        if os.path.exists(cache_path):
+            try:
+                index = ElfIndex.load(cache_path)
+                os.utime(cache_path)  # mtime is the LRU clock
+                return index
+            except (OSError, ValueError, struct.error):
+                pass
+
+    try:
+        index = ElfIndex(elf_path)
+    except (ELFError, OSError):
+        return None
+    if cache_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            index.save(cache_path)
+            evict_cache(cache_dir, entries)
+        except OSError:
+            pass
+    return index
+
+
+def format_frame(function, path, line):
+    return "{} at {}:{}".format(function, path or "??", line or "?")
+
+
+def parse_frame(text):
+    """(function, file, line) from addr2line's "function at file:line" """
+    match = FRAME_REGEX.match(text)
+    if match is None:
+        return text, None, 0
+    path = match.group("file")
+    line = match.group("line")
+    return (
+        match.group("function"),
+        None if path == "??" else path,
+        int(line) if line.isdigit() else 0,
+    )
+
+
 class AddressResolver(object):
-    def __init__(self, tool_path, elf_path):
+    def __init__(self, tool_path, elf_path, index=None):
         self._tool = tool_path
         self._elf = elf_path
+        self._index = index
         self._address_map = {}
+        self._frames = {}
+        self._resolved = set()
 
     def _lookup(self, addresses):
+        if self._index is not None:
+            self._lookup_index(addresses)
+            return
+
         cmd = [self._tool, "-aipfC", "-e", self._elf] + [
             addr for addr in addresses if addr is not None
         ]
@@ -224,14 +925,49 @@ class AddressResolver(object):
                 if last is not None and line.startswith("(inlined by)"):
                     line = line[12:].strip()
                     self._address_map[last] += "\n  \-> inlined by: " + line
+                    self._frames[last].append(parse_frame(line))
                 continue
 
             if match.group("result") == "?? ??:0":
                 continue
 
             self._address_map[match.group("addr")] = match.group("result")
+            self._frames[match.group("addr")] = [parse_frame(match.group("result"))]
             last = match.group("addr")
 
+    def _lookup_index(self, addresses):
+        for addr in addresses:
+            if addr is None:
+                continue
+            try:
+                frames = self._index.lookup(int(addr, 16))
+            except ValueError:
+                continue
+            if not frames:
+                continue
+            result = format_frame(*frames[0])
+            for frame in frames[1:]:
+                result += "\n  \\-> inlined by: " + format_frame(*frame)
+            self._address_map[self._sanitize_addr(addr)] = result
+            self._frames[self._sanitize_addr(addr)] = frames
+
+    def resolve(self, addresses):
+        """Look up every address not resolved before, LOOKUP_BATCH per pass"""
+        pending = []
+        for addr in addresses:
+            if addr is None:
+                continue
+            key = self._sanitize_addr(addr)
+            if key not in self._resolved:
+                self._resolved.add(key)
+                pending.append(addr)
+        for i in range(0, len(pending), LOOKUP_BATCH):
+            self._lookup(pending[i : i + LOOKUP_BATCH])
+
+    def frames(self, addr):
+        """Resolved (function, file, line) frames for addr, innermost first"""
+        return self._frames.get(self._sanitize_addr(addr), [])
+
     def fill(self, parser):
         addresses = [
             parser.epc1,
@@ -245,7 +981,7 @@ class AddressResolver(object):
         for line in parser.stack:
             addresses.extend(line.content)
 
-        self._lookup(addresses)
+        self.resolve(addresses)
 
     def _sanitize_addr(self, addr):
         if addr.startswith("0x"):
@@ -273,6 +1009,217 @@ class AddressResolver(object):
         return None
 
 
+def crash_addresses(crash):
+    addresses = [crash.get("pc"), crash.get("excvaddr")]
+    return addresses + crash.get("backtrace", []) + crash.get("stack", [])
+
+
+def frame_report(addr, frames):
+    if not addr.startswith("0x"):
+        addr = "0x" + addr.rjust(8, "0")
+    report = {"addr": addr, "function": None, "file": None, "line": None}
+    if frames:
+        function, path, line = frames[0]
+        report.update(function=function, file=path, line=line or None)
+        report["inlined"] = [
+            {"function": function, "file": path, "line": line or None}
+            for function, path, line in frames[1:]
+        ]
+    return report
+
+
+def crash_report(crash, resolver):
+    """JSON-ready decoded crash: registers and frames resolved through resolver"""
+    report = dict(crash)
+    report.pop("backtrace", None)
+    report.pop("stack", None)
+    if crash.get("pc"):
+        report["pc"] = frame_report(crash["pc"], resolver.frames(crash["pc"]))
+    if "backtrace" in crash:
+        report["frames"] = [
+            frame_report(addr, resolver.frames(addr)) for addr in crash["backtrace"]
+        ]
+    else:
+        # A raw ESP8266 stack dump is mostly data; keep the words that are code
+        report["frames"] = [
+            frame_report(addr, resolver.frames(addr))
+            for addr in crash["stack"]
+            if resolver.frames(addr)
+        ]
+    return report
+
+
+def decode_stream(lines, scanner, resolver, batch=0):
+    """Yield a report per crash in lines, resolving addresses once per batch.
+
+    batch=0 collects the whole input first (one resolution pass); batch=1 reports
+    each crash as soon as it is read, for a live serial port.
+    """
+    pending = []
+
+    def flush():
+        resolver.resolve(addr for crash in pending for addr in crash_addresses(crash))
+        reports = [crash_report(crash, resolver) for crash in pending]
+        del pending[:]
+        return reports
+
+    for line in lines:
+        crash = scanner.feed(line)
+        if crash is None:
+            continue
+        pending.append(crash)
+        if batch and len(pending) >= batch:
+            for report in flush():
+                yield report
+    crash = scanner.finish()
+    if crash is not None:
+        pending.append(crash)
+    for report in flush():
+        yield report
+
+
+def crash_signature(report):
+    """Stable hash of platform, reason and the functions of the top frames"""
+    parts = [report["platform"], report.get("reason") or ""]
+    for frame in report["frames"][:SIGNATURE_FRAMES]:
+        # Function names match across firmware builds; raw addresses only within one
+        parts.append(frame["function"] or frame["addr"])
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def add_crash(crashes, report):
+    signature = crash_signature(report)
+    entry = crashes.get(signature)
+    if entry is None:
+        entry = crashes[signature] = {
+            "signature": signature,
+            "count": 0,
+            "platform": report["platform"],
+            "reason": report.get("reason"),
+            "frames": report["frames"],
+            "firmware": {},
+            "examples": [],
+        }
+    entry["count"] += 1
+    entry["firmware"][report["elf"]] = entry["firmware"].get(report["elf"], 0) + 1
+    if len(entry["examples"]) < MAX_EXAMPLES:
+        entry["examples"].append({"file": report["source"], "line": report["line"]})
+
+
+def merge_crashes(total, crashes):
+    for signature, entry in crashes.items():
+        existing = total.get(signature)
+        if existing is None:
+            total[signature] = entry
+            continue
+        existing["count"] += entry["count"]
+        for elf, count in entry["firmware"].items():
+            existing["firmware"][elf] = existing["firmware"].get(elf, 0) + count
+        room = MAX_EXAMPLES - len(existing["examples"])
+        existing["examples"].extend(entry["examples"][: max(room, 0)])
+
+
+def decode_group(platform, elf_file, files, addr2line, cache_dir, native=True):
+    """Unique crashes in files, decoded against one firmware ELF (a pool task)"""
+    index = load_index(elf_file, cache_dir) if native else None
+    resolver = AddressResolver(addr2line, elf_file, index)
+    crashes = {}
+    total = 0
+    for path in files:
+        with open(path, "r", errors="replace") as f:
+            for report in decode_stream(f, CrashScanner(platform), resolver):
+                report["source"] = path
+                report["elf"] = elf_file
+                add_crash(crashes, report)
+                total += 1
+    return total, crashes
+
+
+def read_manifest(path, platform, elf_file):
+    """{(platform, elf): [log files]} from a manifest of logs.
+
+    Each line is either a log path (decoded with -p/-e) or a JSON object such as
+    {"file": "dev42.log", "platform": "ESP32S3", "elf": "2.5.1/firmware.elf"}.
+    Relative paths are relative to the manifest.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    groups = {}
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line) if line.startswith("{") else {"file": line}
+            key = (
+                entry.get("platform", platform),
+                os.path.normpath(os.path.join(base, entry.get("elf", elf_file))),
+            )
+            if key[0] not in PLATFORMS:
+                raise ValueError("unknown platform " + key[0])
+            groups.setdefault(key, []).append(
+                os.path.normpath(os.path.join(base, entry["file"]))
+            )
+    return groups
+
+
+def addr2line_path(tool, platform):
+    addr2line = os.path.join(
+        os.path.abspath(os.path.expanduser(tool + TOOLS[platform])),
+        "bin/" + PLATFORMS[platform] + "-elf-addr2line",
+    )
+    if os.name == "nt":
+        addr2line += ".exe"
+    return addr2line
+
+
+def bulk_decode(groups, tool, cache_dir, native=True, jobs=None, messages=sys.stderr):
+    """Decode every (platform, ELF) group in a process pool; merged unique crashes"""
+    total_crashes = {}
+    total = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            pool.submit(
+                decode_group,
+                platform,
+                elf_file,
+                files,
+                addr2line_path(tool, platform),
+                cache_dir,
+                native,
+            ): (platform, elf_file, files)
+            for (platform, elf_file), files in groups.items()
+        }
+        for future in as_completed(futures):
+            platform, elf_file, files = futures[future]
+            try:
+                count, crashes = future.result()
+            except Exception as e:
+                print("ERROR: {} ({}): {}".format(elf_file, platform, e), file=messages)
+                continue
+            print(
+                "{} crashes in {} logs for {} ({})".format(
+                    count, len(files), elf_file, platform
+                ),
+                file=messages,
+            )
+            total += count
+            merge_crashes(total_crashes, crashes)
+    return total, total_crashes
+
+
+def open_log(path, baud):
+    """Lines of a log file, stdin ('-') or a serial port, undecodable bytes replaced"""
+    if path == "-":
+        return sys.stdin, not sys.stdin.isatty()
+    if stat.S_ISCHR(os.stat(path).st_mode):
+        import serial
+
+        port = serial.Serial(path, baud)
+        lines = (raw.decode("utf-8", "replace") for raw in iter(port.readline, b""))
+        return lines, False
+    return open(path, "r", errors="replace"), True
+
+
 def print_addr(name, value, resolver):
     print("{}:{} {}".format(name, " " * (8 - len(name)), resolver.resolve_addr(value)))
 
@@ -348,6 +1295,46 @@ def parse_args():
     parser.add_argument(
         "-s", "--stack_only", help="Decode only a stractrace", action="store_true"
     )
+    parser.add_argument(
+        "--addr2line",
+        help="Resolve with the toolchain's addr2line instead of reading the ELF",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Where symbol indexes are kept, one per firmware build",
+        default=CACHE_DIR,
+    )
+    parser.add_argument(
+        "--no-cache", help="Always re-read the ELF", action="store_true"
+    )
+    parser.add_argument(
+        "--stream",
+        help="Decode every crash in a log or serial port and print NDJSON reports",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--batch",
+        help="With --stream: crashes per resolution pass (0 = whole input; "
+        "default 0 for files, 1 for serial ports)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--baud", help="With --stream on a serial port", type=int, default=115200
+    )
+    parser.add_argument(
+        "--bulk",
+        help="FILE is a manifest of logs, possibly for different platforms and ELFs; "
+        "print unique crashes ranked by count as NDJSON",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j", "--jobs", help="With --bulk: worker processes", type=int, default=None
+    )
+    parser.add_argument(
+        "--top", help="With --bulk: only the N most frequent crashes", type=int
+    )
     parser.add_argument(
         "file",
         help="The file to read the exception data from ('-' for STDIN)",
@@ -359,30 +1346,62 @@ def parse_args():
 
 if __name__ == "__main__":
     args = parse_args()
+    # Keep stdout pure NDJSON when streaming
+    messages = sys.stderr if args.stream or args.bulk else sys.stdout
 
     if args.file == "-":
         file = sys.stdin
     else:
         if not os.path.exists(args.file):
-            print("ERROR: file " + args.file + " not found")
+            print("ERROR: file " + args.file + " not found", file=messages)
             sys.exit(1)
-        file = open(args.file, "r")
+        if not args.stream and not args.bulk:
+            file = open(args.file, "r")
+
+    if args.bulk:
+        elf_file = os.path.abspath(os.path.expanduser(args.elf))
+        groups = read_manifest(args.file, args.platform, elf_file)
+        count, crashes = bulk_decode(
+            groups,
+            args.tool,
+            None if args.no_cache else args.cache_dir,
+            not args.addr2line,
+            args.jobs,
+            messages,
+        )
+        ranked = sorted(crashes.values(), key=lambda entry: -entry["count"])
+        for entry in ranked[: args.top]:
+            sys.stdout.write(json.dumps(entry) + "\n")
+        print("{} crashes, {} unique".format(count, len(crashes)), file=messages)
+        sys.exit(0)
 
-    addr2line = os.path.join(
-        os.path.abspath(os.path.expanduser(args.tool + TOOLS[args.platform])),
-        "bin/" + PLATFORMS[args.platform] + "-elf-addr2line",
-    )
-    if os.name == "nt":
-        addr2line += ".exe"
-    if not os.path.exists(addr2line):
-        print("ERROR: addr2line not found (" + addr2line + ")")
+    addr2line = addr2line_path(args.tool, args.platform)
 
     elf_file = os.path.abspath(os.path.expanduser(args.elf))
     if not os.path.exists(elf_file):
-        print("ERROR: elf file not found (" + elf_file + ")")
+        print("ERROR: elf file not found (" + elf_file + ")", file=messages)
+
+    index = None
+    if not args.addr2line:
+        index = load_index(elf_file, None if args.no_cache else args.cache_dir)
+    if index is None and not os.path.exists(addr2line):
+        print("ERROR: addr2line not found (" + addr2line + ")", file=messages)
+
+    resolver = AddressResolver(addr2line, elf_file, index)
+
+    if args.stream:
+        lines, whole = open_log(args.file, args.baud)
+        batch = args.batch if args.batch is not None else (0 if whole else 1)
+        scanner = CrashScanner(args.platform)
+        try:
+            for report in decode_stream(lines, scanner, resolver, batch):
+                sys.stdout.write(json.dumps(report) + "\n")
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
 
     parser = ExceptionDataParser()
-    resolver = AddressResolver(addr2line, elf_file)
 
     parser.parse_file(file, args.platform, args.stack_only)
     resolver.fill(parser)
@@ -11,6 +11,11 @@ UF2_MAGIC_START0 = 0x0A324655  # "UF2\n"
 UF2_MAGIC_START1 = 0x9E5D5157  # Randomly selected
 UF2_MAGIC_END = 0x0AB16F30  # Ditto
 
+UF2_BLOCK_SIZE = 512
+UF2_PAYLOAD_SIZE = 256
+UF2_HEADER = struct.Struct("<IIIIIIII")
+UF2_FOOTER = struct.Struct("<I")
+
 families = {
     "SAMD21": 0x68ED2B88,
     "SAML21": 0x1851780A,
@@ -58,66 +63,74 @@ def is_hex(buf):
 
 def convert_from_uf2(buf):
     global appstartaddr
-    numblocks = len(buf) // 512
+    numblocks = len(buf) // UF2_BLOCK_SIZE
     curraddr = None
-    outp = b""
+    # First pass validates headers and places each payload; the second copies them
+    # into one preallocated image, so gaps cost nothing but the zeroed allocation
+    copies = []
     for blockno in range(numblocks):
-        ptr = blockno * 512
-        block = buf[ptr : ptr + 512]
-        hd = struct.unpack(b"<IIIIIIII", block[0:32])
+        ptr = blockno * UF2_BLOCK_SIZE
+        hd = UF2_HEADER.unpack_from(buf, ptr)
         if hd[0] != UF2_MAGIC_START0 or hd[1] != UF2_MAGIC_START1:
-            print("Skipping block at " + ptr + "; bad magic")
+            print("Skipping block at " + str(ptr) + "; bad magic")
             continue
         if hd[2] & 1:
             # NO-flash flag set; skip block
             continue
         datalen = hd[4]
         if datalen > 476:
-            assert False, "Invalid UF2 data size at " + ptr
+            assert False, "Invalid UF2 data size at " + str(ptr)
         newaddr = hd[3]
         if curraddr == None:
             appstartaddr = newaddr
             curraddr = newaddr
         padding = newaddr - curraddr
         if padding < 0:
-            assert False, "Block out of order at " + ptr
+            assert False, "Block out of order at " + str(ptr)
         if padding > 10 * 1024 * 1024:
-            assert False, "More than 10M of padding needed at " + ptr
+            assert False, "More than 10M of padding needed at " + str(ptr)
         if padding % 4 != 0:
-            assert False, "Non-word padding size at " + ptr
-        while padding > 0:
-            padding -= 4
-            outp += b"\x00\x00\x00\x00"
-        outp += block[32 : 32 + datalen]
+            assert False, "Non-word padding size at " + str(ptr)
+        copies.append((newaddr - appstartaddr, ptr + UF2_HEADER.size, datalen))
         curraddr = newaddr + datalen
+
+    outp = bytearray(0 if curraddr is None else curraddr - appstartaddr)
+    src = memoryview(buf)
+    for dst, ptr, datalen in copies:
+        outp[dst : dst + datalen] = src[ptr : ptr + datalen]
     return outp
 
 
+BYTE_LITERALS = ["0x%02x, " % b for b in range(256)]
+
+
 def convert_to_carray(file_content):
+    rows = [
+        "".join(map(BYTE_LITERALS.__getitem__, file_content[ptr : ptr + 16]))
+        for ptr in range(0, len(file_content), 16)
+    ]
     outp = "const unsigned char bindata[] __attribute__((aligned(16))) = {"
-    for i in range(len(file_content)):
-        if i % 16 == 0:
-            outp += "\n"
-        outp += "0x%02x, " % ord(file_content[i])
+    outp += "".join("\n" + row for row in rows)
     outp += "\n};\n"
-    return outp
+    return outp.encode("utf-8")
+
+
+def uf2_flags():
+    return 0x2000 if familyid else 0x0
 
 
 def convert_to_uf2(file_content):
-    global familyid
-    datapadding = b""
-    while len(datapadding) < 512 - 256 - 32 - 4:
-        datapadding += b"\x00\x00\x00\x00"
     numblocks = (len(file_content) + 255) // 256
-    outp = b""
+    # Zero-filled up front: short last chunk and the unused tail of every block
+    outp = bytearray(numblocks * UF2_BLOCK_SIZE)
+    src = memoryview(file_content)
+    flags = uf2_flags()
     for blockno in range(numblocks):
-        ptr = 256 * blockno
-        chunk = file_content[ptr : ptr + 256]
-        flags = 0x0
-        if familyid:
-            flags |= 0x2000
-        hd = struct.pack(
-            b"<IIIIIIII",
+        ptr = UF2_PAYLOAD_SIZE * blockno
+        off = UF2_BLOCK_SIZE * blockno
+        UF2_HEADER.pack_into(
+            outp,
+            off,
             UF2_MAGIC_START0,
             UF2_MAGIC_START1,
             flags,
@@ -127,11 +140,9 @@ def convert_to_uf2(file_content):
             numblocks,
             familyid,
         )
-        while len(chunk) < 256:
-            chunk += b"\x00"
-        block = hd + chunk + datapadding + struct.pack(b"<I", UF2_MAGIC_END)
-        assert len(block) == 512
-        outp += block
+        chunk = src[ptr : ptr + UF2_PAYLOAD_SIZE]
+        outp[off + 32 : off + 32 + len(chunk)] = chunk
+        UF2_FOOTER.pack_into(outp, off + UF2_BLOCK_SIZE - 4, UF2_MAGIC_END)
     return outp
 
 
@@ -140,26 +151,26 @@ class Block:
         self.addr = addr
         self.bytes = bytearray(256)
 
-    def encode(self, blockno, numblocks):
-        global familyid
-        flags = 0x0
-        if familyid:
-            flags |= 0x2000
-        hd = struct.pack(
-            "<IIIIIIII",
+    def encode_into(self, outp, off, blockno, numblocks):
+        """Write this block at outp[off:off + 512]; outp must be zeroed there"""
+        UF2_HEADER.pack_into(
+            outp,
+            off,
             UF2_MAGIC_START0,
             UF2_MAGIC_START1,
-            flags,
+            uf2_flags(),
             self.addr,
             256,
             blockno,
             numblocks,
             familyid,
         )
-        hd += self.bytes[0:256]
-        while len(hd) < 512 - 4:
-            hd += b"\x00"
-        hd += struct.pack("<I", UF2_MAGIC_END)
+        outp[off + 32 : off + 32 + UF2_PAYLOAD_SIZE] = self.bytes
+        UF2_FOOTER.pack_into(outp, off + UF2_BLOCK_SIZE - 4, UF2_MAGIC_END)
+
+    def encode(self, blockno, numblocks):
+        hd = bytearray(UF2_BLOCK_SIZE)
+        self.encode_into(hd, 0, blockno, numblocks)
         return hd
 
 
@@ -170,13 +181,9 @@ def convert_from_hex_to_uf2(buf):
     currblock = None
     blocks = []
     for line in buf.split("\n"):
-        if line[0] != ":":
+        if not line.startswith(":"):
             continue
-        i = 1
-        rec = []
-        while i < len(line) - 1:
-            rec.append(int(line[i : i + 2], 16))
-            i += 2
+        rec = bytes.fromhex(line[1:].strip())
         tp = rec[3]
         if tp == 4:
             upper = ((rec[4] << 8) | rec[5]) << 16
@@ -189,18 +196,21 @@ def convert_from_hex_to_uf2(buf):
             addr = upper | (rec[1] << 8) | rec[2]
             if appstartaddr == None:
                 appstartaddr = addr
-            i = 4
-            while i < len(rec) - 1:
+            data = memoryview(rec)[4:-1]
+            i = 0
+            while i < len(data):
                 if not currblock or currblock.addr & ~0xFF != addr & ~0xFF:
                     currblock = Block(addr & ~0xFF)
                     blocks.append(currblock)
-                currblock.bytes[addr & 0xFF] = rec[i]
-                addr += 1
-                i += 1
+                # Copy up to the end of the record or of the current 256-byte block
+                n = min(len(data) - i, 0x100 - (addr & 0xFF))
+                currblock.bytes[addr & 0xFF : (addr & 0xFF) + n] = data[i : i + n]
+                addr += n
+                i += n
     numblocks = len(blocks)
-    resfile = b""
+    resfile = bytearray(numblocks * UF2_BLOCK_SIZE)
     for i in range(0, numblocks):
-        resfile += blocks[i].encode(i, numblocks)
+        blocks[i].encode_into(resfile, i * UF2_BLOCK_SIZE, i, numblocks)
     return resfile
 
 
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Throughput of uf2conv's converters on a random multi-MB image.
+
+$ bin/uf2conv_benchmark.py --size 8
+"""
+import argparse
+import os
+import time
+
+import uf2conv
+
+
+def to_hex(data, base):
+    """Intel HEX for data at base: 16-byte data records plus extended addresses"""
+    lines = []
+    upper = None
+    for ptr in range(0, len(data), 16):
+        addr = base + ptr
+        if addr >> 16 != upper:
+            upper = addr >> 16
+            rec = bytes([2, 0, 0, 4, upper >> 8, upper & 0xFF])
+            lines.append(rec)
+        chunk = data[ptr : ptr + 16]
+        lines.append(bytes([len(chunk), (addr >> 8) & 0xFF, addr & 0xFF, 0]) + chunk)
+    lines.append(bytes([0, 0, 0, 1]))
+    out = []
+    for rec in lines:
+        checksum = (-sum(rec)) & 0xFF
+        out.append(":" + (rec + bytes([checksum])).hex().upper())
+    return "\n".join(out) + "\n"
+
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark uf2conv conversions.")
+    parser.add_argument(
+        "--size", type=float, default=4, help="image size in MB (default: 4)"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per conversion, best is reported"
+    )
+    parser.add_argument(
+        "--base", type=lambda v: int(v, 0), default=0x26000, help="load address"
+    )
+    args = parser.parse_args()
+
+    data = os.urandom(int(args.size * 1024 * 1024))
+    hex_text = to_hex(data, args.base)
+    uf2conv.familyid = uf2conv.families["NRF52"]
+    uf2conv.appstartaddr = args.base
+    mb = len(data) / (1024 * 1024)
+
+    elapsed, uf2 = best_of(args.repeat, uf2conv.convert_to_uf2, data)
+    print("bin -> uf2:   %8.1f MB/s" % (mb / elapsed))
+    elapsed, image = best_of(args.repeat, uf2conv.convert_from_uf2, uf2)
+    print("uf2 -> bin:   %8.1f MB/s" % (mb / elapsed))
+    assert bytes(image) == data, "uf2 round trip changed the image"
+    elapsed, from_hex = best_of(args.repeat, uf2conv.convert_from_hex_to_uf2, hex_text)
+    print("hex -> uf2:   %8.1f MB/s" % (mb / elapsed))
+    assert bytes(from_hex) == bytes(uf2), "hex and bin conversions differ"
+    elapsed, _ = best_of(args.repeat, uf2conv.convert_to_carray, data)
+    print("bin -> C:     %8.1f MB/s" % (mb / elapsed))
+
+
+if __name__ == "__main__":
+    main()
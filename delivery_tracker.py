@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Delivery Tracker
+Matches ROUTING acks/naks to sent packet ids, retries direct messages with
+exponential backoff and keeps end-to-end delivery latency percentiles
+"""
+
+import math
+import time
+import heapq
+import random
+import itertools
+import threading
+from collections import deque
+
+from packet_handlers import ROUTING
+from send_queue import QUEUED, SENT, ACKED, FAILED, NORMAL, local_node_num
+
+MAX_RETRIES = 2
+BACKOFF_BASE = 10.0       # seconds before the first retry, doubled each time
+BACKOFF_MAX = 120.0
+# The firmware retransmits a want_ack packet itself and sends a MAX_RETRANSMIT
+# nak when it gives up, so this only catches acks that never come back at all
+ACK_TIMEOUT = 90.0
+LATENCY_SAMPLES = 1000
+
+BROADCAST = '^all'
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Delivery:
+    """One logical message across all of its transmission attempts"""
+
+    def __init__(self, text, destination, channel, priority, max_retries, want_ack=None):
+        self.text = text
+        self.destination = destination or BROADCAST
+        self._want_ack = want_ack
+        self.channel = channel
+        self.priority = priority
+        self.max_retries = max_retries
+        self.attempts = []
+        self.state = QUEUED
+        self.error = None
+        self.implicit_ack = False
+        self.created_at = time.time()
+        self.done_at = None
+        self.callbacks = []
+        self.done = threading.Event()
+
+    @property
+    def want_ack(self):
+        """Direct messages ask for an ack unless the caller said otherwise"""
+        if self._want_ack is not None:
+            return self._want_ack
+        return self.destination != BROADCAST
+
+    @property
+    def retries(self):
+        return max(0, len(self.attempts) - 1)
+
+    @property
+    def latency(self):
+        """Queued-to-acked time, including every retry"""
+        return self.done_at - self.created_at if self.done_at else None
+
+    @property
+    def packet_id(self):
+        return self.attempts[-1].packet_id if self.attempts else None
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.state
+
+    def to_dict(self):
+        return {
+            'text': self.text,
+            'destination': self.destination,
+            'channel': self.channel,
+            'state': self.state,
+            'error': self.error,
+            'id': self.packet_id,
+            'retries': self.retries,
+            'implicitAck': self.implicit_ack,
+            'latency': self.latency,
+        }
+
+
+class DeliveryTracker:
+    def __init__(self, send_queue, registry=None, my_node_num=None, max_retries=MAX_RETRIES,
+                 backoff=BACKOFF_BASE, ack_timeout=ACK_TIMEOUT):
+        self.send_queue = send_queue
+        self.my_node_num = my_node_num
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.ack_timeout = ack_timeout
+        self.by_message = {}
+        self.awaiting = {}
+        self.timers = []
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.running = False
+        self.scheduler = None
+        self.counts = {ACKED: 0, FAILED: 0, SENT: 0}
+        self.retries = 0
+        self.broadcasts = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+        send_queue.on_state(self.on_message)
+        if registry is not None:
+            self.register(registry)
+
+    def register(self, registry):
+        """Receive ROUTING packets from a HandlerRegistry"""
+        registry.register(ROUTING, self.handle_routing)
+
+    def start(self):
+        if not self.scheduler:
+            self.running = True
+            self.scheduler = threading.Thread(target=self._run, name="delivery-tracker", daemon=True)
+            self.scheduler.start()
+        return self
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.scheduler:
+            self.scheduler.join(timeout=2)
+            self.scheduler = None
+
+    def send(self, text, destination=None, channel=0, priority=NORMAL, on_done=None, want_ack=None):
+        """Queue a message and track it until acked, failed or (broadcast) sent"""
+        delivery = Delivery(text, destination, channel, priority, self.max_retries, want_ack)
+        if on_done:
+            delivery.callbacks.append(on_done)
+        self._attempt(delivery)
+        return delivery
+
+    def _attempt(self, delivery):
+        message = self.send_queue.submit(delivery.text, delivery.destination, delivery.channel,
+                                         delivery.priority, want_ack=delivery.want_ack)
+        delivery.state = QUEUED
+        delivery.attempts.append(message)
+        with self.cond:
+            self.by_message.setdefault(id(message), []).append(delivery)
+
+    def _schedule(self, when, action, *args):
+        with self.cond:
+            heapq.heappush(self.timers, (when, next(self.counter), action, args))
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and (not self.timers or self.timers[0][0] > time.time()):
+                    self.cond.wait(self.timers[0][0] - time.time() if self.timers else None)
+                if not self.running:
+                    return
+                _, _, action, args = heapq.heappop(self.timers)
+            action(*args)
+
+    def on_message(self, message):
+        """SendQueue listener: a message was transmitted, acked or failed"""
+        with self.cond:
+            deliveries = list(self.by_message.get(id(message), ()))
+            if message.done.is_set():
+                self.by_message.pop(id(message), None)
+        for delivery in deliveries:
+            if message.state == SENT and not message.done.is_set():
+                if not message.want_ack:
+                    continue
+                if message.packet_id is None:
+                    # Nothing to match an ack against (e.g. daemon send timed out)
+                    self._complete(delivery, SENT, 'No packet id to track')
+                    continue
+                # Transmitted, now waiting for the ROUTING ack
+                delivery.state = SENT
+                with self.cond:
+                    self.awaiting[message.packet_id] = message
+                self._schedule(time.time() + self.ack_timeout, self._ack_timeout, message)
+            elif message.state == FAILED:
+                self._failed(delivery, message.error)
+            else:
+                self._complete(delivery, message.state)
+
+    def handle_routing(self, packet, decoded):
+        """ROUTING handler: match requestId to an outstanding packet"""
+        request_id = decoded.get('requestId')
+        with self.cond:
+            message = self.awaiting.get(request_id)
+        if message is None:
+            return
+
+        if self.my_node_num is None:
+            self.my_node_num = local_node_num(self.send_queue.interface)
+        reason = decoded.get('routing', {}).get('errorReason', 'NONE')
+        if reason != 'NONE':
+            self._resolve(message, FAILED, reason)
+        elif self.my_node_num is not None and packet.get('from') == self.my_node_num:
+            # Our own node heard a relay rebroadcast it: likely delivered, keep waiting
+            with self.cond:
+                for delivery in self.by_message.get(id(message), ()):
+                    delivery.implicit_ack = True
+        else:
+            self._resolve(message, ACKED)
+
+    def _resolve(self, message, state, error=None):
+        with self.cond:
+            if self.awaiting.get(message.packet_id) is not message:
+                return
+            del self.awaiting[message.packet_id]
+        self.send_queue.finish(message, state, error)
+
+    def _ack_timeout(self, message):
+        with self.cond:
+            if self.awaiting.get(message.packet_id) is not message:
+                return
+            implicit = any(d.implicit_ack for d in self.by_message.get(id(message), ()))
+        if implicit:
+            self._resolve(message, ACKED)
+        else:
+            self._resolve(message, FAILED, 'TIMEOUT')
+
+    def _failed(self, delivery, error):
+        if delivery.want_ack and delivery.retries < delivery.max_retries and self.running:
+            delay = min(self.backoff * 2 ** delivery.retries, BACKOFF_MAX)
+            delay *= random.uniform(0.8, 1.2)
+            self.retries += 1
+            delivery.error = error
+            self._schedule(time.time() + delay, self._attempt, delivery)
+            return
+        self._complete(delivery, FAILED, error)
+
+    def _complete(self, delivery, state, error=None):
+        if delivery.done.is_set():
+            return
+        delivery.state = state
+        delivery.error = error
+        delivery.done_at = time.time()
+        if state == SENT and not delivery.want_ack:
+            # Broadcasts never get an ack; SENT is their success state
+            self.broadcasts += 1
+        else:
+            self.counts[state] = self.counts.get(state, 0) + 1
+        if state == ACKED:
+            self.latencies.append(delivery.latency)
+        delivery.done.set()
+        for callback in delivery.callbacks:
+            try:
+                callback(delivery)
+            except Exception:
+                pass
+
+    def latency_percentiles(self):
+        values = sorted(self.latencies)
+        return {f"p{p}": percentile(values, p) for p in (50, 90, 95, 99)}
+
+    def stats(self):
+        with self.cond:
+            awaiting = len(self.awaiting)
+        return {
+            'acked': self.counts[ACKED],
+            'failed': self.counts[FAILED],
+            'unacknowledged': self.counts[SENT],
+            'broadcast': self.broadcasts,
+            'retries': self.retries,
+            'awaitingAck': awaiting,
+            'latency': self.latency_percentiles(),
+        }
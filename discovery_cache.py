@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Discovery Cache
+Remembers which endpoints last reached a Meshtastic device so tools can try
+the last-known-good link before falling back to a network scan
+"""
+
+import os
+import sys
+import json
+import time
+
+from mesh_daemon import STATE_DIR
+
+DEFAULT_PATH = os.environ.get('HELTEC_DISCOVERY_CACHE', os.path.join(STATE_DIR, 'discovery.json'))
+DEFAULT_TTL = 7 * 24 * 3600  # entries not confirmed for a week are dropped
+
+
+class DiscoveryCache:
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.load()
+
+    @staticmethod
+    def key(transport, endpoint):
+        return f"{transport}:{endpoint}"
+
+    def load(self):
+        """Read the cache file, silently starting empty if it is missing or corrupt"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.entries = {self.key(e['transport'], e['endpoint']): e
+                            for e in data.get('entries', [])}
+        except (OSError, ValueError, KeyError, TypeError):
+            self.entries = {}
+        self.evict()
+
+    def save(self):
+        """Write atomically so a crash never leaves a half-written file"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'entries': list(self.entries.values())}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def evict(self, now=None):
+        """Drop entries whose last success is older than the TTL"""
+        now = now or time.time()
+        expired = [k for k, e in self.entries.items()
+                   if now - e.get('last_success', 0) > self.ttl]
+        for key in expired:
+            del self.entries[key]
+        return len(expired)
+
+    def candidates(self, transport=None):
+        """Fresh entries, most recently successful first"""
+        self.evict()
+        entries = [e for e in self.entries.values()
+                   if transport is None or e['transport'] == transport]
+        return sorted(entries, key=lambda e: e.get('last_success', 0), reverse=True)
+
+    def record_success(self, transport, endpoint, node_id=None, latency=None, save=True):
+        entry = self.entries.get(self.key(transport, endpoint), {})
+        entry.update({
+            'transport': transport,
+            'endpoint': endpoint,
+            'node_id': node_id or entry.get('node_id'),
+            'last_success': time.time(),
+            'latency': latency,
+        })
+        self.entries[self.key(transport, endpoint)] = entry
+        if save:
+            self.save()
+
+    def record_failure(self, transport, endpoint):
+        """Forget an endpoint that no longer answers"""
+        if self.entries.pop(self.key(transport, endpoint), None) is not None:
+            self.save()
+
+    def clear(self):
+        self.entries = {}
+        self.save()
+
+
+def main():
+    cache = DiscoveryCache()
+    if len(sys.argv) > 1 and sys.argv[1] == '--clear':
+        cache.clear()
+        print("🧹 Discovery cache cleared")
+        return 0
+
+    entries = cache.candidates()
+    if not entries:
+        print("📭 Discovery cache is empty")
+        return 0
+
+    print(f"📋 Known endpoints ({cache.path}):")
+    for e in entries:
+        age = int(time.time() - e['last_success'])
+        latency = f"{e['latency'] * 1000:.0f} ms" if e.get('latency') else "n/a"
+        print(f"  {e['transport']:6} {e['endpoint']:28} node={e.get('node_id') or '?'} "
+              f"latency={latency} age={age}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
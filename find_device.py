@@ -5,17 +5,21 @@ Helps find your Meshtastic device on the network and access its web interface
 """
 
 import socket
-import requests
-import ipaddress
-import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
+import argparse
+import ipaddress
+
+import network_scanner
+from discovery_cache import DiscoveryCache
+from mesh_json import JsonOutput
+
+# Replaced in main() when --json is given
+output = JsonOutput()
 
 def get_local_network():
     """Get the local network range"""
     try:
-        hostname = socket.gethostname()
-        local_ip = socket.gethostbyname(hostname)
+        local_ip = network_scanner.local_addresses()[0]
         network = ipaddress.IPv4Network(f"{local_ip}/24", strict=False)
         return network, local_ip
     except Exception as e:
@@ -24,78 +28,42 @@ def get_local_network():
 
 def check_meshtastic_device(ip):
     """Check if IP has Meshtastic services"""
-    results = {}
-    
-    # Check TCP port 4403 (Meshtastic API)
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(1)
-        if sock.connect_ex((str(ip), 4403)) == 0:
-            results['api'] = True
-        sock.close()
-    except:
-        results['api'] = False
-    
-    # Check HTTP port 80 (Web interface)
-    try:
-        response = requests.get(f"http://{ip}", timeout=2)
-        if 'meshtastic' in response.text.lower() or response.status_code == 200:
-            results['web'] = True
-            results['web_content'] = response.text[:200]
-    except:
-        results['web'] = False
-    
-    # Check HTTPS port 443
-    try:
-        response = requests.get(f"https://{ip}", timeout=2, verify=False)
-        if 'meshtastic' in response.text.lower() or response.status_code == 200:
-            results['https'] = True
-    except:
-        results['https'] = False
-    
-    return results if any(results.values()) else None
+    return network_scanner.check_host_sync(ip)
 
-def scan_for_devices():
+def report_device(result):
+    """Print one scan result as soon as it arrives"""
+    ip = result['ip']
+    output.emit('device', **result)
+    print(f"🎯 Found device at {ip}")
+    if result.get('web'):
+        print(f"   🌐 Web interface: http://{ip}")
+    if result.get('https'):
+        print(f"   🔒 HTTPS interface: https://{ip}")
+    if result.get('api'):
+        print("   📡 API port 4403 open")
+
+def scan_for_devices(prefix=24):
     """Scan local network for Meshtastic devices"""
     print("🔍 Scanning for Meshtastic devices on local network...")
     
-    network, local_ip = get_local_network()
-    if not network:
+    networks = network_scanner.local_networks(prefix)
+    if not networks:
+        print("❌ Cannot determine local network")
         return []
     
-    print(f"📡 Scanning network: {network} (your IP: {local_ip})")
-    
-    found_devices = []
+    print(f"📡 Scanning network: {', '.join(str(n) for n in networks)}")
     
-    def worker(ip):
-        try:
-            result = check_meshtastic_device(ip)
-            if result:
-                found_devices.append((str(ip), result))
-                print(f"🎯 Found device at {ip}")
-                if result.get('web'):
-                    print(f"   🌐 Web interface: http://{ip}")
-                if result.get('https'):
-                    print(f"   🔒 HTTPS interface: https://{ip}")
-                if result.get('api'):
-                    print(f"   📡 API port 4403 open")
-        except Exception as e:
-            pass
-    
-    # Scan with thread pool for speed
-    with ThreadPoolExecutor(max_workers=50) as executor:
-        # Scan first 100 IPs in the network
-        ips_to_scan = list(network.hosts())[:100]
-        executor.map(worker, ips_to_scan)
-    
-    return found_devices
+    # Every host on every interface, probed concurrently
+    found = network_scanner.scan_networks(networks, on_result=report_device)
+    return [(result['ip'], result) for result in found]
 
 def check_specific_ip(ip):
-    """Check a specific IP for Meshtastic services"""
+    """Check a specific IP for Meshtastic services, returns the services found or None"""
     print(f"🔍 Checking {ip} for Meshtastic services...")
     
     result = check_meshtastic_device(ip)
     if result:
+        output.emit('device', **result)
         print(f"✅ Meshtastic device found at {ip}!")
         
         if result.get('web'):
@@ -109,19 +77,21 @@ def check_specific_ip(ip):
             print(f"📡 API available at: {ip}:4403")
             print("   You can connect Python scripts to this endpoint")
             
-        return True
+        return result
     else:
         print(f"❌ No Meshtastic services found at {ip}")
-        return False
+        return None
 
 def check_connectivity():
     """Check basic connectivity"""
     print("🌐 Checking network connectivity...")
     
     # Check internet
+    internet = False
     try:
         socket.create_connection(("8.8.8.8", 53), timeout=3)
         print("✅ Internet connectivity: OK")
+        internet = True
     except:
         print("❌ No internet connectivity")
     
@@ -132,8 +102,17 @@ def check_connectivity():
         print(f"✅ Your IP: {local_ip}")
     else:
         print("❌ Cannot determine local network")
+    output.emit('connectivity', internet=internet,
+                network=str(network) if network else None, localIp=local_ip)
 
 def main():
+    global output
+    parser = argparse.ArgumentParser(description="Find Meshtastic devices on the local network")
+    parser.add_argument('--json', action='store_true',
+                        help="Emit NDJSON events (connectivity, device, done) on stdout")
+    args = parser.parse_args()
+    output = JsonOutput(args.json)
+    
     print("🚀 Heltec V2 Network Scanner")
     print("=" * 40)
     
@@ -141,18 +120,44 @@ def main():
     check_connectivity()
     print()
     
+    cache = DiscoveryCache()
+    found_by_hostname = False
+    devices = []
+    
+    # Last-known-good addresses first, they usually still answer
+    for entry in cache.candidates('tcp'):
+        ip = entry['endpoint']
+        print(f"💾 Trying cached address {ip}...")
+        started = time.time()
+        services = check_specific_ip(ip)
+        # Only the API port makes a usable tcp endpoint; a web-only answer does not
+        if services and services.get('api'):
+            cache.record_success('tcp', ip, node_id=entry.get('node_id'),
+                                 latency=time.time() - started)
+        else:
+            cache.record_failure('tcp', ip)
+        if services:
+            found_by_hostname = True
+            break
+    
     # Try common Meshtastic hostnames
     common_names = ["meshtastic.local", "meshtastic", "heltec.local"]
-    print("🔍 Trying common hostnames...")
+    if not found_by_hostname:
+        print("🔍 Trying common hostnames...")
     
-    found_by_hostname = False
     for hostname in common_names:
+        if found_by_hostname:
+            break
         try:
             ip = socket.gethostbyname(hostname)
             print(f"📍 Resolved {hostname} to {ip}")
-            if check_specific_ip(ip):
+            started = time.time()
+            services = check_specific_ip(ip)
+            if services:
+                if services.get('api'):
+                    cache.record_success('tcp', ip, latency=time.time() - started)
                 found_by_hostname = True
-                break
+                output.emit('resolved', hostname=hostname, ip=ip)
         except:
             print(f"❌ Cannot resolve {hostname}")
     
@@ -160,6 +165,12 @@ def main():
         print("\n🔍 Hostname lookup failed, scanning network...")
         devices = scan_for_devices()
         
+        api_hosts = [ip for ip, services in devices if services.get('api')]
+        for ip in api_hosts:
+            cache.record_success('tcp', ip, save=False)
+        if api_hosts:
+            cache.save()
+        
         if devices:
             print(f"\n✅ Found {len(devices)} Meshtastic device(s)!")
             for ip, services in devices:
@@ -176,6 +187,9 @@ def main():
             print("   - WiFi credentials incorrect")
             print("   - Device still booting up")
     
+    output.emit('done', found=found_by_hostname or bool(devices),
+                devices=[ip for ip, _ in devices])
+    
     print("\n💡 Manual check:")
     print("   1. Connect via serial: python3 meshtastic_comm.py")
     print("   2. Check device IP in serial output")
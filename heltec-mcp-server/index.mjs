@@ -20,6 +20,7 @@ import {
 import { spawn, exec } from 'child_process';
 import { promises as fs } from 'fs';
 import path from 'path';
+import readline from 'readline';
 import { fileURLToPath } from 'url';
 import util from 'util';
 
@@ -31,7 +32,7 @@ const execAsync = util.promisify(exec);
 /**
  * Execute Python script in the project's virtual environment
  */
-async function executePythonScript(scriptName, args = [], timeout = 10000) {
+async function executePythonScript(scriptName, args = [], timeout = 10000, input = null, signal = null) {
   const pythonPath = path.join(projectRoot, '.venv', 'bin', 'python');
   const scriptPath = path.join(projectRoot, scriptName);
   
@@ -48,6 +49,11 @@ async function executePythonScript(scriptName, args = [], timeout = 10000) {
       timeout: timeout
     });
     
+    if (input !== null) {
+      child.stdin.end(input);
+    }
+    signal?.addEventListener('abort', () => child.kill(), { once: true });
+    
     let stdout = '';
     let stderr = '';
     
@@ -63,7 +69,7 @@ async function executePythonScript(scriptName, args = [], timeout = 10000) {
       if (code === 0) {
         resolve({ stdout, stderr, code });
       } else {
-        reject(new Error(`Process exited with code ${code}: ${stderr}`));
+        reject(Object.assign(new Error(`Process exited with code ${code}: ${stderr}`), { stdout }));
       }
     });
     
@@ -80,52 +86,310 @@ async function executePythonScript(scriptName, args = [], timeout = 10000) {
 }
 
 /**
- * Parse device status from Python script output
+ * Error raised when the Python worker cannot serve a call at all
+ * (failed to start or died); callers fall back to one-shot scripts
  */
-function parseDeviceStatus(output) {
-  const lines = output.split('\\n');
-  const status = {
-    connected: false,
-    nodeId: null,
-    nodeName: null,
-    battery: null,
-    voltage: null,
-    meshNodes: 0,
-    wifiConfigured: false
-  };
-  
-  for (const line of lines) {
-    if (line.includes('Connected successfully') || line.includes('✅ Connected!')) {
-      status.connected = true;
+class WorkerUnavailableError extends Error {}
+
+/**
+ * Persistent Python worker (mcp_worker.py) holding the open device interface.
+ * Requests and replies are JSON-RPC 2.0, one JSON object per line.
+ */
+class PythonWorker {
+  constructor(scriptName = 'mcp_worker.py') {
+    this.scriptName = scriptName;
+    this.child = null;
+    this.ready = null;
+    this.nextId = 1;
+    this.pending = new Map();
+  }
+
+  start() {
+    if (this.ready) {
+      return this.ready;
     }
-    
-    const nodeMatch = line.match(/📛 Node: (.+?) \\((.+?)\\)/);
-    if (nodeMatch) {
-      status.nodeName = nodeMatch[1];
-      status.nodeId = nodeMatch[2];
+
+    const pythonPath = path.join(projectRoot, '.venv', 'bin', 'python');
+    const scriptPath = path.join(projectRoot, this.scriptName);
+
+    this.ready = new Promise((resolve, reject) => {
+      const child = spawn(pythonPath, [scriptPath], {
+        cwd: projectRoot,
+        stdio: ['pipe', 'pipe', 'pipe']
+      });
+      this.child = child;
+
+      const lines = readline.createInterface({ input: child.stdout });
+      lines.on('line', (line) => {
+        let message;
+        try {
+          message = JSON.parse(line);
+        } catch {
+          return;
+        }
+        if (message.method === 'ready') {
+          resolve();
+          return;
+        }
+        this.settle(message);
+      });
+
+      // Worker logs go to stderr; surface them in the server log
+      child.stderr.on('data', (data) => {
+        process.stderr.write(`[worker] ${data}`);
+      });
+
+      child.on('error', (error) => {
+        this.reset(new WorkerUnavailableError(`Python worker failed to start: ${error.message}`));
+        reject(new WorkerUnavailableError(error.message));
+      });
+
+      child.on('exit', (code) => {
+        this.reset(new WorkerUnavailableError(`Python worker exited with code ${code}`));
+        reject(new WorkerUnavailableError(`Python worker exited with code ${code}`));
+      });
+    });
+
+    return this.ready;
+  }
+
+  settle(message) {
+    const entry = this.pending.get(message.id);
+    if (!entry) {
+      return;
     }
-    
-    const batteryMatch = line.match(/🔋 Battery: (\\d+)%/);
-    if (batteryMatch) {
-      status.battery = parseInt(batteryMatch[1]);
+    this.pending.delete(message.id);
+    clearTimeout(entry.timer);
+    if (message.error) {
+      entry.reject(new Error(message.error.message));
+    } else {
+      entry.resolve(message.result);
     }
-    
-    const voltageMatch = line.match(/⚡ Voltage: ([\\d.]+)V/);
-    if (voltageMatch) {
-      status.voltage = parseFloat(voltageMatch[1]);
+  }
+
+  reset(error) {
+    for (const entry of this.pending.values()) {
+      clearTimeout(entry.timer);
+      entry.reject(error);
     }
-    
-    const meshMatch = line.match(/🌐 Mesh nodes: (\\d+)/);
-    if (meshMatch) {
-      status.meshNodes = parseInt(meshMatch[1]);
+    this.pending.clear();
+    this.child = null;
+    this.ready = null;
+  }
+
+  async call(method, params = {}, timeout = 30000, signal = null) {
+    await this.start();
+
+    const id = this.nextId++;
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        reject(new Error(`Worker call ${method} timed out after ${timeout}ms`));
+      }, timeout);
+
+      if (!this.child) {
+        clearTimeout(timer);
+        reject(new WorkerUnavailableError('Python worker is not running'));
+        return;
+      }
+      // A cancelled call stops waiting; its late reply is dropped in settle()
+      signal?.addEventListener('abort', () => {
+        if (this.pending.delete(id)) {
+          clearTimeout(timer);
+          reject(signal.reason);
+        }
+      }, { once: true });
+      this.pending.set(id, { resolve, reject, timer });
+      this.child.stdin.write(JSON.stringify({ jsonrpc: '2.0', id, method, params }) + '\n');
+    });
+  }
+
+  stop() {
+    if (this.child) {
+      this.child.stdin.end();
+      this.child = null;
     }
-    
-    if (line.includes('✅ WiFi configuration found')) {
-      status.wifiConfigured = true;
+  }
+}
+
+const worker = new PythonWorker();
+
+// Longest single long-poll against the worker's packet ring
+const MONITOR_POLL_SECONDS = 5;
+
+/**
+ * Call the persistent worker, falling back to the one-shot path when the
+ * worker itself is unavailable (device errors are reported, not retried)
+ */
+async function callWorker(method, params, timeout, fallback, signal = null) {
+  try {
+    return await worker.call(method, params, timeout, signal);
+  } catch (error) {
+    if (error instanceof WorkerUnavailableError && fallback) {
+      console.error(`⚠️  ${error.message}, falling back to script`);
+      return fallback();
     }
+    throw error;
   }
-  
-  return status;
+}
+
+/**
+ * Request scheduler. Work that owns the serial port (sends, one-shot script
+ * fallbacks, flashing) runs one at a time on a single device lane; read-only
+ * queries answered from the worker's snapshot run concurrently. Every tool
+ * call gets a timeout and can be cancelled by the client.
+ */
+class Scheduler {
+  constructor() {
+    this.lane = Promise.resolve();
+    this.queued = 0;
+  }
+
+  /**
+   * Run task(signal) until it finishes, times out or the client cancels
+   */
+  async run(name, timeout, task, parentSignal = null) {
+    const controller = new AbortController();
+    const cancel = () => controller.abort(new McpError(ErrorCode.InvalidRequest, `${name} was cancelled`));
+    const timer = setTimeout(() => {
+      controller.abort(new McpError(ErrorCode.InternalError, `${name} timed out after ${timeout}ms`));
+    }, timeout);
+    parentSignal?.addEventListener('abort', cancel, { once: true });
+
+    const aborted = new Promise((_, reject) => {
+      controller.signal.addEventListener('abort', () => reject(controller.signal.reason), { once: true });
+    });
+    try {
+      return await Promise.race([task(controller.signal), aborted]);
+    } finally {
+      clearTimeout(timer);
+      parentSignal?.removeEventListener('abort', cancel);
+    }
+  }
+
+  /**
+   * Queue device-owning work on the lane; a call cancelled while waiting
+   * never touches the device
+   */
+  device(task, signal = null) {
+    this.queued++;
+    const result = this.lane.then(() => {
+      this.queued--;
+      signal?.throwIfAborted();
+      return task();
+    });
+    this.lane = result.catch(() => {});
+    return result;
+  }
+}
+
+const scheduler = new Scheduler();
+
+// Per-tool time limits (monitor_mesh_messages scales with its duration)
+const TOOL_TIMEOUTS = {
+  check_device_status: 30000,
+  send_mesh_message: 60000,
+  scan_mesh_network: 30000,
+  scan_wifi_network: 90000,
+  get_device_config: 30000,
+  build_and_flash_firmware: 600000,
+  get_signal_quality: 30000
+};
+
+function toolTimeout(name, args) {
+  if (name === 'monitor_mesh_messages') {
+    return ((args.duration_seconds ?? 30) + 30) * 1000;
+  }
+  return TOOL_TIMEOUTS[name] ?? 30000;
+}
+
+/**
+ * Parse the status document printed by `test_device.py --json`
+ */
+function parseDeviceStatus(output) {
+  return JSON.parse(output);
+}
+
+/**
+ * Parse an NDJSON event stream (`--json` mode of the CLI scripts)
+ */
+function parseEvents(output) {
+  return output
+    .split('\n')
+    .filter((line) => line.trim())
+    .map((line) => JSON.parse(line));
+}
+
+/**
+ * One-shot call (`mcp_worker.py --once`) used when the worker is unavailable.
+ * Params go over stdin, so concurrent calls share no files and nothing is
+ * generated or compiled per call
+ */
+async function runOnce(method, params = {}, timeout = 30000, signal = null) {
+  let stdout;
+  try {
+    ({ stdout } = await executePythonScript('mcp_worker.py', ['--once', method], timeout,
+      JSON.stringify(params), signal));
+  } catch (error) {
+    // Exit code 1 still carries the JSON-RPC error on stdout
+    stdout = error.stdout;
+    if (!stdout) {
+      throw error;
+    }
+  }
+  const reply = JSON.parse(stdout);
+  if (reply.error) {
+    throw new Error(reply.error.message);
+  }
+  return reply.result;
+}
+
+/**
+ * Stream monitor results from the worker's packet ring: long-poll pages until
+ * the duration ends or maxPackets is reached, reporting each page as an MCP
+ * progress notification when the client asked for progress
+ */
+async function streamMonitor({ duration_seconds, cursor, max_packets, filters, progressToken, signal }) {
+  const started = Date.now();
+  const deadline = started + duration_seconds * 1000;
+  const packets = [];
+  let missed = 0;
+  let next = cursor ?? null;
+
+  while (packets.length < max_packets) {
+    const wait = Math.min(MONITOR_POLL_SECONDS, (deadline - Date.now()) / 1000);
+    if (wait <= 0) {
+      break;
+    }
+    const page = await worker.call('monitor', {
+      ...filters,
+      cursor: next,
+      wait,
+      limit: max_packets - packets.length
+    }, (wait + 10) * 1000, signal);
+    next = page.cursor;
+    missed += page.missed;
+    if (!page.count) {
+      continue;
+    }
+    packets.push(...page.packets);
+
+    if (progressToken !== undefined) {
+      await server.notification({
+        method: 'notifications/progress',
+        params: {
+          progressToken,
+          progress: Math.min((Date.now() - started) / 1000, duration_seconds),
+          total: duration_seconds,
+          message: `${packets.length} packet(s) so far`,
+          cursor: next,
+          packets: page.packets
+        }
+      });
+    }
+  }
+
+  return { cursor: next, missed, count: packets.length, truncated: packets.length >= max_packets, packets };
 }
 
 /**
@@ -154,7 +418,14 @@ server.setRequestHandler(ListToolsRequestSchema, async () => {
         description: 'Check the status and health of the connected Heltec V2 Meshtastic device',
         inputSchema: {
           type: 'object',
-          properties: {},
+          properties: {
+            max_age: {
+              type: 'number',
+              description: 'Accept a cached snapshot up to this many seconds old (0 = read the device now)',
+              default: 300,
+              minimum: 0
+            }
+          },
           required: []
         }
       },
@@ -231,7 +502,7 @@ server.setRequestHandler(ListToolsRequestSchema, async () => {
       },
       {
         name: 'monitor_mesh_messages',
-        description: 'Start monitoring incoming mesh messages for a specified duration',
+        description: 'Monitor incoming mesh packets for a specified duration. Results stream as progress notifications; pass the returned cursor to continue where the last call stopped',
         inputSchema: {
           type: 'object',
           properties: {
@@ -241,6 +512,26 @@ server.setRequestHandler(ListToolsRequestSchema, async () => {
               default: 30,
               minimum: 5,
               maximum: 300
+            },
+            from_node: {
+              type: 'string',
+              description: 'Only packets from this node ID (e.g. !a1b2c3d4)'
+            },
+            portnum: {
+              type: 'string',
+              description: 'Only packets of this type (e.g. TEXT_MESSAGE_APP, POSITION_APP, TELEMETRY_APP)',
+              default: 'TEXT_MESSAGE_APP'
+            },
+            cursor: {
+              type: 'number',
+              description: 'Resume after this cursor from a previous call (0 = everything still buffered)'
+            },
+            max_packets: {
+              type: 'number',
+              description: 'Stop early once this many packets were collected',
+              default: 200,
+              minimum: 1,
+              maximum: 1000
             }
           },
           required: []
@@ -248,10 +539,21 @@ server.setRequestHandler(ListToolsRequestSchema, async () => {
       },
       {
         name: 'get_signal_quality',
-        description: 'Get current signal quality, RSSI, and network performance metrics',
+        description: 'Get per-node RSSI/SNR percentiles, trend and link-budget margins from received packets, plus device metrics',
         inputSchema: {
           type: 'object',
-          properties: {},
+          properties: {
+            max_age: {
+              type: 'number',
+              description: 'Accept a cached snapshot up to this many seconds old (0 = read the device now)',
+              default: 300,
+              minimum: 0
+            },
+            node: {
+              type: 'string',
+              description: 'Only this node (ID like !a1b2c3d4 or short name)'
+            }
+          },
           required: []
         }
       }
@@ -262,268 +564,284 @@ server.setRequestHandler(ListToolsRequestSchema, async () => {
 /**
  * Handle tool execution requests
  */
-server.setRequestHandler(CallToolRequestSchema, async (request) => {
-  const { name, arguments: args } = request.params;
+server.setRequestHandler(CallToolRequestSchema, async (request, extra) => {
+  const { name, arguments: args = {} } = request.params;
   
   try {
-    switch (name) {
-      case 'check_device_status': {
-        const result = await executePythonScript('test_device.py');
-        const status = parseDeviceStatus(result.stdout);
-        
-        return {
-          content: [
-            {
-              type: 'text',
-              text: JSON.stringify({
-                tool: 'check_device_status',
-                status: 'success',
-                data: status,
-                summary: `Device ${status.connected ? 'connected' : 'disconnected'}. ${
-                  status.connected ? 
-                    `Node ${status.nodeName} (${status.nodeId}) with ${status.meshNodes} mesh nodes, ${status.battery}% battery` :
-                    'Device not responding'
-                }`
-              }, null, 2)
-            }
-          ]
-        };
-      }
-      
-      case 'send_mesh_message': {
-        const { message, destination } = args;
-        
-        if (!message || typeof message !== 'string') {
-          throw new McpError(ErrorCode.InvalidParams, 'Message text is required');
+    return await scheduler.run(name, toolTimeout(name, args),
+      (signal) => callTool(name, args, request, signal), extra?.signal);
+  } catch (error) {
+    return {
+      content: [
+        {
+          type: 'text',
+          text: JSON.stringify({
+            tool: name,
+            status: 'error',
+            error: error.message,
+            details: error.stack
+          }, null, 2)
         }
-        
-        // Create a temporary script to send message
-        const sendScript = `
-import sys
-import meshtastic
-import meshtastic.serial_interface
-
-try:
-    interface = meshtastic.serial_interface.SerialInterface("/dev/cu.usbserial-0001")
-    interface.sendText("${message.replace(/"/g, '\\"')}", destinationId=${destination ? `"${destination}"` : 'None'})
-    print("✅ Message sent successfully")
-    interface.close()
-except Exception as e:
-    print(f"❌ Failed to send message: {e}")
-    sys.exit(1)
-        `;
-        
-        await fs.writeFile(path.join(projectRoot, 'temp_send.py'), sendScript);
-        const result = await executePythonScript('temp_send.py');
-        await fs.unlink(path.join(projectRoot, 'temp_send.py')); // cleanup
-        
-        return {
-          content: [
-            {
-              type: 'text',
-              text: JSON.stringify({
-                tool: 'send_mesh_message',
-                status: 'success',
-                message: message,
-                destination: destination || 'broadcast',
-                result: result.stdout.trim()
-              }, null, 2)
-            }
-          ]
-        };
-      }
+      ],
+      isError: true
+    };
+  }
+});
+
+/**
+ * Run one tool call; `signal` aborts on timeout or client cancellation
+ */
+async function callTool(name, args, request, signal) {
+  switch (name) {
+    case 'check_device_status': {
+      const { max_age = 300 } = args;
+      const status = await callWorker('status', { max_age }, 30000, () => scheduler.device(async () => {
+        const result = await executePythonScript('test_device.py', ['--json', '--no-send-test'], 30000, null, signal);
+        return parseDeviceStatus(result.stdout);
+      }, signal), signal);
       
-      case 'scan_mesh_network': {
-        // Use existing test script and parse network info
-        const result = await executePythonScript('test_device.py');
-        const meshData = parseDeviceStatus(result.stdout);
-        
-        return {
-          content: [
-            {
-              type: 'text',
-              text: JSON.stringify({
-                tool: 'scan_mesh_network',
-                status: 'success',
-                totalNodes: meshData.meshNodes,
-                networkHealth: meshData.meshNodes > 0 ? 'healthy' : 'isolated',
-                details: args.detailed ? result.stdout : 'Use detailed:true for full output'
-              }, null, 2)
-            }
-          ]
-        };
+      return {
+        content: [
+          {
+            type: 'text',
+            text: JSON.stringify({
+              tool: 'check_device_status',
+              status: 'success',
+              data: status,
+              summary: `Device ${status.connected ? 'connected' : 'disconnected'}. ${
+                status.connected ? 
+                  `Node ${status.nodeName} (${status.nodeId}) with ${status.meshNodes} mesh nodes, ${status.battery}% battery` :
+                  'Device not responding'
+              }`
+            }, null, 2)
+          }
+        ]
+      };
+    }
+    
+    case 'send_mesh_message': {
+      const { message, destination } = args;
+      
+      if (!message || typeof message !== 'string') {
+        throw new McpError(ErrorCode.InvalidParams, 'Message text is required');
       }
       
-      case 'scan_wifi_network': {
-        const result = await executePythonScript('find_device.py');
-        
-        return {
-          content: [
-            {
-              type: 'text',
-              text: JSON.stringify({
-                tool: 'scan_wifi_network',
-                status: 'success',
-                result: result.stdout,
-                summary: 'WiFi network scan completed - check result for discovered devices'
-              }, null, 2)
-            }
-          ]
-        };
+      // Sends share one lane so parallel calls reach the radio in order
+      const result = await scheduler.device(() => callWorker('send', { text: message, destination }, 40000,
+        () => runOnce('send', { text: message, destination }, 40000, signal), signal), signal);
+      
+      return {
+        content: [
+          {
+            type: 'text',
+            text: JSON.stringify({
+              tool: 'send_mesh_message',
+              status: 'success',
+              message: message,
+              destination: destination || 'broadcast',
+              result: result
+            }, null, 2)
+          }
+        ]
+      };
+    }
+    
+    case 'scan_mesh_network': {
+      const nodes = await callWorker('nodes', {}, 30000, () => scheduler.device(async () => {
+        const result = await executePythonScript('test_device.py', ['--json', '--no-send-test'], 30000, null, signal);
+        const status = parseDeviceStatus(result.stdout);
+        return { count: status.meshNodes, output: status };
+      }, signal), signal);
+      const totalNodes = Array.isArray(nodes) ? nodes.length : nodes.count;
+      
+      return {
+        content: [
+          {
+            type: 'text',
+            text: JSON.stringify({
+              tool: 'scan_mesh_network',
+              status: 'success',
+              totalNodes: totalNodes,
+              networkHealth: totalNodes > 0 ? 'healthy' : 'isolated',
+              details: args.detailed ? (Array.isArray(nodes) ? nodes : nodes.output) : 'Use detailed:true for full output'
+            }, null, 2)
+          }
+        ]
+      };
+    }
+    
+    case 'scan_wifi_network': {
+      // Network only, no serial port: runs alongside everything else
+      const result = await callWorker('scan_wifi', {}, 60000, async () => {
+        const result = await executePythonScript('find_device.py', ['--json'], 60000, null, signal);
+        return parseEvents(result.stdout).filter((event) => event.event === 'device');
+      }, signal);
+      
+      return {
+        content: [
+          {
+            type: 'text',
+            text: JSON.stringify({
+              tool: 'scan_wifi_network',
+              status: 'success',
+              devices: result,
+              summary: `WiFi network scan completed - ${result.length} Meshtastic device(s) found`
+            }, null, 2)
+          }
+        ]
+      };
+    }
+    
+    case 'get_device_config': {
+      const config = await worker.call('config', {}, 30000, signal);
+      
+      return {
+        content: [
+          {
+            type: 'text',
+            text: JSON.stringify({
+              tool: 'get_device_config',
+              status: 'success',
+              data: config
+            }, null, 2)
+          }
+        ]
+      };
+    }
+    
+    case 'build_and_flash_firmware': {
+      const { environment = 'heltec-v2_1', clean_build = false } = args;
+      const pythonPath = path.join(projectRoot, '.venv', 'bin', 'python');
+      
+      let commands = [];
+      if (clean_build) {
+        commands.push(`${pythonPath} -m platformio run -e ${environment} --target clean`);
       }
+      commands.push(`${pythonPath} -m platformio run -e ${environment} --target upload`);
       
-      case 'build_and_flash_firmware': {
-        const { environment = 'heltec-v2_1', clean_build = false } = args;
-        const pythonPath = path.join(projectRoot, '.venv', 'bin', 'python');
-        
-        let commands = [];
-        if (clean_build) {
-          commands.push(`${pythonPath} -m platformio run -e ${environment} --target clean`);
+      // Upload needs the serial port: take the lane and make the worker (and a
+      // mesh daemon, if one holds the device) let go of it before flashing
+      const results = await scheduler.device(async () => {
+        try {
+          await callWorker('release', {}, 10000, () => runOnce('release', {}, 10000, signal), signal);
+        } catch (error) {
+          throw new Error(`Serial port is still in use, not flashing: ${error.message}`);
         }
-        commands.push(`${pythonPath} -m platformio run -e ${environment} --target upload`);
-        
-        const results = [];
-        for (const command of commands) {
-          const result = await execAsync(command, { cwd: projectRoot, timeout: 300000 }); // 5 min timeout
-          results.push(result);
+        try {
+          const results = [];
+          for (const command of commands) {
+            const result = await execAsync(command, { cwd: projectRoot, timeout: 300000, signal }); // 5 min timeout
+            results.push(result);
+          }
+          return results;
+        } finally {
+          await callWorker('reclaim', {}, 10000, () => runOnce('reclaim', {}, 10000)).catch(() => {});
         }
-        
-        return {
-          content: [
-            {
-              type: 'text',
-              text: JSON.stringify({
-                tool: 'build_and_flash_firmware',
-                status: 'success',
-                environment: environment,
-                clean_build: clean_build,
-                summary: 'Firmware built and flashed successfully',
-                details: results.map(r => r.stdout).join('\\n---\\n')
-              }, null, 2)
-            }
-          ]
-        };
-      }
+      }, signal);
       
-      case 'monitor_mesh_messages': {
-        const { duration_seconds = 30 } = args;
-        
-        // Create monitoring script
-        const monitorScript = `
-import sys
-import time
-import signal
-import meshtastic
-import meshtastic.serial_interface
-from datetime import datetime
-
-messages = []
-running = True
-
-def signal_handler(sig, frame):
-    global running
-    running = False
-
-signal.signal(signal.SIGINT, signal_handler)
-
-try:
-    interface = meshtastic.serial_interface.SerialInterface("/dev/cu.usbserial-0001")
-    print(f"📡 Monitoring mesh messages for {duration_seconds} seconds...")
-    
-    def on_receive(packet, interface_obj):
-        try:
-            decoded = packet.get('decoded', {})
-            if decoded.get('text'):
-                timestamp = datetime.now().strftime('%H:%M:%S')
-                from_id = packet.get('fromId', 'Unknown')
-                text = decoded['text']
-                message = f"[{timestamp}] {from_id}: {text}"
-                print(f"📥 {message}")
-                messages.append(message)
-        except:
-            pass
-    
-    # Monitor for specified duration
-    start_time = time.time()
-    while running and (time.time() - start_time) < ${duration_seconds}:
-        time.sleep(0.1)
+      return {
+        content: [
+          {
+            type: 'text',
+            text: JSON.stringify({
+              tool: 'build_and_flash_firmware',
+              status: 'success',
+              environment: environment,
+              clean_build: clean_build,
+              summary: 'Firmware built and flashed successfully',
+              details: results.map(r => r.stdout).join('\\n---\\n')
+            }, null, 2)
+          }
+        ]
+      };
+    }
     
-    interface.close()
-    print(f"✅ Monitoring complete. Received {len(messages)} messages")
-    for msg in messages:
-        print(msg)
-        
-except Exception as e:
-    print(f"❌ Monitoring failed: {e}")
-    sys.exit(1)
-        `;
-        
-        await fs.writeFile(path.join(projectRoot, 'temp_monitor.py'), monitorScript);
-        const result = await executePythonScript('temp_monitor.py', [], (duration_seconds + 10) * 1000);
-        await fs.unlink(path.join(projectRoot, 'temp_monitor.py')); // cleanup
-        
-        return {
-          content: [
-            {
-              type: 'text',
-              text: JSON.stringify({
-                tool: 'monitor_mesh_messages',
-                status: 'success',
-                duration_seconds: duration_seconds,
-                output: result.stdout,
-                summary: `Monitored mesh network for ${duration_seconds} seconds`
-              }, null, 2)
-            }
-          ]
-        };
+    case 'monitor_mesh_messages': {
+      const { duration_seconds = 30, from_node, portnum = 'TEXT_MESSAGE_APP', cursor, max_packets = 200 } = args;
+      const filters = {
+        from_ids: from_node ? [from_node] : null,
+        portnums: portnum ? [portnum] : null
+      };
+      
+      let result;
+      try {
+        result = await streamMonitor({
+          duration_seconds,
+          cursor,
+          max_packets,
+          filters,
+          progressToken: request.params._meta?.progressToken,
+          signal
+        });
+      } catch (error) {
+        if (!(error instanceof WorkerUnavailableError)) {
+          throw error;
+        }
+        console.error(`⚠️  ${error.message}, falling back to script`);
+        result = await scheduler.device(() => runOnce('watch', { duration_seconds, limit: max_packets, ...filters },
+          (duration_seconds + 30) * 1000, signal), signal);
       }
       
-      case 'get_signal_quality': {
-        const result = await executePythonScript('test_device.py');
+      return {
+        content: [
+          {
+            type: 'text',
+            text: JSON.stringify({
+              tool: 'monitor_mesh_messages',
+              status: 'success',
+              duration_seconds: duration_seconds,
+              output: result,
+              summary: `Monitored mesh network for ${duration_seconds} seconds`
+            }, null, 2)
+          }
+        ]
+      };
+    }
+    
+    case 'get_signal_quality': {
+      const { max_age = 300, node } = args;
+      const quality = await callWorker('signal', { max_age, node }, 30000, () => scheduler.device(async () => {
+        const result = await executePythonScript('test_device.py', ['--json', '--no-send-test'], 30000, null, signal);
         const status = parseDeviceStatus(result.stdout);
-        
+        return { voltage: status.voltage, batteryLevel: status.battery, meshNodes: status.meshNodes };
+      }, signal), signal);
+      
+      if (node) {
         return {
           content: [
             {
               type: 'text',
-              text: JSON.stringify({
-                tool: 'get_signal_quality',
-                status: 'success',
-                data: {
-                  voltage: status.voltage,
-                  batteryLevel: status.battery,
-                  meshNodes: status.meshNodes,
-                  networkHealth: status.meshNodes > 3 ? 'excellent' : 
-                                status.meshNodes > 1 ? 'good' : 
-                                status.meshNodes > 0 ? 'fair' : 'poor',
-                  signalStrength: status.voltage > 4.0 ? 'strong' : 'weak'
-                }
-              }, null, 2)
+              text: JSON.stringify({ tool: 'get_signal_quality', status: 'success', data: quality }, null, 2)
             }
           ]
         };
       }
       
-      default:
-        throw new McpError(ErrorCode.MethodNotFound, `Unknown tool: ${name}`);
+      return {
+        content: [
+          {
+            type: 'text',
+            text: JSON.stringify({
+              tool: 'get_signal_quality',
+              status: 'success',
+              data: {
+                ...quality,
+                networkHealth: quality.meshNodes > 3 ? 'excellent' : 
+                              quality.meshNodes > 1 ? 'good' : 
+                              quality.meshNodes > 0 ? 'fair' : 'poor',
+                // From the median direct-link SNR margin, not battery voltage
+                signalStrength: quality.quality?.rating ?? 'unknown'
+              }
+            }, null, 2)
+          }
+        ]
+      };
     }
-  } catch (error) {
-    return {
-      content: [
-        {
-          type: 'text',
-          text: JSON.stringify({
-            tool: name,
-            status: 'error',
-            error: error.message,
-            details: error.stack
-          }, null, 2)
-        }
-      ],
-      isError: true
-    };
+    
+    default:
+      throw new McpError(ErrorCode.MethodNotFound, `Unknown tool: ${name}`);
   }
-});
+}
 
 /**
  * Start the server
@@ -532,6 +850,10 @@ async function main() {
   const transport = new StdioServerTransport();
   await server.connect(transport);
   console.error('🚀 Heltec V2 Meshtastic MCP Server running...');
+  
+  // Pay interpreter startup now; the device itself is opened on first use
+  worker.start().catch((error) => console.error(`⚠️  ${error.message}`));
+  process.on('exit', () => worker.stop());
 }
 
 main().catch((error) => {
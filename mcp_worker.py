@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 MCP Worker
+Long-lived Python side of heltec-mcp-server: keeps the device open and answers
+JSON-RPC 2.0 requests, one JSON object per line on stdin/stdout
+(--once METHOD runs a single call, the server's fallback when no worker runs)
+"""
+
+import os
+import sys
+import math
+import json
+import time
+import inspect
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import mesh_daemon
+import network_scanner
+from delivery_tracker import DeliveryTracker, local_node_num
+from mesh_daemon import DEFAULT_DEVICE, to_jsonable, device_config
+from mesh_json import protocol_stdout
+from node_index import NodeIndex, node_num_from_id
+from packet_handlers import HandlerRegistry, ANY, ROUTING, TELEMETRY, TEXT_MESSAGE
+from packet_ring import PacketRing, packet_filter
+from receive_pipeline import ReceivePipeline
+from send_queue import SendQueue, radio_settings
+from signal_quality import SignalQuality
+from status_snapshot import StatusSnapshot, DEFAULT_MAX_AGE
+
+MAX_WORKERS = 8
+SEND_TIMEOUT = 30
+MONITOR_PAGE = 100
+MAX_MONITOR_WAIT = 30
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+DEVICE_ERROR = -32000
+
+
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class ParamError(RpcError):
+    """Bad call parameters; the only error reported as INVALID_PARAMS"""
+
+    def __init__(self, message):
+        super().__init__(INVALID_PARAMS, message)
+
+
+def number(name, value, kind=float, minimum=None, maximum=None):
+    """Coerce a numeric parameter, raising ParamError if it is not usable"""
+    if isinstance(value, bool):
+        raise ParamError(f"{name} must be a number")
+    try:
+        value = kind(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ParamError(f"{name} must be a number") from None
+    if not math.isfinite(value):
+        raise ParamError(f"{name} must be finite")
+    if minimum is not None and value < minimum:
+        raise ParamError(f"{name} must be at least {minimum}")
+    if maximum is not None and value > maximum:
+        raise ParamError(f"{name} must be at most {maximum}")
+    return value
+
+
+class MeshWorker:
+    """Owns one device connection and serves every MCP tool from it"""
+
+    def __init__(self, port=None, host=None):
+        self.port = port
+        self.host = host
+        self.interface = None
+        self.open_lock = threading.Lock()
+        self.held = False
+        self.handlers = HandlerRegistry()
+        self.node_index = NodeIndex()
+        self.node_index.register(self.handlers)
+        # Every received packet lands in the ring; monitor calls page through it
+        self.ring = PacketRing()
+        self.handlers.register(ANY, self.ring.append)
+        self.signal_quality = SignalQuality()
+        self.handlers.register(ANY, self.signal_quality.handler)
+        self.pipeline = None
+        self.send_queue = None
+        self.tracker = None
+        self.snapshot = None
+        self.started = time.time()
+        self.methods = {
+            'ping': self.ping,
+            'status': self.status,
+            'nodes': self.nodes,
+            'config': self.config,
+            'signal': self.signal,
+            'send': self.send,
+            'monitor': self.monitor,
+            'watch': self.watch,
+            'scan_wifi': self.scan_wifi,
+            'release': self.release,
+            'reclaim': self.reclaim,
+        }
+
+    def device(self):
+        """The open interface, connecting on first use or after a failure"""
+        with self.open_lock:
+            if self.held:
+                raise RpcError(DEVICE_ERROR, "Device released to another process (firmware upload?)")
+            if self.interface is None:
+                self.open()
+            return self.interface
+
+    def open(self):
+        interface = mesh_daemon.connect_daemon()
+        if interface:
+            log("⚡ Attached to mesh daemon")
+        elif self.host:
+            import meshtastic.tcp_interface
+            log(f"🌐 Connecting to {self.host} via TCP...")
+            interface = meshtastic.tcp_interface.TCPInterface(hostname=self.host)
+        else:
+            import meshtastic.serial_interface
+            port = self.port or DEFAULT_DEVICE
+            log(f"🔌 Connecting to {port}...")
+            interface = meshtastic.serial_interface.SerialInterface(port)
+        log("✅ Device connected!")
+
+        self.node_index.seed(interface.nodes)
+        self.signal_quality.preset = radio_settings(interface)[0]
+        self.signal_quality.my_node_num = local_node_num(interface)
+        self.pipeline = ReceivePipeline(interface)
+        self.pipeline.run_dispatcher(self.handlers.dispatch)
+        self.send_queue = SendQueue(interface).start()
+        self.handlers.register(TELEMETRY, self.send_queue.telemetry_handler)
+        self.tracker = DeliveryTracker(self.send_queue, self.handlers).start()
+        self.snapshot = StatusSnapshot(interface, self.node_index)
+        self.handlers.register(TELEMETRY, self.snapshot.telemetry_handler)
+        self.interface = interface
+
+    def reset(self):
+        """Drop a broken connection; the next call reconnects"""
+        with self.open_lock:
+            if self.snapshot:
+                self.handlers.unregister(TELEMETRY, self.snapshot.telemetry_handler)
+                self.snapshot = None
+            if self.tracker:
+                self.tracker.stop()
+                self.handlers.unregister(ROUTING, self.tracker.handle_routing)
+                self.tracker = None
+            if self.send_queue:
+                self.send_queue.stop(drain_timeout=0)
+                self.handlers.unregister(TELEMETRY, self.send_queue.telemetry_handler)
+                self.send_queue = None
+            if self.pipeline:
+                self.pipeline.stop()
+                self.pipeline = None
+            if self.interface:
+                try:
+                    self.interface.close()
+                except Exception:
+                    pass
+                self.interface = None
+
+    def call(self, method, params):
+        handler = self.methods.get(method)
+        if handler is None:
+            raise RpcError(METHOD_NOT_FOUND, f"Unknown method: {method}")
+        if not isinstance(params, dict):
+            raise ParamError("params must be an object")
+        # Only a signature mismatch is the caller's fault; a TypeError raised
+        # inside the handler is a bug and surfaces as INTERNAL_ERROR
+        try:
+            inspect.signature(handler).bind(**params)
+        except TypeError as e:
+            raise ParamError(str(e))
+        try:
+            return handler(**params)
+        except (RpcError, ValueError, TypeError):
+            raise
+        except Exception as e:
+            # Serial/socket errors leave the interface unusable
+            self.reset()
+            raise RpcError(DEVICE_ERROR, str(e))
+
+    def ping(self):
+        return {
+            'pid': os.getpid(),
+            'uptime': time.time() - self.started,
+            'connected': self.interface is not None,
+            'released': self.held,
+            'daemon': isinstance(self.interface, mesh_daemon.DaemonInterface),
+            'handlers': self.handlers.stats(),
+            'ring': self.ring.stats(),
+            'snapshot': self.snapshot.stats() if self.snapshot else None,
+        }
+
+    def status(self, max_age=DEFAULT_MAX_AGE):
+        """Cached status, refreshed from the device when older than max_age seconds"""
+        max_age = number('max_age', max_age, minimum=0)
+        self.device()
+        return self.snapshot.get(max_age)
+
+    def nodes(self, since=None, limit=None):
+        since = number('since', since, minimum=0) if since is not None else None
+        limit = number('limit', limit, int, minimum=1) if limit is not None else None
+        self.device()
+        nodes = self.node_index.heard_since(since) if since else self.node_index.recent(limit)
+        return to_jsonable(nodes[:limit] if limit else nodes)
+
+    def config(self):
+        return device_config(self.device())
+
+    def signal(self, max_age=DEFAULT_MAX_AGE, node=None):
+        """Device metrics plus per-node RSSI/SNR windows (one node's detail with node=)"""
+        if node is not None and not isinstance(node, (str, int)):
+            raise ParamError("node must be a node id, short name or number")
+        status = self.status(max_age)
+        if node is not None:
+            known = self.node_index.get(node) or {}
+            num = known.get('num') or (node_num_from_id(node) if isinstance(node, str) else node)
+            report = self.signal_quality.node(num) if num is not None else None
+            if report is None:
+                raise ParamError(f"No signal samples for node: {node}")
+            report['name'] = known.get('user', {}).get('longName')
+            return report
+
+        reports = self.signal_quality.nodes()
+        for report in reports:
+            known = self.node_index.get(report['num']) or {}
+            report['name'] = known.get('user', {}).get('longName')
+        return {
+            'voltage': status['voltage'],
+            'batteryLevel': status['battery'],
+            'channelUtilization': status['channelUtilization'],
+            'airUtilTx': status['airUtilTx'],
+            'meshNodes': status['meshNodes'],
+            'quality': self.signal_quality.overall(reports),
+            'links': reports,
+        }
+
+    def send(self, text, destination=None, channel=0, wait_ack=False, timeout=SEND_TIMEOUT):
+        if not text or not isinstance(text, str):
+            raise ParamError("Message text is required")
+        channel = number('channel', channel, int, minimum=0, maximum=7)
+        timeout = number('timeout', timeout, minimum=0)
+        self.device()
+        delivery = self.tracker.send(text, destination, channel)
+        if wait_ack and delivery.want_ack:
+            delivery.wait(timeout)
+        else:
+            delivery.attempts[-1].wait_sent(timeout)
+        return delivery.to_dict()
+
+    def monitor(self, cursor=None, wait=0, limit=MONITOR_PAGE, from_ids=None, portnums=None,
+                text_only=False):
+        """Packets received after `cursor`, filtered here so only matches cross the pipe
+
+        Returns the cursor to pass to the next call. With wait > 0 the call
+        long-polls until a matching packet arrives (at most MAX_MONITOR_WAIT).
+        """
+        if cursor is not None:
+            cursor = number('cursor', cursor, int, minimum=0)
+        wait = min(number('wait', wait, minimum=0), MAX_MONITOR_WAIT)
+        limit = min(number('limit', limit, int, minimum=1), self.ring.entries.maxlen)
+        self.device()
+        if text_only and not portnums:
+            portnums = [TEXT_MESSAGE]
+        match = packet_filter(from_ids, portnums)
+        packets, cursor, missed = self.ring.read(cursor, limit, match, wait)
+        return {'cursor': cursor, 'missed': missed, 'count': len(packets),
+                'packets': to_jsonable(packets)}
+
+    def watch(self, duration_seconds=30, limit=MONITOR_PAGE, from_ids=None, portnums=None,
+              text_only=False):
+        """Everything matching that arrives within duration_seconds, in one reply"""
+        duration_seconds = number('duration_seconds', duration_seconds, minimum=0)
+        limit = number('limit', limit, int, minimum=1)
+        self.device()
+        cursor = self.ring.seq
+        deadline = time.time() + duration_seconds
+        packets, missed = [], 0
+        while len(packets) < limit:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            page = self.monitor(cursor, remaining, limit - len(packets), from_ids, portnums, text_only)
+            cursor = page['cursor']
+            missed += page['missed']
+            packets.extend(page['packets'])
+        return {'cursor': cursor, 'missed': missed, 'count': len(packets),
+                'truncated': len(packets) >= limit, 'packets': packets}
+
+    def scan_wifi(self, prefix=network_scanner.MAX_PREFIX):
+        prefix = number('prefix', prefix, int, minimum=network_scanner.MIN_PREFIX, maximum=32)
+        found = network_scanner.scan_networks(prefix=prefix)
+        return [{k: v for k, v in result.items() if k != 'web_content'} for result in found]
+
+    def release(self):
+        """Close the port and keep it closed until reclaim (e.g. while flashing)
+
+        Dropping our daemon link would leave the daemon holding the device, so
+        a running daemon is asked to close it too
+        """
+        with self.open_lock:
+            self.held = True
+        self.reset()
+        daemon = mesh_daemon.connect_daemon()
+        if daemon:
+            try:
+                daemon.release()
+            except Exception as e:
+                raise RpcError(DEVICE_ERROR, f"Mesh daemon did not release the device: {e}")
+            finally:
+                daemon.close()
+        return {'released': True, 'daemon': bool(daemon)}
+
+    def reclaim(self):
+        with self.open_lock:
+            self.held = False
+        daemon = mesh_daemon.connect_daemon()
+        if daemon:
+            try:
+                daemon.reclaim()
+            finally:
+                daemon.close()
+        return {'released': False, 'daemon': bool(daemon)}
+
+    def close(self):
+        self.reset()
+
+
+def log(message):
+    # stdout carries the protocol, so everything human-readable goes to stderr
+    print(message, file=sys.stderr, flush=True)
+
+
+class Server:
+    """Reads requests from stdin and runs them on a thread pool"""
+
+    def __init__(self, worker, out):
+        self.worker = worker
+        self.out = out
+        self.write_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+    def write(self, obj):
+        line = json.dumps(obj, separators=(',', ':'), default=str)
+        with self.write_lock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+    def respond(self, request_id, result=None, error=None):
+        reply = {'jsonrpc': '2.0', 'id': request_id}
+        if error is not None:
+            reply['error'] = error
+        else:
+            reply['result'] = result
+        self.write(reply)
+        return reply
+
+    def handle(self, request):
+        request_id = request.get('id')
+        try:
+            result = self.worker.call(request.get('method'), request.get('params') or {})
+            return self.respond(request_id, result)
+        except RpcError as e:
+            return self.respond(request_id, error={'code': e.code, 'message': str(e)})
+        except Exception as e:
+            return self.respond(request_id, error={'code': INTERNAL_ERROR, 'message': str(e)})
+
+    def serve(self, stdin):
+        self.write({'jsonrpc': '2.0', 'method': 'ready', 'params': {'pid': os.getpid()}})
+        for line in stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError:
+                self.respond(None, error={'code': PARSE_ERROR, 'message': 'Invalid JSON'})
+                continue
+            if not isinstance(request, dict) or 'method' not in request:
+                self.respond(request.get('id') if isinstance(request, dict) else None,
+                             error={'code': INVALID_REQUEST, 'message': 'Invalid request'})
+                continue
+            self.executor.submit(self.handle, request)
+        self.executor.shutdown(wait=False)
+
+    def once(self, method, stdin):
+        """--once: a single call with params read as a JSON object from stdin"""
+        text = '' if stdin.isatty() else stdin.read().strip()
+        try:
+            params = json.loads(text) if text else {}
+        except json.JSONDecodeError:
+            return self.respond(None, error={'code': PARSE_ERROR, 'message': 'Invalid JSON params'})
+        return self.handle({'id': None, 'method': method, 'params': params})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON-RPC worker for the Heltec MCP server")
+    parser.add_argument('--port', help=f"Serial port (default: {DEFAULT_DEVICE})")
+    parser.add_argument('--host', help="Connect over TCP to this host instead of serial")
+    parser.add_argument('--once', metavar='METHOD',
+                        help="Run one method and exit; params are a JSON object on stdin")
+    args = parser.parse_args()
+
+    out = protocol_stdout()
+    worker = MeshWorker(port=args.port, host=args.host)
+    server = Server(worker, out)
+    try:
+        if args.once:
+            return 1 if 'error' in server.once(args.once, sys.stdin) else 0
+        server.serve(sys.stdin)
+    finally:
+        worker.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
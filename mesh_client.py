@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Mesh Client
+Plumbing shared by the interactive clients (meshtastic_comm.py, messenger.py,
+simple_comm.py): node index, message store, send queue and delivery reports
+"""
+
+import mesh_daemon
+import packet_handlers
+import send_queue
+from delivery_tracker import DeliveryTracker
+from packet_handlers import HandlerRegistry
+from message_store import MessageStore
+from mesh_json import JsonOutput
+from node_index import NodeIndex
+from send_queue import SendQueue
+
+
+class MeshClient:
+    def __init__(self, output=None):
+        self.interface = None
+        self.output = output or JsonOutput()
+        self.running = False
+        self.pipeline = None
+        self.handlers = HandlerRegistry()
+        self.store = None
+        self.send_queue = None
+        self.tracker = None
+        self.node_index = NodeIndex()
+        self.node_index.register(self.handlers)
+
+    def load_nodes(self):
+        """Seed the node index from the interface's node DB once"""
+        if not len(self.node_index) and self.interface:
+            self.node_index.seed(self.interface.nodes)
+
+    def start_store(self):
+        """Record received packets; the daemon records history itself, so only
+        store when we own the link"""
+        if self.store or isinstance(self.interface, mesh_daemon.DaemonInterface):
+            return
+        self.store = MessageStore().start()
+        self.handlers.register(packet_handlers.ANY, self.store.handler)
+
+    def queue_message(self, text, destination=None):
+        """Hand a message to the send queue; delivery is reported when it completes"""
+        if not self.send_queue:
+            self.send_queue = SendQueue(self.interface).start()
+            self.handlers.register(packet_handlers.TELEMETRY, self.send_queue.telemetry_handler)
+            self.tracker = DeliveryTracker(self.send_queue, self.handlers).start()
+        return self.tracker.send(text, destination, on_done=self.report_delivery)
+
+    def report_delivery(self, delivery):
+        self.output.emit('delivery', **delivery.to_dict())
+        retries = f", {delivery.retries} retries" if delivery.retries else ""
+        if delivery.state == send_queue.ACKED:
+            print(f"✅ Delivered to {delivery.destination} ({delivery.latency:.1f}s{retries})")
+        elif delivery.state == send_queue.FAILED:
+            print(f"❌ Not delivered to {delivery.destination}: {delivery.error}{retries}")
+        else:
+            print("✅ Message sent!")
+
+    def emit_packet(self, packet, decoded):
+        """--json: every received packet as an NDJSON event"""
+        self.output.emit('packet', packet=packet)
+
+    def stop_services(self):
+        """Flush and stop the tracker, send queue, pipeline and store"""
+        if self.tracker:
+            self.tracker.stop()
+            self.tracker = None
+        if self.send_queue:
+            self.send_queue.stop()
+            self.send_queue = None
+        if self.pipeline:
+            self.pipeline.stop()
+        if self.store:
+            self.store.close()
+            self.store = None
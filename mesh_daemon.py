@@ -0,0 +1,613 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Mesh Daemon
+Owns the single serial/TCP link to the Meshtastic device and shares it with
+every local tool over a Unix socket, so clients attach without a new handshake
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import signal
+import socket
+import argparse
+import threading
+import socketserver
+from queue import Queue, Full, Empty
+
+from delivery_tracker import DeliveryTracker
+from node_index import NodeIndex
+from packet_handlers import HandlerRegistry, ANY, TELEMETRY
+from receive_pipeline import ReceivePipeline
+from send_queue import SendQueue, NORMAL
+
+STATE_DIR = os.environ.get('HELTEC_STATE_DIR', os.path.expanduser('~/.heltec'))
+DEFAULT_SOCKET = os.environ.get('HELTEC_MESHD_SOCKET', os.path.join(STATE_DIR, 'meshd.sock'))
+# HELTEC_DEVICE points every tool at another port (e.g. the mesh_simulator.py pty)
+DEFAULT_DEVICE = os.environ.get('HELTEC_DEVICE', "/dev/cu.usbserial-0001")
+
+# Each subscriber gets its own bounded queue; a stalled client loses packets
+# instead of blocking the meshtastic reader thread
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# How long the daemon's send command waits for the radio to take a message;
+# clients allow this plus their own timeout before giving up on the reply
+SEND_WAIT = 30
+
+
+def to_jsonable(obj):
+    """Convert a meshtastic packet/node dict into something json.dumps accepts"""
+    if isinstance(obj, dict):
+        return {str(k): to_jsonable(v) for k, v in obj.items() if k != 'raw'}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(v) for v in obj]
+    if isinstance(obj, (bytes, bytearray)):
+        return base64.b64encode(bytes(obj)).decode('ascii')
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if hasattr(obj, 'DESCRIPTOR'):
+        from google.protobuf.json_format import MessageToDict
+        return MessageToDict(obj)
+    return str(obj)
+
+
+def device_config(interface):
+    """localConfig, moduleConfig and channels of a meshtastic interface as JSON"""
+    if hasattr(interface, 'getConfig'):
+        return interface.getConfig()
+    local_node = interface.localNode
+    return {
+        'localConfig': to_jsonable(local_node.localConfig),
+        'moduleConfig': to_jsonable(local_node.moduleConfig),
+        'channels': to_jsonable(list(local_node.channels or [])),
+    }
+
+
+def send_line(sock_file, obj):
+    """Write one newline-delimited JSON message"""
+    sock_file.write((json.dumps(obj, separators=(',', ':')) + '\n').encode('utf-8'))
+    sock_file.flush()
+
+
+class DaemonError(Exception):
+    """Raised when the daemon rejects a request"""
+
+
+class _DaemonNode:
+    """Stand-in for interface.localNode backed by the daemon's config call"""
+
+    def __init__(self, client):
+        self._client = client
+
+    @property
+    def localConfig(self):
+        return self._client._call('config').get('localConfig', {})
+
+    @property
+    def moduleConfig(self):
+        return self._client._call('config').get('moduleConfig', {})
+
+    def getChannelByChannelIndex(self, index):
+        channels = self._client._call('config').get('channels', [])
+        for channel in channels:
+            if channel.get('index', 0) == index:
+                return channel
+        return None
+
+
+class DaemonInterface:
+    """Client for mesh_daemon.py that mimics the meshtastic interface API"""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=10):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self.file = self.sock.makefile('wb')
+        # Replies are read straight off the socket: a makefile() reader is
+        # unusable after one timeout, and late replies still have to be drained
+        self._buffer = b''
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.subscribers = []
+        self.localNode = _DaemonNode(self)
+
+    def _call(self, cmd, _timeout=None, **params):
+        """Send one request and wait for its reply
+
+        Replies to earlier calls that timed out are still in flight, so lines
+        are read until the one carrying this request's id arrives
+        """
+        with self.lock:
+            request_id = self.next_id
+            self.next_id += 1
+            self.sock.settimeout(_timeout or self.timeout)
+            try:
+                send_line(self.file, dict(params, id=request_id, cmd=cmd))
+                while True:
+                    line = self._readline()
+                    if not line:
+                        raise DaemonError("Daemon closed the connection")
+                    reply = json.loads(line)
+                    if reply.get('id') == request_id:
+                        break
+            finally:
+                self.sock.settimeout(self.timeout)
+        if not reply.get('ok'):
+            raise DaemonError(reply.get('error', 'Unknown daemon error'))
+        return reply.get('result')
+
+    def _readline(self):
+        """One reply line, b'' once the daemon has closed the connection"""
+        while b'\n' not in self._buffer:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                return b''
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line
+
+    def ping(self):
+        return self._call('ping')
+
+    @property
+    def nodes(self):
+        return self._call('nodes')
+
+    def query_nodes(self, since=None, top_snr=None, limit=None):
+        """Indexed node queries: heard in the last `since` seconds, top-N by SNR,
+        or the `limit` most recently heard"""
+        return self._call('nodes', since=since, top_snr=top_snr, limit=limit)
+
+    def getNode(self, key):
+        """Look up one node by num, '!hex' id or short name"""
+        return self._call('node', key=key)
+
+    def getMyNodeInfo(self):
+        return self._call('info')
+
+    def getConfig(self):
+        return self._call('config')
+
+    def history(self, from_id=None, limit=20, since=None, until=None, portnum='TEXT_MESSAGE_APP'):
+        """Stored packets: last N (optionally from one node) or a time range"""
+        return self._call('history', from_id=from_id, limit=limit, since=since,
+                          until=until, portnum=portnum)
+
+    def telemetry(self, node_id=None, metric=None, since=None, until=None, resolution=None):
+        """Recorded telemetry: nodes, a node's metrics, or one metric's points over a range"""
+        return self._call('telemetry', node_id=node_id, metric=metric, since=since,
+                          until=until, resolution=resolution)
+
+    def release(self):
+        """Ask the daemon to close the device until reclaim()"""
+        return self._call('release')
+
+    def reclaim(self):
+        return self._call('reclaim')
+
+    def sendText(self, text, destinationId=None, wantAck=False, channelIndex=0, timeout=SEND_WAIT):
+        """Send a text message through the daemon, returns the sent packet"""
+        return self._call('send', _timeout=timeout + self.timeout, text=text,
+                          destination=destinationId, want_ack=wantAck,
+                          channel=channelIndex, timeout=timeout)
+
+    def onReceive(self, callback):
+        """Stream packets from the daemon to callback(packet, interface)"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        sock_file = sock.makefile('rwb')
+        send_line(sock_file, {'id': 0, 'cmd': 'subscribe'})
+        self.subscribers.append(sock)
+
+        def reader():
+            try:
+                for line in sock_file:
+                    message = json.loads(line)
+                    if message.get('event') == 'packet':
+                        callback(message['packet'], self)
+            except (OSError, ValueError):
+                pass
+
+        thread = threading.Thread(target=reader, daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        for sock in self.subscribers:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+                sock.close()
+            except OSError:
+                pass
+        self.subscribers = []
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def connect_daemon(socket_path=DEFAULT_SOCKET, timeout=10):
+    """Attach to a running daemon, returns None if none is listening"""
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        return DaemonInterface(socket_path, timeout=timeout)
+    except OSError:
+        return None
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """One client connection speaking newline-delimited JSON"""
+
+    def handle(self):
+        daemon = self.server.mesh
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                send_line(self.wfile, {'ok': False, 'error': 'Invalid JSON'})
+                continue
+
+            if request.get('cmd') == 'subscribe':
+                self.stream_packets(daemon)
+                return
+
+            try:
+                result = daemon.handle_command(request)
+                reply = {'id': request.get('id'), 'ok': True, 'result': result}
+            except Exception as e:
+                reply = {'id': request.get('id'), 'ok': False, 'error': str(e)}
+
+            try:
+                send_line(self.wfile, reply)
+            except OSError:
+                return
+
+    def stream_packets(self, daemon):
+        """Push every received packet to this client until it disconnects"""
+        queue = daemon.add_subscriber()
+        try:
+            while daemon.running:
+                try:
+                    packet = queue.get(timeout=1)
+                except Empty:
+                    continue
+                send_line(self.wfile, {'event': 'packet', 'packet': packet})
+        except OSError:
+            pass
+        finally:
+            daemon.remove_subscriber(queue)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MeshDaemon:
+    def __init__(self, port=None, host=None, socket_path=DEFAULT_SOCKET, store_path=None,
+                 telemetry_path=None):
+        self.port = port
+        self.host = host
+        self.socket_path = socket_path
+        self.store_path = store_path
+        self.store = None
+        self.telemetry_path = telemetry_path
+        self.recorder = None
+        self.handlers = HandlerRegistry()
+        self.node_index = NodeIndex()
+        self.interface = None
+        self.server = None
+        self.running = False
+        self.started = time.time()
+        self.subscribers = []
+        self.sub_lock = threading.Lock()
+        self.send_queue = None
+        self.tracker = None
+        self.pipeline = None
+        self.packets_dropped = 0
+        # Set while another process (a firmware upload) needs the port
+        self.released = False
+
+    def open_interface(self):
+        """Open the one and only device connection"""
+        import meshtastic.serial_interface
+        import meshtastic.tcp_interface
+
+        if self.host:
+            print(f"🌐 Connecting to {self.host} via TCP...")
+            self.interface = meshtastic.tcp_interface.TCPInterface(hostname=self.host)
+        else:
+            port = self.port or DEFAULT_DEVICE
+            print(f"🔌 Connecting to {port}...")
+            self.interface = meshtastic.serial_interface.SerialInterface(port)
+        print("✅ Device connected!")
+        self.node_index.seed(self.interface.nodes)
+        if self.send_queue:
+            self.send_queue.interface = self.interface
+
+    def fan_out(self, packet, decoded=None):
+        """Runs on the dispatcher thread: copy a packet to every subscriber"""
+        with self.sub_lock:
+            if not self.subscribers:
+                return
+            data = to_jsonable(packet)
+            for queue in self.subscribers:
+                try:
+                    queue.put_nowait(data)
+                except Full:
+                    self.packets_dropped += 1
+
+    def on_connection_lost(self, interface):
+        if interface is not self.interface or not self.running:
+            return
+        print("⚠️  Device connection lost, reconnecting...")
+        threading.Thread(target=self.reconnect, daemon=True).start()
+
+    def reconnect(self):
+        delay = 1
+        try:
+            self.interface.close()
+        except Exception:
+            pass
+        while self.running and not self.released:
+            try:
+                self.open_interface()
+                if self.released:
+                    # Released while we were connecting: give the port back
+                    self.release()
+                return
+            except Exception as e:
+                print(f"❌ Reconnect failed: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def release(self):
+        """Close the device link and keep it closed until reclaim (e.g. while flashing)"""
+        self.released = True
+        # Clear the reference first so on_connection_lost ignores our own close
+        interface, self.interface = self.interface, None
+        if interface:
+            try:
+                interface.close()
+            except Exception:
+                pass
+            print("🔓 Device released")
+
+    def reclaim(self):
+        """Reopen the link after release; retries while the board re-enumerates"""
+        if not self.released:
+            return
+        self.released = False
+        threading.Thread(target=self.reconnect, daemon=True).start()
+
+    def add_subscriber(self):
+        queue = Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.sub_lock:
+            self.subscribers.append(queue)
+        return queue
+
+    def remove_subscriber(self, queue):
+        with self.sub_lock:
+            if queue in self.subscribers:
+                self.subscribers.remove(queue)
+
+    def handle_command(self, request):
+        """Execute one request against the shared interface"""
+        cmd = request.get('cmd')
+
+        if cmd == 'ping':
+            return {
+                'pid': os.getpid(),
+                'uptime': time.time() - self.started,
+                'transport': 'tcp' if self.host else 'serial',
+                'endpoint': self.host or self.port or DEFAULT_DEVICE,
+                'subscribers': len(self.subscribers),
+                'pipeline': self.pipeline.stats() if self.pipeline else None,
+                'handlers': self.handlers.stats(),
+                'store': self.store.stats() if self.store else None,
+                'telemetry': self.recorder.stats() if self.recorder else None,
+                'sendQueue': self.send_queue.stats() if self.send_queue else None,
+                'delivery': self.tracker.stats() if self.tracker else None,
+                'packetsDropped': self.packets_dropped,
+                'released': self.released,
+            }
+        if cmd == 'release':
+            self.release()
+            return {'released': True}
+        if cmd == 'reclaim':
+            self.reclaim()
+            return {'released': False}
+        if self.interface is None and cmd in ('info', 'nodes', 'config', 'send'):
+            raise ValueError("Device released to another process (firmware upload?)"
+                             if self.released else "Device is reconnecting")
+        if cmd == 'info':
+            return to_jsonable(self.interface.getMyNodeInfo())
+        if cmd == 'nodes':
+            since, top_snr, limit = request.get('since'), request.get('top_snr'), request.get('limit')
+            if since is not None:
+                nodes = self.node_index.heard_since(float(since))
+            elif top_snr is not None:
+                nodes = self.node_index.top_by_snr(int(top_snr))
+            elif limit is not None:
+                nodes = self.node_index.recent(int(limit))
+            else:
+                return to_jsonable(self.interface.nodes or {})
+            return to_jsonable(nodes[:int(limit)] if limit is not None else nodes)
+        if cmd == 'node':
+            return to_jsonable(self.node_index.get(request.get('key')))
+        if cmd == 'config':
+            return device_config(self.interface)
+        if cmd == 'history':
+            if not self.store:
+                raise ValueError("Message store is disabled")
+            if request.get('since') is not None:
+                return self.store.time_range(
+                    request['since'], request.get('until'),
+                    from_id=request.get('from_id'), channel=request.get('channel'),
+                    portnum=request.get('portnum'), limit=request.get('limit'))
+            return self.store.last_messages(
+                request.get('from_id'), int(request.get('limit') or 20),
+                request.get('portnum', 'TEXT_MESSAGE_APP'))
+        if cmd == 'telemetry':
+            if not self.recorder:
+                raise ValueError("Telemetry recorder is disabled")
+            node_id, metric = request.get('node_id'), request.get('metric')
+            if not node_id:
+                return {'nodes': self.recorder.nodes()}
+            if not metric:
+                return {'metrics': self.recorder.metrics(node_id)}
+            return self.recorder.query(node_id, metric, float(request.get('since') or time.time() - 86400),
+                                       request.get('until'), request.get('resolution'))
+        if cmd == 'send':
+            text = request.get('text')
+            if not text:
+                raise ValueError("Message text is required")
+            delivery = self.tracker.send(
+                text,
+                destination=request.get('destination') or '^all',
+                channel=int(request.get('channel') or 0),
+                priority=int(request.get('priority', NORMAL)),
+                want_ack=None if request.get('want_ack') is None else bool(request['want_ack']),
+            )
+            # Reply once the radio has taken it; the ack reaches clients on the packet stream
+            message = delivery.attempts[-1]
+            message.wait_sent(float(request.get('timeout') or SEND_WAIT))
+            return message.to_dict()
+
+        raise ValueError(f"Unknown command: {cmd}")
+
+    def prepare_socket(self):
+        """Remove a stale socket file, refuse to start if a daemon is alive"""
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if not os.path.exists(self.socket_path):
+            return True
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+            print(f"❌ A daemon is already listening on {self.socket_path}")
+            return False
+        except OSError:
+            os.unlink(self.socket_path)
+            return True
+        finally:
+            probe.close()
+
+    def serve_forever(self):
+        from pubsub import pub
+
+        if not self.prepare_socket():
+            return 1
+
+        self.open_interface()
+        self.running = True
+        self.node_index.register(self.handlers)
+        self.handlers.register(ANY, self.fan_out)
+        self.send_queue = SendQueue(self.interface).start()
+        self.handlers.register(TELEMETRY, self.send_queue.telemetry_handler)
+        # Clients retry on their own, the daemon only correlates acks for its stats
+        self.tracker = DeliveryTracker(self.send_queue, self.handlers, max_retries=0).start()
+        if self.store_path:
+            from message_store import MessageStore
+            self.store = MessageStore(self.store_path).start()
+            self.handlers.register(ANY, self.store.handler)
+        if self.telemetry_path:
+            from telemetry_recorder import TelemetryRecorder
+            self.recorder = TelemetryRecorder(self.telemetry_path).start()
+            self.handlers.register(TELEMETRY, self.recorder.handler)
+
+        # The daemon owns the only interface in this process, so take every packet
+        self.pipeline = ReceivePipeline()
+        self.pipeline.run_dispatcher(self.handlers.dispatch)
+        pub.subscribe(self.on_connection_lost, "meshtastic.connection.lost")
+
+        self.server = _UnixServer(self.socket_path, _RequestHandler)
+        self.server.mesh = self
+        os.chmod(self.socket_path, 0o600)
+        print(f"🚀 Mesh daemon listening on {self.socket_path}")
+
+        try:
+            self.server.serve_forever()
+        finally:
+            self.stop()
+        return 0
+
+    def stop(self):
+        if self.tracker:
+            self.tracker.stop()
+        if self.send_queue:
+            self.send_queue.stop()
+        self.running = False
+        if self.pipeline:
+            self.pipeline.stop()
+        if self.store:
+            self.store.close()
+            self.store = None
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+        if self.server:
+            self.server.server_close()
+            self.server = None
+        if os.path.exists(self.socket_path):
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+        if self.interface:
+            try:
+                self.interface.close()
+            except Exception:
+                pass
+            self.interface = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared Meshtastic connection daemon")
+    parser.add_argument('--port', help=f"Serial port (default: {DEFAULT_DEVICE})")
+    parser.add_argument('--host', help="Connect over TCP to this host instead of serial")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path to listen on")
+    parser.add_argument('--status', action='store_true', help="Query a running daemon and exit")
+    parser.add_argument('--db', help="SQLite file for received packets (default: ~/.heltec/messages.db)")
+    parser.add_argument('--no-store', action='store_true', help="Do not record received packets")
+    parser.add_argument('--telemetry-dir', help="Telemetry time-series directory (default: ~/.heltec/telemetry)")
+    parser.add_argument('--no-telemetry', action='store_true', help="Do not record node telemetry")
+    args = parser.parse_args()
+
+    if args.status:
+        client = connect_daemon(args.socket)
+        if not client:
+            print(f"❌ No daemon listening on {args.socket}")
+            return 1
+        print(json.dumps(client.ping(), indent=2))
+        client.close()
+        return 0
+
+    from message_store import DEFAULT_PATH as DEFAULT_DB
+    from telemetry_recorder import DEFAULT_PATH as DEFAULT_TELEMETRY
+    daemon = MeshDaemon(port=args.port, host=args.host, socket_path=args.socket,
+                        store_path=None if args.no_store else (args.db or DEFAULT_DB),
+                        telemetry_path=None if args.no_telemetry else (args.telemetry_dir or DEFAULT_TELEMETRY))
+
+    def signal_handler(sig, frame):
+        print("\n🛑 Shutting down daemon...")
+        daemon.running = False
+        if daemon.server:
+            threading.Thread(target=daemon.server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    try:
+        return daemon.serve_forever()
+    except Exception as e:
+        print(f"❌ Daemon failed: {e}")
+        daemon.stop()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
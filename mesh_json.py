@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 JSON Output
+Machine mode shared by the CLI tools (--json): stdout carries one JSON document
+or an NDJSON event stream, the usual human-readable text goes to stderr
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+
+from mesh_daemon import to_jsonable
+
+
+def protocol_stdout():
+    """Keep the real stdout for JSON and point fd 1 at stderr so prints
+    (ours and the meshtastic library's) cannot corrupt the stream"""
+    out = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    return out
+
+
+class JsonOutput:
+    """NDJSON writer; every call is a no-op unless enabled"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.out = protocol_stdout() if enabled else None
+        self.lock = threading.Lock()
+
+    def write(self, obj):
+        line = json.dumps(to_jsonable(obj), separators=(',', ':'))
+        with self.lock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+    def emit(self, event, **fields):
+        """One NDJSON event: {"event": ..., "time": ..., **fields}"""
+        if self.enabled:
+            self.write({'event': event, 'time': time.time(), **fields})
+
+    def document(self, obj):
+        """A single JSON document (for one-shot tools)"""
+        if self.enabled:
+            self.write(obj)
+
+
+def parse_input(line, json_mode=False):
+    """Interactive input -> (text, destination), or None if it cannot be sent
+
+    In machine mode a line may also be {"text": ..., "destination": ...} to
+    address a node; otherwise every line is plain text
+    """
+    if json_mode and line.startswith('{'):
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError:
+            print("❌ Invalid JSON request")
+            return None
+        text = request.get('text') if isinstance(request, dict) else None
+        if not text or not isinstance(text, str):
+            print("❌ Request needs a non-empty \"text\"")
+            return None
+        return text, request.get('destination')
+    return line, None
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Mesh Simulator
+Stand-in for a real board: speaks the StreamAPI framing (0x94 0xC3 + length)
+over a pty and TCP port 4403, with N virtual nodes generating traffic
+"""
+
+import os
+import sys
+import tty
+import time
+import heapq
+import random
+import signal
+import socket
+import argparse
+import threading
+import socketserver
+from queue import Queue, Full
+
+try:
+    from meshtastic.protobuf import (mesh_pb2, telemetry_pb2, config_pb2, channel_pb2,
+                                     portnums_pb2, module_config_pb2)
+except ImportError:
+    # meshtastic < 2.3 kept the generated modules at the top level
+    from meshtastic import (mesh_pb2, telemetry_pb2, config_pb2, channel_pb2,
+                            portnums_pb2, module_config_pb2)
+
+# src/mesh/StreamAPI.cpp framing
+START1 = 0x94
+START2 = 0xC3
+HEADER_LEN = 4
+MAX_TO_FROM_RADIO_SIZE = 512
+
+DEFAULT_TCP_PORT = 4403
+BROADCAST_NUM = 0xFFFFFFFF
+CLIENT_QUEUE_SIZE = 5000
+TX_QUEUE_MAXLEN = 16     # what the firmware reports in QueueStatus
+
+TEXTS = [
+    "Anyone copy?", "Checking in", "Weather is clear here", "Relay test",
+    "Battery swap done", "On the trail, all good", "QSL", "Heading back",
+]
+
+
+def frame(payload):
+    """One StreamAPI frame: START1 START2 len_hi len_lo payload"""
+    if len(payload) > MAX_TO_FROM_RADIO_SIZE:
+        raise ValueError(f"Frame payload too large: {len(payload)} bytes")
+    return bytes([START1, START2, len(payload) >> 8, len(payload) & 0xFF]) + payload
+
+
+class FrameParser:
+    """Byte-at-a-time resync state machine, same rules as StreamAPI::handleRecStream"""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data):
+        frames = []
+        for c in data:
+            ptr = len(self.buf)
+            self.buf.append(c)
+            if ptr == 0:
+                if c != START1:
+                    self.buf.clear()
+            elif ptr == 1:
+                if c != START2:
+                    self.buf.clear()
+            elif ptr >= HEADER_LEN - 1:
+                length = (self.buf[2] << 8) + self.buf[3]
+                if ptr == HEADER_LEN - 1 and length > MAX_TO_FROM_RADIO_SIZE:
+                    self.buf.clear()
+                elif ptr + 1 >= length + HEADER_LEN:
+                    frames.append(bytes(self.buf[HEADER_LEN:]))
+                    self.buf.clear()
+        return frames
+
+
+class VirtualNode:
+    def __init__(self, num, index, rng):
+        self.num = num
+        self.id = f"!{num:08x}"
+        self.long_name = f"Sim Node {index}"
+        self.short_name = f"S{index:02d}"[-4:]
+        self.hops = rng.choice([0, 0, 0, 1, 1, 2])
+        self.snr = rng.uniform(-12, 10)
+        self.rssi = rng.uniform(-125, -70)
+        self.lat = 37.77 + rng.uniform(-0.2, 0.2)
+        self.lon = -122.42 + rng.uniform(-0.2, 0.2)
+        self.battery = rng.randint(30, 100)
+        self.started = time.time() - rng.randint(0, 86400)
+
+    def user(self):
+        return mesh_pb2.User(id=self.id, long_name=self.long_name, short_name=self.short_name,
+                             hw_model=mesh_pb2.HardwareModel.Value('HELTEC_V2_1'))
+
+    def position(self):
+        return mesh_pb2.Position(latitude_i=int(self.lat * 1e7), longitude_i=int(self.lon * 1e7),
+                                 altitude=int(20 + self.num % 50), time=int(time.time()))
+
+    def metrics(self):
+        return telemetry_pb2.DeviceMetrics(battery_level=self.battery, voltage=3.3 + self.battery / 100,
+                                           channel_utilization=random.uniform(2, 30),
+                                           air_util_tx=random.uniform(0.1, 5),
+                                           uptime_seconds=int(time.time() - self.started))
+
+    def node_info(self):
+        return mesh_pb2.NodeInfo(num=self.num, user=self.user(), position=self.position(),
+                                 snr=self.snr, last_heard=int(time.time()),
+                                 device_metrics=self.metrics(), hops_away=self.hops)
+
+
+class Client:
+    """One connected app; frames go out through a bounded queue on a writer thread"""
+
+    def __init__(self, write, name):
+        self.write = write
+        self.name = name
+        self.ready = False      # packets only flow after want_config (STATE_SEND_PACKETS)
+        self.queue = Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        threading.Thread(target=self._write_loop, name=f"sim-{name}", daemon=True).start()
+
+    def send(self, from_radio):
+        try:
+            self.queue.put_nowait(frame(from_radio.SerializeToString()))
+        except Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        while not self.closed:
+            data = self.queue.get()
+            if data is None:
+                break
+            try:
+                self.write(data)
+                self.sent += 1
+            except OSError:
+                self.closed = True
+
+    def close(self):
+        self.closed = True
+        self.queue.put(None)
+
+
+class SimulatedMesh:
+    def __init__(self, nodes=8, text_rate=0.05, position_rate=0.02, telemetry_rate=0.02,
+                 ack_delay=1.5, echo=False, region='US', preset='LONG_FAST', seed=None):
+        self.rng = random.Random(seed)
+        self.my_num = self.rng.randint(0x10000000, 0xFFFFFFF0)
+        self.me = VirtualNode(self.my_num, 0, self.rng)
+        self.me.long_name, self.me.short_name, self.me.hops = "Heltec V2 Sim", "HSIM", 0
+        self.nodes = {}
+        for index in range(1, nodes + 1):
+            num = self.rng.randint(0x10000000, 0xFFFFFFF0)
+            self.nodes[num] = VirtualNode(num, index, self.rng)
+        self.rates = {'text': text_rate, 'position': position_rate, 'telemetry': telemetry_rate}
+        self.ack_delay = ack_delay
+        self.echo = echo
+        self.region = region
+        self.preset = preset
+        self.clients = []
+        self.lock = threading.Lock()
+        self.events = []          # heap of (due, seq, callable)
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.running = False
+        self.generated = 0
+        self.received = 0
+
+    # --- connection handshake -------------------------------------------------
+
+    def config_stream(self, nonce):
+        """FromRadio messages in PhoneAPI order, ending with config_complete_id"""
+        out = [
+            mesh_pb2.FromRadio(my_info=mesh_pb2.MyNodeInfo(my_node_num=self.my_num, reboot_count=1,
+                                                           min_app_version=30200,
+                                                           nodedb_count=len(self.nodes) + 1)),
+            mesh_pb2.FromRadio(node_info=self.me.node_info()),
+            mesh_pb2.FromRadio(metadata=mesh_pb2.DeviceMetadata(
+                firmware_version="2.5.0.simulated", device_state_version=23, hasWifi=True,
+                hasBluetooth=True, hw_model=mesh_pb2.HardwareModel.Value('HELTEC_V2_1'))),
+        ]
+        for index in range(8):
+            role = channel_pb2.Channel.Role.PRIMARY if index == 0 else channel_pb2.Channel.Role.DISABLED
+            settings = channel_pb2.ChannelSettings(psk=b'\x01') if index == 0 else None
+            out.append(mesh_pb2.FromRadio(channel=channel_pb2.Channel(index=index, role=role, settings=settings)))
+
+        lora = config_pb2.Config.LoRaConfig(
+            use_preset=True, hop_limit=3, tx_enabled=True,
+            region=config_pb2.Config.LoRaConfig.RegionCode.Value(self.region),
+            modem_preset=config_pb2.Config.LoRaConfig.ModemPreset.Value(self.preset))
+        for config in (
+            config_pb2.Config(device=config_pb2.Config.DeviceConfig()),
+            config_pb2.Config(position=config_pb2.Config.PositionConfig()),
+            config_pb2.Config(power=config_pb2.Config.PowerConfig()),
+            config_pb2.Config(network=config_pb2.Config.NetworkConfig(wifi_enabled=True, wifi_ssid="SimNet")),
+            config_pb2.Config(display=config_pb2.Config.DisplayConfig()),
+            config_pb2.Config(lora=lora),
+            config_pb2.Config(bluetooth=config_pb2.Config.BluetoothConfig()),
+        ):
+            out.append(mesh_pb2.FromRadio(config=config))
+        for module in (
+            module_config_pb2.ModuleConfig(mqtt=module_config_pb2.ModuleConfig.MQTTConfig()),
+            module_config_pb2.ModuleConfig(telemetry=module_config_pb2.ModuleConfig.TelemetryConfig(
+                device_update_interval=900)),
+        ):
+            out.append(mesh_pb2.FromRadio(moduleConfig=module))
+        for node in self.nodes.values():
+            out.append(mesh_pb2.FromRadio(node_info=node.node_info()))
+        out.append(mesh_pb2.FromRadio(config_complete_id=nonce))
+        return out
+
+    def handle_to_radio(self, client, payload):
+        to_radio = mesh_pb2.ToRadio()
+        try:
+            to_radio.ParseFromString(payload)
+        except Exception:
+            return
+        variant = to_radio.WhichOneof('payload_variant')
+        if variant == 'want_config_id':
+            client.ready = False
+            for message in self.config_stream(to_radio.want_config_id):
+                client.send(message)
+            client.ready = True
+        elif variant == 'packet':
+            self.received += 1
+            self.handle_outgoing(client, to_radio.packet)
+        elif variant == 'disconnect':
+            client.ready = False
+
+    def handle_outgoing(self, client, packet):
+        """A packet the app asked us to transmit: queue status, then ack/echo"""
+        client.send(mesh_pb2.FromRadio(queueStatus=mesh_pb2.QueueStatus(
+            res=0, free=TX_QUEUE_MAXLEN - 1, maxlen=TX_QUEUE_MAXLEN, mesh_packet_id=packet.id)))
+        target = self.nodes.get(packet.to)
+        if packet.want_ack:
+            # Direct: the destination acks; broadcast: our own rebroadcast counts (implicit ack)
+            acker = target.num if target else self.my_num
+            delay = self.ack_delay * (1 + (target.hops if target else 0)) * self.rng.uniform(0.5, 1.5)
+            self.schedule(delay, lambda: self.deliver(self.routing_ack(acker, packet.id)))
+        if self.echo and target and packet.decoded.portnum == portnums_pb2.PortNum.TEXT_MESSAGE_APP:
+            text = f"echo: {packet.decoded.payload.decode('utf-8', 'replace')}"
+            self.schedule(self.ack_delay * 2, lambda: self.deliver(
+                self.mesh_packet(target, portnums_pb2.PortNum.TEXT_MESSAGE_APP, text.encode(), to=self.my_num)))
+
+    # --- traffic ----------------------------------------------------------------
+
+    def mesh_packet(self, node, portnum, payload, to=BROADCAST_NUM, request_id=0):
+        packet = mesh_pb2.MeshPacket(
+            to=to, id=self.rng.randint(1, 0xFFFFFFFF), channel=0, rx_time=int(time.time()),
+            hop_limit=3 - node.hops, hop_start=3,
+            decoded=mesh_pb2.Data(portnum=portnum, payload=payload, request_id=request_id))
+        setattr(packet, 'from', node.num)
+        if node.num != self.my_num:
+            packet.rx_snr = round(self.rng.gauss(node.snr, 2), 2)
+            packet.rx_rssi = int(self.rng.gauss(node.rssi, 3))
+        return packet
+
+    def routing_ack(self, from_num, request_id):
+        node = self.nodes.get(from_num, self.me)
+        routing = mesh_pb2.Routing(error_reason=mesh_pb2.Routing.Error.NONE)
+        return self.mesh_packet(node, portnums_pb2.PortNum.ROUTING_APP, routing.SerializeToString(),
+                                to=self.my_num, request_id=request_id)
+
+    def random_packet(self, kind):
+        if kind == 'telemetry':
+            # Our own node reports too, like the firmware's device telemetry
+            node = self.rng.choice([self.me, *self.nodes.values()])
+            node.battery = max(0, node.battery - self.rng.choice([0, 0, 1]))
+            telemetry = telemetry_pb2.Telemetry(time=int(time.time()), device_metrics=node.metrics())
+            return self.mesh_packet(node, portnums_pb2.PortNum.TELEMETRY_APP, telemetry.SerializeToString())
+        node = self.rng.choice(list(self.nodes.values()))
+        if kind == 'position':
+            node.lat += self.rng.uniform(-0.001, 0.001)
+            node.lon += self.rng.uniform(-0.001, 0.001)
+            return self.mesh_packet(node, portnums_pb2.PortNum.POSITION_APP, node.position().SerializeToString())
+        return self.mesh_packet(node, portnums_pb2.PortNum.TEXT_MESSAGE_APP,
+                                self.rng.choice(TEXTS).encode())
+
+    def deliver(self, packet):
+        message = mesh_pb2.FromRadio(packet=packet)
+        with self.lock:
+            clients = [c for c in self.clients if c.ready and not c.closed]
+        for client in clients:
+            client.send(message)
+
+    def schedule(self, delay, action):
+        with self.cond:
+            self.seq += 1
+            heapq.heappush(self.events, (time.time() + delay, self.seq, action))
+            self.cond.notify()
+
+    def schedule_traffic(self, kind):
+        """Poisson arrivals at rates[kind] packets/second across the whole mesh"""
+        rate = self.rates[kind]
+        if rate <= 0:
+            return
+
+        def emit():
+            self.generated += 1
+            self.deliver(self.random_packet(kind))
+            self.schedule(self.rng.expovariate(rate), emit)
+
+        self.schedule(self.rng.expovariate(rate), emit)
+
+    def run(self):
+        self.running = True
+        for kind in self.rates:
+            self.schedule_traffic(kind)
+        while self.running:
+            with self.cond:
+                while self.running and (not self.events or self.events[0][0] > time.time()):
+                    timeout = self.events[0][0] - time.time() if self.events else None
+                    self.cond.wait(timeout)
+                due = []
+                while self.events and self.events[0][0] <= time.time():
+                    due.append(heapq.heappop(self.events)[2])
+            for action in due:
+                action()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        with self.lock:
+            for client in self.clients:
+                client.close()
+
+    # --- transports ---------------------------------------------------------------
+
+    def add_client(self, client):
+        with self.lock:
+            self.clients.append(client)
+
+    def remove_client(self, client):
+        client.close()
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def serve_stream(self, read, write, name):
+        """Pump one byte stream until it closes"""
+        client = Client(write, name)
+        parser = FrameParser()
+        self.add_client(client)
+        try:
+            while self.running:
+                data = read()
+                if not data:
+                    break
+                for payload in parser.feed(data):
+                    self.handle_to_radio(client, payload)
+        except OSError:
+            pass
+        finally:
+            self.remove_client(client)
+
+    def open_pty(self, link=None):
+        """Create a pty; apps open the slave path as if it were the USB serial port"""
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        path = os.ttyname(slave)
+        if link:
+            if os.path.islink(link):
+                os.unlink(link)
+            os.symlink(path, link)
+
+        def pump():
+            # Keep the slave open so reads see data, not EOF, between app sessions
+            while self.running:
+                self.serve_stream(lambda: os.read(master, 4096), lambda data: os.write(master, data), 'pty')
+                time.sleep(0.1)
+
+        threading.Thread(target=pump, name="sim-pty", daemon=True).start()
+        return path, slave
+
+    def open_tcp(self, port=DEFAULT_TCP_PORT, host='127.0.0.1'):
+        mesh = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                mesh.serve_stream(lambda: self.request.recv(4096), self.request.sendall,
+                                  f"tcp:{self.client_address[1]}")
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        server = Server((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="sim-tcp", daemon=True).start()
+        return server
+
+    def stats(self):
+        with self.lock:
+            clients = [{'name': c.name, 'ready': c.ready, 'sent': c.sent, 'dropped': c.dropped}
+                       for c in self.clients]
+        return {'generated': self.generated, 'received': self.received, 'clients': clients}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Meshtastic device and mesh (StreamAPI over pty/TCP)")
+    parser.add_argument('--nodes', type=int, default=8, help="Virtual nodes besides our own")
+    parser.add_argument('--tcp-port', type=int, default=DEFAULT_TCP_PORT, help="0 disables TCP")
+    parser.add_argument('--bind', default='127.0.0.1')
+    parser.add_argument('--no-pty', action='store_true', help="TCP only")
+    parser.add_argument('--link', help="Symlink the pty here (e.g. /tmp/heltec-sim)")
+    parser.add_argument('--text-rate', type=float, default=0.05, help="Text messages per second, mesh-wide")
+    parser.add_argument('--position-rate', type=float, default=0.02, help="Position packets per second")
+    parser.add_argument('--telemetry-rate', type=float, default=0.02, help="Telemetry packets per second")
+    parser.add_argument('--ack-delay', type=float, default=1.5, help="Seconds per hop before an ack arrives")
+    parser.add_argument('--echo', action='store_true', help="Nodes reply to direct messages")
+    parser.add_argument('--region', default='US')
+    parser.add_argument('--preset', default='LONG_FAST')
+    parser.add_argument('--seed', type=int, help="Reproducible node set and traffic")
+    args = parser.parse_args()
+
+    mesh = SimulatedMesh(nodes=args.nodes, text_rate=args.text_rate, position_rate=args.position_rate,
+                         telemetry_rate=args.telemetry_rate, ack_delay=args.ack_delay, echo=args.echo,
+                         region=args.region, preset=args.preset, seed=args.seed)
+    mesh.running = True
+
+    print("🧪 Heltec V2 Mesh Simulator")
+    print("=" * 40)
+    print(f"📱 Our node: {mesh.me.long_name} (!{mesh.my_num:08x}) + {len(mesh.nodes)} virtual nodes")
+    if not args.no_pty:
+        path, _ = mesh.open_pty(args.link)
+        print(f"🔌 Serial (pty): {args.link or path}")
+    if args.tcp_port:
+        mesh.open_tcp(args.tcp_port, args.bind)
+        print(f"🌐 TCP: {args.bind}:{args.tcp_port}")
+    print(f"📡 Traffic/s: text {args.text_rate}, position {args.position_rate}, "
+          f"telemetry {args.telemetry_rate}")
+
+    def signal_handler(sig, frame):
+        print("\n🛑 Stopping simulator...")
+        print(f"📊 {mesh.stats()}")
+        mesh.stop()
+        if args.link and os.path.islink(args.link):
+            os.unlink(args.link)
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    mesh.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
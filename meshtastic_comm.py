@@ -4,11 +4,22 @@ Meshtastic Communication Script for Heltec V2
 Connects to the Heltastic device via serial or TCP/IP for messaging
 """
 
+import os
 import time
 import sys
 import signal
+import argparse
 import threading
 from datetime import datetime
+from queue import Queue, Empty
+
+import mesh_daemon
+import network_scanner
+from discovery_cache import DiscoveryCache
+import packet_handlers
+from mesh_client import MeshClient
+from mesh_json import JsonOutput, parse_input
+from receive_pipeline import ReceivePipeline
 
 try:
     import meshtastic
@@ -23,10 +34,17 @@ except ImportError:
     import meshtastic.serial_interface
     import meshtastic.tcp_interface
 
-class MeshtasticComm:
-    def __init__(self):
-        self.interface = None
-        self.running = False
+# How long the transport race waits for any endpoint to finish the handshake
+RACE_TIMEOUT = 30
+# Head start each endpoint gets before the next one joins the race
+RACE_STAGGER = 0.5
+
+class MeshtasticComm(MeshClient):
+    def __init__(self, output=None):
+        super().__init__(output)
+        self.cache = DiscoveryCache()
+        self.race_timings = {}
+        self.register_handlers()
         
     def find_serial_device(self):
         """Find the Heltec device on serial port"""
@@ -35,6 +53,8 @@ class MeshtasticComm:
         
         # Look for common ESP32 device patterns
         possible_ports = []
+        if os.path.exists(mesh_daemon.DEFAULT_DEVICE):
+            possible_ports.append(mesh_daemon.DEFAULT_DEVICE)
         
         # Check for specific device
         for port in serial.tools.list_ports.comports():
@@ -59,76 +79,189 @@ class MeshtasticComm:
         
         try:
             print(f"🔌 Connecting to {port}...")
+            started = time.time()
             self.interface = meshtastic.serial_interface.SerialInterface(port)
             print("✅ Serial connection established!")
+            self.remember('serial', port, time.time() - started)
             return True
         except Exception as e:
             print(f"❌ Serial connection failed: {e}")
+            self.cache.record_failure('serial', port)
             return False
     
+    def connect_daemon(self):
+        """Attach to a running mesh_daemon.py instead of opening the device"""
+        interface = mesh_daemon.connect_daemon()
+        if not interface:
+            return False
+        self.interface = interface
+        print(f"⚡ Attached to mesh daemon at {interface.socket_path}")
+        return True
+    
     def connect_tcp(self, ip="meshtastic.local"):
         """Connect via TCP/IP interface"""
         try:
             print(f"🌐 Connecting to {ip} via TCP...")
+            started = time.time()
             self.interface = meshtastic.tcp_interface.TCPInterface(hostname=ip)
             print("✅ TCP connection established!")
+            self.remember('tcp', ip, time.time() - started)
             return True
         except Exception as e:
             print(f"❌ TCP connection failed: {e}")
+            self.cache.record_failure('tcp', ip)
             return False
     
+    def remember(self, transport, endpoint, latency):
+        """Record a working endpoint so the next launch tries it first"""
+        try:
+            node_info = self.interface.getMyNodeInfo() or {}
+            node_id = node_info.get('user', {}).get('id')
+            self.cache.record_success(transport, endpoint, node_id=node_id, latency=latency)
+        except Exception as e:
+            print(f"⚠️  Could not update discovery cache: {e}")
+    
+    def connect_cached(self):
+        """Try last-known-good endpoints, most recent first"""
+        for entry in self.cache.candidates():
+            print(f"💾 Trying cached {entry['transport']} endpoint {entry['endpoint']}")
+            if entry['transport'] == 'tcp' and self.connect_tcp(entry['endpoint']):
+                return True
+            if entry['transport'] == 'serial' and self.connect_serial(entry['endpoint']):
+                return True
+        return False
+    
     def scan_wifi_devices(self):
         """Scan for Meshtastic devices on local network"""
-        import socket
-        import threading
-        import ipaddress
+        print("🔍 Scanning for WiFi-connected Meshtastic devices...")
         
-        def check_host(ip):
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(0.5)
-                result = sock.connect_ex((str(ip), 4403))  # Meshtastic TCP port
-                sock.close()
-                if result == 0:
-                    print(f"🎯 Found Meshtastic device at {ip}:4403")
-                    return str(ip)
-            except:
-                pass
-            return None
+        def report(result):
+            print(f"🎯 Found Meshtastic device at {result['ip']}:4403")
         
-        print("🔍 Scanning for WiFi-connected Meshtastic devices...")
+        # Only the API port matters for connecting, skip the HTTP checks
+        found = network_scanner.scan_networks(
+            on_result=report,
+            ports=(network_scanner.API_PORT,),
+            http=False,
+        )
+        return [result['ip'] for result in found]
+    
+    def open_endpoint(self, transport, endpoint):
+        """Open an interface without touching self.interface (used by the race)"""
+        if transport == 'tcp':
+            return meshtastic.tcp_interface.TCPInterface(hostname=endpoint)
+        return meshtastic.serial_interface.SerialInterface(endpoint)
+    
+    def race_candidates(self):
+        """Endpoints to race: cached first, then mDNS and every serial port"""
+        candidates = [(e['transport'], e['endpoint']) for e in self.cache.candidates()]
+        candidates.append(('tcp', 'meshtastic.local'))
+        candidates.extend(('serial', port) for port in sorted(self.find_serial_device()))
+        return list(dict.fromkeys(candidates))
+    
+    def connect_race(self, timeout=RACE_TIMEOUT, stagger=RACE_STAGGER):
+        """Happy-eyeballs connect: start endpoints `stagger` seconds apart (sooner
+        when one fails) and keep the first handshake"""
+        candidates = self.race_candidates()
+        print(f"🏁 Racing {len(candidates)} endpoints...")
         
-        # Get local network
-        hostname = socket.gethostname()
-        local_ip = socket.gethostbyname(hostname)
-        network = ipaddress.IPv4Network(f"{local_ip}/24", strict=False)
+        self.race_timings = {c: {'state': 'pending', 'seconds': None} for c in candidates}
+        started = time.time()
+        finished = Queue()
+        lock = threading.Lock()
+        race = {'winner': None, 'over': False}
         
-        threads = []
-        found_devices = []
+        def attempt(candidate):
+            timing = self.race_timings[candidate]
+            try:
+                interface = self.open_endpoint(*candidate)
+            except Exception as e:
+                timing.update(state=f"failed: {e}", seconds=time.time() - started)
+                finished.put(candidate)
+                return
+            timing['seconds'] = time.time() - started
+            with lock:
+                won = race['winner'] is None and not race['over']
+                if won:
+                    race['winner'] = (candidate, interface)
+            if not won:
+                # Finished after the race was decided: close it straight away
+                timing['state'] = 'lost'
+                try:
+                    interface.close()
+                except Exception:
+                    pass
+            finished.put(candidate)
         
-        def worker(ip):
-            result = check_host(ip)
-            if result:
-                found_devices.append(result)
+        # Daemon threads: a handshake that never returns must not block exit
+        pending = list(candidates)
+        running = 0
+        deadline = started + timeout
+        while (pending or running) and race['winner'] is None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                print(f"⏰ No endpoint finished the handshake within {timeout}s")
+                break
+            wait = remaining
+            if pending:
+                candidate = pending.pop(0)
+                threading.Thread(target=attempt, args=(candidate,), daemon=True,
+                                 name=f"race-{candidate[0]}").start()
+                running += 1
+                wait = min(stagger, remaining)
+            try:
+                finished.get(timeout=wait)
+                running -= 1
+            except Empty:
+                pass
         
-        # Scan network
-        for ip in list(network.hosts())[:50]:  # Scan first 50 IPs
-            thread = threading.Thread(target=worker, args=(ip,))
-            thread.daemon = True
-            thread.start()
-            threads.append(thread)
+        with lock:
+            race['over'] = True
+            winner, self.interface = race['winner'] or (None, self.interface)
         
-        # Wait for all threads
-        for thread in threads:
-            thread.join(timeout=2)
+        for candidate in pending:
+            self.race_timings[candidate]['state'] = 'not started'
+        for candidate, timing in self.race_timings.items():
+            if candidate != winner and timing['state'] == 'pending':
+                # Still handshaking; closed by its thread if it ever connects
+                timing['state'] = 'abandoned'
         
-        return found_devices
+        if winner:
+            self.race_timings[winner]['state'] = 'won'
+            self.remember(winner[0], winner[1], self.race_timings[winner]['seconds'])
+        self.report_race()
+        return winner is not None
+    
+    def report_race(self):
+        """Print how long each transport took"""
+        print("⏱️  Transport timings:")
+        for (transport, endpoint), timing in self.race_timings.items():
+            seconds = f"{timing['seconds']:.2f}s" if timing['seconds'] is not None else "-"
+            print(f"   {transport:6} {endpoint:28} {seconds:>8}  {timing['state']}")
     
-    def connect(self):
+    def connect(self, race=False):
         """Connect to device (try TCP first, then serial)"""
         print("🚀 Starting Meshtastic Communication")
         print("=" * 50)
         
+        if not self.open_link(race):
+            return False
+        self.start_store()
+        return True
+    
+    def open_link(self, race=False):
+        """Attach to the daemon or open the device directly"""
+        # A running daemon already holds the link
+        if self.connect_daemon():
+            return True
+        
+        if race:
+            return self.connect_race()
+        
+        # Last-known-good endpoint skips the scan entirely
+        if self.connect_cached():
+            return True
+        
         # Try to find WiFi devices first
         wifi_devices = self.scan_wifi_devices()
         if wifi_devices:
@@ -170,13 +303,13 @@ class MeshtasticComm:
                 print(f"📡 Channel Utilization: {nodeInfo.get('deviceMetrics', {}).get('channelUtilization', 'Unknown')}%")
                 print(f"🌐 Wifi Enabled: {nodeInfo.get('user', {}).get('isLicensed', False)}")
             
-            # Get mesh info
-            nodes = self.interface.nodes
-            print(f"\n🌐 Mesh Network: {len(nodes)} nodes discovered")
+            # Get mesh info (index is kept current from received packets)
+            self.load_nodes()
+            self.output.emit('nodes', node=nodeInfo, nodes=self.node_index.recent())
+            print(f"\n🌐 Mesh Network: {len(self.node_index)} nodes discovered")
             
-            for nodeId, node in nodes.items():
+            for node in self.node_index.recent():
                 user = node.get('user', {})
-                pos = node.get('position', {})
                 lastHeard = node.get('lastHeard', 0)
                 
                 if lastHeard:
@@ -201,40 +334,63 @@ class MeshtasticComm:
             else:
                 print(f"📢 Broadcasting: {text}")
                 
-            self.interface.sendText(text, destinationId=destination)
-            print("✅ Message sent!")
+            delivery = self.queue_message(text, destination)
+            self.output.emit('queued', text=text, destination=delivery.destination,
+                             coalesced=bool(delivery.attempts[-1].coalesced))
+            if delivery.attempts[-1].coalesced:
+                print("♻️  Same message already queued")
             return True
             
         except Exception as e:
             print(f"❌ Failed to send message: {e}")
             return False
     
+    def register_handlers(self):
+        """Default handlers for text, position and telemetry packets"""
+        def on_text(packet, decoded):
+            text = decoded.get('text')
+            if text:
+                timestamp = datetime.now().strftime('%H:%M:%S')
+                print(f"[{timestamp}] 📥 From {packet.get('fromId', 'Unknown')}: {text}")
+        
+        def on_position(packet, decoded):
+            position = decoded.get('position', {})
+            if 'latitude' in position and 'longitude' in position:
+                print(f"📍 {packet.get('fromId', 'Unknown')} at "
+                      f"{position['latitude']:.5f}, {position['longitude']:.5f}")
+        
+        def on_telemetry(packet, decoded):
+            metrics = decoded.get('telemetry', {}).get('deviceMetrics')
+            if metrics:
+                print(f"🔋 {packet.get('fromId', 'Unknown')}: "
+                      f"battery {metrics.get('batteryLevel', '?')}%, "
+                      f"channel util {metrics.get('channelUtilization', '?')}%")
+        
+        self.handlers.register(packet_handlers.TEXT_MESSAGE, on_text)
+        self.handlers.register(packet_handlers.POSITION, on_position)
+        self.handlers.register(packet_handlers.TELEMETRY, on_telemetry)
+        if self.output.enabled:
+            self.handlers.register(packet_handlers.ANY, self.emit_packet)
+    
     def start_listening(self):
         """Start listening for messages"""
         print("\n👂 Listening for messages... (Ctrl+C to stop)")
         print("-" * 40)
         
-        def on_receive(packet, interface):
-            try:
-                if packet.get('decoded', {}).get('text'):
-                    text = packet['decoded']['text']
-                    fromId = packet.get('fromId', 'Unknown')
-                    timestamp = datetime.now().strftime('%H:%M:%S')
-                    print(f"[{timestamp}] 📥 From {fromId}: {text}")
-                    
-            except Exception as e:
-                print(f"❌ Error processing message: {e}")
-        
-        # Subscribe to messages
-        self.interface.onReceive(on_receive)
+        self.start_store()
+        self.load_nodes()
+        self.pipeline = ReceivePipeline(self.interface).start()
         self.running = True
         
+        # Blocks on the queue, wakes only when a packet arrives
         try:
-            while self.running:
-                time.sleep(0.1)
+            for packet in self.pipeline:
+                self.handlers.dispatch(packet)
         except KeyboardInterrupt:
             print("\n👋 Stopping...")
+        finally:
             self.running = False
+            self.pipeline.stop()
     
     def interactive_mode(self):
         """Interactive messaging mode"""
@@ -246,6 +402,11 @@ class MeshtasticComm:
         print("  anything else - Send as message")
         print()
         
+        # Incoming packets print and keep the node index current meanwhile
+        self.load_nodes()
+        self.pipeline = ReceivePipeline(self.interface)
+        self.pipeline.run_dispatcher(self.handlers.dispatch)
+        
         while True:
             try:
                 user_input = input("📝 Message: ").strip()
@@ -255,20 +416,31 @@ class MeshtasticComm:
                 elif user_input.lower() == '/info':
                     self.get_node_info()
                 elif user_input:
-                    self.send_message(user_input)
+                    request = parse_input(user_input, self.output.enabled)
+                    if request:
+                        self.send_message(*request)
                     
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, EOFError):
                 break
         
         print("\n👋 Goodbye!")
     
     def close(self):
         """Close connection"""
+        self.output.emit('closed')
+        self.stop_services()
         if self.interface:
             self.interface.close()
 
 def main():
-    comm = MeshtasticComm()
+    parser = argparse.ArgumentParser(description="Meshtastic communication for Heltec V2")
+    parser.add_argument('--race', action='store_true',
+                        help="Race TCP and serial concurrently, keep the first to connect")
+    parser.add_argument('--json', action='store_true',
+                        help="Emit NDJSON events on stdout (human output goes to stderr)")
+    args = parser.parse_args()
+    
+    comm = MeshtasticComm(output=JsonOutput(args.json))
     
     # Set up signal handler for clean exit
     def signal_handler(sig, frame):
@@ -280,10 +452,13 @@ def main():
     signal.signal(signal.SIGINT, signal_handler)
     
     # Connect to device
-    if not comm.connect():
+    if not comm.connect(race=args.race):
         print("❌ Failed to connect to Meshtastic device")
         print("💡 Make sure the device is connected via USB or WiFi")
+        comm.output.emit('error', message="Failed to connect to Meshtastic device")
         return 1
+    comm.output.emit('connected', daemon=isinstance(comm.interface, mesh_daemon.DaemonInterface),
+                     race=comm.race_timings or None)
     
     # Get initial info
     comm.get_node_info()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Message Store
+SQLite (WAL) history of received packets with batched background writes
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from queue import Queue, Full, Empty
+
+from mesh_daemon import STATE_DIR, to_jsonable
+from packet_handlers import packet_portnum, TEXT_MESSAGE
+
+DEFAULT_PATH = os.environ.get('HELTEC_MESSAGE_DB', os.path.join(STATE_DIR, 'messages.db'))
+
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 0.5       # seconds a partial batch may wait before it is written
+QUEUE_SIZE = 10000
+RETENTION_DAYS = 30
+COMPACT_INTERVAL = 3600    # seconds between retention passes in the writer thread
+STOP_TIMEOUT = 10          # seconds stop() waits for the writer to take the stop marker
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packets (
+    id INTEGER PRIMARY KEY,
+    packet_id INTEGER,
+    rx_time REAL NOT NULL,
+    device_time REAL,
+    from_num INTEGER,
+    from_id TEXT,
+    to_num INTEGER,
+    to_id TEXT,
+    channel INTEGER NOT NULL DEFAULT 0,
+    portnum TEXT,
+    text TEXT,
+    rx_snr REAL,
+    rx_rssi INTEGER,
+    hop_limit INTEGER,
+    hop_start INTEGER,
+    decoded TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_packets_from_time ON packets(from_id, rx_time);
+CREATE INDEX IF NOT EXISTS idx_packets_time ON packets(rx_time);
+CREATE INDEX IF NOT EXISTS idx_packets_channel_time ON packets(channel, rx_time);
+CREATE INDEX IF NOT EXISTS idx_packets_portnum_time ON packets(portnum, rx_time);
+"""
+
+COLUMNS = ('packet_id', 'rx_time', 'device_time', 'from_num', 'from_id', 'to_num', 'to_id', 'channel',
+           'portnum', 'text', 'rx_snr', 'rx_rssi', 'hop_limit', 'hop_start', 'decoded')
+
+_STOP = object()
+INCREMENTAL = 2            # PRAGMA auto_vacuum value
+
+
+def packet_row(packet, received_at=None):
+    """Flatten a packet dict into a packets table row
+
+    rx_time is when we received the packet; the radio's own clock (rxTime) is
+    often unset or wrong, so it is only kept alongside as device_time
+    """
+    portnum, decoded = packet_portnum(packet)
+    decoded = decoded or {}
+    return (
+        packet.get('id'),
+        received_at or time.time(),
+        packet.get('rxTime'),
+        packet.get('from'),
+        packet.get('fromId'),
+        packet.get('to'),
+        packet.get('toId'),
+        packet.get('channel', 0),
+        portnum,
+        decoded.get('text'),
+        packet.get('rxSnr'),
+        packet.get('rxRssi'),
+        packet.get('hopLimit'),
+        packet.get('hopStart'),
+        json.dumps(to_jsonable(decoded), separators=(',', ':')) if decoded else None,
+    )
+
+
+class MessageStore:
+    def __init__(self, path=DEFAULT_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 retention_days=RETENTION_DAYS, compact_interval=COMPACT_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.compact_interval = compact_interval
+        self.queue = Queue(maxsize=QUEUE_SIZE)
+        self.written = 0
+        self.dropped = 0
+        self.compacted = 0
+        self.last_error = None
+        self.writer = None
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.read_conn = self._connect()
+        self.read_conn.executescript(SCHEMA)
+        columns = {row['name'] for row in self.read_conn.execute("PRAGMA table_info(packets)")}
+        if 'device_time' not in columns:
+            self.read_conn.execute("ALTER TABLE packets ADD COLUMN device_time REAL")
+        self.read_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # Has to precede WAL and the schema, so it only takes effect on a new
+        # database; older ones are converted by the first compact() that deletes rows
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def start(self):
+        """Start the background writer thread"""
+        if not self.writer:
+            self.writer = threading.Thread(target=self._write_loop, name="message-store", daemon=True)
+            self.writer.start()
+        return self
+
+    def add(self, packet):
+        """Queue a packet for storage; never blocks the caller"""
+        try:
+            self.queue.put_nowait((packet, time.time()))
+        except Full:
+            self.dropped += 1
+
+    def handler(self, packet, decoded):
+        """HandlerRegistry-compatible entry point (register under ANY)"""
+        self.add(packet)
+
+    def _write_loop(self):
+        conn = self._connect()
+        # Retention runs once at start and then on a timer, so a long-lived
+        # writer (the daemon's) never grows the database without bound
+        next_compact = time.time()
+        stopping = False
+        while not stopping:
+            if self.compact_interval and time.time() >= next_compact:
+                self._retention_pass()
+                next_compact = time.time() + self.compact_interval
+            try:
+                item = self.queue.get(timeout=self.compact_interval or None)
+            except Empty:
+                continue
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.time() + self.flush_interval
+
+            # Gather more rows until the batch is full or the deadline passes
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.time()))
+                except Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            rows = []
+            for packet, received_at in batch:
+                try:
+                    rows.append(packet_row(packet, received_at))
+                except Exception:
+                    self.dropped += 1
+            try:
+                with conn:
+                    conn.executemany(
+                        f"INSERT INTO packets ({', '.join(COLUMNS)}) "
+                        f"VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+            except sqlite3.Error as e:
+                # e.g. "database is locked" while another process holds the DB;
+                # lose this batch but keep draining the queue
+                self.dropped += len(rows)
+                self.last_error = e
+                print(f"⚠️  Message store write failed, dropped {len(rows)} packets: {e}",
+                      file=sys.stderr)
+                continue
+            self.written += len(rows)
+        conn.close()
+
+    def _retention_pass(self):
+        try:
+            self.compacted += self.compact(self.retention_days)
+        except sqlite3.Error as e:
+            self.last_error = e
+            print(f"⚠️  Message store compaction failed: {e}", file=sys.stderr)
+
+    def stop(self):
+        """Flush pending rows and stop the writer"""
+        if self.writer:
+            try:
+                # A full queue drains while the writer runs; a stuck writer must
+                # not hang shutdown
+                self.queue.put(_STOP, timeout=STOP_TIMEOUT)
+            except Full:
+                print(f"⚠️  Message store writer not draining, {self.queue.qsize()} packets not saved",
+                      file=sys.stderr)
+            else:
+                self.writer.join(timeout=STOP_TIMEOUT)
+            self.writer = None
+
+    def close(self):
+        self.stop()
+        self.read_conn.close()
+
+    def _query(self, sql, params=()):
+        with self.read_lock:
+            return [dict(row) for row in self.read_conn.execute(sql, params)]
+
+    def last_messages(self, from_id=None, limit=20, portnum=TEXT_MESSAGE):
+        """Most recent packets, newest first, optionally from one node"""
+        clauses, params = [], []
+        if from_id:
+            clauses.append("from_id = ?")
+            params.append(from_id)
+        if portnum:
+            clauses.append("portnum = ?")
+            params.append(portnum)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            f"SELECT * FROM packets {where} ORDER BY rx_time DESC LIMIT ?", params + [limit])
+
+    def time_range(self, start, end=None, from_id=None, channel=None, portnum=None, limit=None):
+        """Packets with start <= rx_time < end, oldest first"""
+        clauses, params = ["rx_time >= ?"], [start]
+        if end is not None:
+            clauses.append("rx_time < ?")
+            params.append(end)
+        for column, value in (('from_id', from_id), ('channel', channel), ('portnum', portnum)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        sql = f"SELECT * FROM packets WHERE {' AND '.join(clauses)} ORDER BY rx_time"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, params)
+
+    def count(self):
+        return self._query("SELECT COUNT(*) AS n FROM packets")[0]['n']
+
+    def compact(self, retention_days=RETENTION_DAYS, max_rows=None):
+        """Delete old rows, then checkpoint the WAL and release the freed pages"""
+        with self.read_lock:
+            with self.read_conn:
+                deleted = self.read_conn.execute(
+                    "DELETE FROM packets WHERE rx_time < ?",
+                    (time.time() - retention_days * 86400,)).rowcount
+                if max_rows:
+                    deleted += self.read_conn.execute(
+                        "DELETE FROM packets WHERE id <= "
+                        "(SELECT id FROM packets ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (max_rows,)).rowcount
+            self.read_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if deleted:
+                if self.read_conn.execute("PRAGMA auto_vacuum").fetchone()[0] == INCREMENTAL:
+                    # Drops only the free pages instead of rewriting the whole file;
+                    # executescript runs it to completion (execute frees one page per step)
+                    self.read_conn.executescript("PRAGMA incremental_vacuum;")
+                else:
+                    # One-time conversion of a database created before auto_vacuum
+                    self.read_conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                    self.read_conn.execute("VACUUM")
+        return deleted
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'compacted': self.compacted,
+                'queued': self.queue.qsize(),
+                'last_error': str(self.last_error) if self.last_error else None}
+
+
+def parse_since(value):
+    """Accept an epoch timestamp or a relative age like 30m, 2h, 7d"""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if value[-1] in units:
+        return time.time() - float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the stored mesh message history")
+    parser.add_argument('--db', default=DEFAULT_PATH)
+    parser.add_argument('--from', dest='from_id', help="Only packets from this node id (e.g. !a1b2c3d4)")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--since', help="Time-range scan start: epoch or age like 2h")
+    parser.add_argument('--until', help="Time-range scan end: epoch or age like 1h")
+    parser.add_argument('--portnum', default=TEXT_MESSAGE, help="Portnum filter ('' for all)")
+    parser.add_argument('--compact', action='store_true', help=f"Drop rows older than {RETENTION_DAYS} days")
+    args = parser.parse_args()
+
+    store = MessageStore(args.db)
+    if args.compact:
+        print(f"🧹 Removed {store.compact()} old packets")
+        return 0
+
+    portnum = args.portnum or None
+    if args.since:
+        rows = store.time_range(parse_since(args.since),
+                                parse_since(args.until) if args.until else None,
+                                from_id=args.from_id, portnum=portnum, limit=args.limit)
+    else:
+        rows = list(reversed(store.last_messages(args.from_id, args.limit, portnum)))
+
+    print(f"📚 {len(rows)} of {store.count()} stored packets")
+    for row in rows:
+        timestamp = datetime.fromtimestamp(row['rx_time']).strftime('%Y-%m-%d %H:%M:%S')
+        body = row['text'] if row['text'] is not None else row['portnum']
+        print(f"[{timestamp}] {row['from_id'] or row['from_num']}: {body}")
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
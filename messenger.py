@@ -7,8 +7,16 @@ Simple messaging interface for your Heltec V2 board
 import sys
 import time
 import signal
-import threading
+import argparse
 from datetime import datetime
+from contextlib import closing
+
+import mesh_daemon
+import packet_handlers
+from message_store import MessageStore
+from mesh_client import MeshClient
+from mesh_json import JsonOutput, parse_input
+from receive_pipeline import ReceivePipeline
 
 try:
     import meshtastic
@@ -20,19 +28,22 @@ except ImportError:
     import meshtastic
     import meshtastic.serial_interface
 
-class HeltecMessenger:
-    def __init__(self):
-        self.interface = None
-        self.running = False
+class HeltecMessenger(MeshClient):
+    def __init__(self, output=None):
+        super().__init__(output)
         self.message_count = 0
         
     def connect(self):
         """Connect to Heltec device"""
-        device_path = "/dev/cu.usbserial-0001"
+        device_path = mesh_daemon.DEFAULT_DEVICE
         
         try:
-            print(f"🔌 Connecting to Heltec V2...")
-            self.interface = meshtastic.serial_interface.SerialInterface(device_path)
+            self.interface = mesh_daemon.connect_daemon()
+            if self.interface:
+                print("⚡ Attached to mesh daemon")
+            else:
+                print("🔌 Connecting to Heltec V2...")
+                self.interface = meshtastic.serial_interface.SerialInterface(device_path)
             print("✅ Connected successfully!")
             
             # Get device info
@@ -42,8 +53,8 @@ class HeltecMessenger:
                 print(f"📱 Device: {user.get('longName', 'Unknown')} ({user.get('id', 'Unknown')})")
                 
                 # Show mesh network
-                nodes = self.interface.nodes
-                print(f"🌐 Connected to mesh with {len(nodes)} nodes")
+                self.load_nodes()
+                print(f"🌐 Connected to mesh with {len(self.node_index)} nodes")
                 
             return True
             
@@ -53,37 +64,27 @@ class HeltecMessenger:
     
     def start_message_listener(self):
         """Start background message listener"""
-        def message_thread():
-            print("👂 Listening for messages...")
-            
-            def on_receive(packet, interface_obj):
-                try:
-                    # Check if it's a text message
-                    if packet.get('decoded', {}).get('text'):
-                        text_msg = packet['decoded']['text']
-                        from_id = packet.get('fromId', 'Unknown')
-                        timestamp = datetime.now().strftime('%H:%M:%S')
-                        
-                        # Show received message
-                        print(f"\n📥 [{timestamp}] From {from_id}: {text_msg}")
-                        print("💬 Your message: ", end="", flush=True)
-                        
-                except Exception:
-                    pass
-            
-            # Subscribe to messages  
-            try:
-                sub = self.interface.subscribe()
-                for msg in sub:
-                    if not self.running:
-                        break
-                    on_receive(msg, self.interface)
-            except Exception:
-                pass
+        print("👂 Listening for messages...")
+        
+        def on_text(packet, decoded):
+            text_msg = decoded.get('text')
+            if text_msg:
+                from_id = packet.get('fromId', 'Unknown')
+                timestamp = datetime.now().strftime('%H:%M:%S')
+                
+                # Show received message
+                print(f"\n📥 [{timestamp}] From {from_id}: {text_msg}")
+                print("💬 Your message: ", end="", flush=True)
         
-        # Start listener thread
-        listener = threading.Thread(target=message_thread, daemon=True)
-        listener.start()
+        self.handlers.register(packet_handlers.TEXT_MESSAGE, on_text)
+        if self.output.enabled:
+            self.handlers.register(packet_handlers.ANY, self.emit_packet)
+        
+        self.start_store()
+        
+        # Packets are queued by the reader thread and handled on the dispatcher
+        self.pipeline = ReceivePipeline(self.interface)
+        self.pipeline.run_dispatcher(self.handlers.dispatch)
     
     def send_message(self, text, destination=None):
         """Send a message to the mesh"""
@@ -96,25 +97,35 @@ class HeltecMessenger:
             else:
                 print(f"📢 Broadcasting: {text}")
                 
-            self.interface.sendText(text, destinationId=destination)
-            self.message_count += 1
-            print(f"✅ Message #{self.message_count} sent!")
+            delivery = self.queue_message(text, destination)
+            self.output.emit('queued', text=text, destination=delivery.destination,
+                             coalesced=bool(delivery.attempts[-1].coalesced))
+            if delivery.attempts[-1].coalesced:
+                print("♻️  Same message already queued")
+            else:
+                self.message_count += 1
             return True
             
         except Exception as e:
             print(f"❌ Send failed: {e}")
             return False
     
-    def show_mesh_nodes(self):
-        """Show all nodes in the mesh"""
+    def show_mesh_nodes(self, minutes=None):
+        """Show all nodes in the mesh (or only those heard recently)"""
         if not self.interface:
             return
-            
-        nodes = self.interface.nodes
-        print(f"\n🌐 Mesh Network ({len(nodes)} nodes):")
+        
+        self.load_nodes()
+        if minutes:
+            nodes = self.node_index.heard_since(minutes * 60)
+            print(f"\n🌐 Heard in the last {minutes} min ({len(nodes)} of {len(self.node_index)} nodes):")
+        else:
+            nodes = self.node_index.recent()
+            print(f"\n🌐 Mesh Network ({len(nodes)} nodes):")
         print("-" * 40)
+        self.output.emit('nodes', minutes=minutes, nodes=nodes)
         
-        for node in nodes.values():
+        for node in nodes:
             user = node.get('user', {})
             name = user.get('longName', user.get('shortName', 'Unknown'))
             node_id = user.get('id', 'Unknown')
@@ -133,8 +144,9 @@ class HeltecMessenger:
         print("\n💬 Interactive Chat Mode")
         print("=" * 40)
         print("Commands:")
-        print("  /nodes   - Show mesh nodes")
+        print("  /nodes   - Show mesh nodes (/nodes 15 = heard in last 15 min)")
         print("  /status  - Show device status") 
+        print("  /history - Show recent messages (stored across restarts)")
         print("  /help    - Show this help")
         print("  /quit    - Exit")
         print("  Anything else - Send as message to mesh")
@@ -153,28 +165,58 @@ class HeltecMessenger:
                         
                     if user_input.lower() in ['/quit', '/exit', '/q']:
                         break
-                    elif user_input.lower() == '/nodes':
-                        self.show_mesh_nodes()
+                    elif user_input.lower().startswith('/nodes'):
+                        parts = user_input.split()
+                        minutes = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+                        self.show_mesh_nodes(minutes)
                     elif user_input.lower() == '/status':
                         self.show_status()
+                    elif user_input.lower() == '/history':
+                        self.show_history()
                     elif user_input.lower() == '/help':
                         print("\nCommands:")
                         print("  /nodes   - Show mesh nodes")
                         print("  /status  - Show device status")
+                        print("  /history - Show recent messages")
                         print("  /quit    - Exit")
                         print("  Text     - Send message to mesh")
                     else:
-                        self.send_message(user_input)
+                        request = parse_input(user_input, self.output.enabled)
+                        if request:
+                            self.send_message(*request)
                         
-                except KeyboardInterrupt:
+                except (KeyboardInterrupt, EOFError):
                     break
                     
         except Exception as e:
             print(f"❌ Chat error: {e}")
         
         self.running = False
+        if self.pipeline:
+            self.pipeline.stop()
         print("\n👋 Chat ended!")
     
+    def show_history(self, limit=20):
+        """Show the most recent stored text messages"""
+        try:
+            if isinstance(self.interface, mesh_daemon.DaemonInterface):
+                rows = self.interface.history(limit=limit)
+            elif self.store:
+                rows = self.store.last_messages(limit=limit)
+            else:
+                with closing(MessageStore()) as store:
+                    rows = store.last_messages(limit=limit)
+        except Exception as e:
+            print(f"❌ History error: {e}")
+            return
+        
+        self.output.emit('history', messages=rows)
+        print(f"\n📚 Last {len(rows)} messages:")
+        print("-" * 40)
+        for row in reversed(rows):
+            time_str = datetime.fromtimestamp(row['rx_time']).strftime('%m-%d %H:%M:%S')
+            print(f"  [{time_str}] {row['from_id'] or row['from_num']}: {row['text']}")
+    
     def show_status(self):
         """Show current device status"""
         if not self.interface:
@@ -205,18 +247,47 @@ class HeltecMessenger:
                         hours = uptime // 3600
                         minutes = (uptime % 3600) // 60
                         print(f"⏰ Uptime: {hours}h {minutes}m")
+                
+                self.show_battery_history(user.get('id'))
             
             # Network info
-            nodes = self.interface.nodes
-            print(f"🌐 Mesh nodes: {len(nodes)}")
+            self.load_nodes()
+            print(f"🌐 Mesh nodes: {len(self.node_index)}")
+            self.output.emit('status', node=node_info, meshNodes=len(self.node_index),
+                             messagesSent=self.message_count,
+                             delivery=self.tracker.stats() if self.tracker else None)
             print(f"📨 Messages sent: {self.message_count}")
-            
+            if self.tracker:
+                stats = self.tracker.stats()
+                print(f"📬 Delivered: {stats['acked']}, failed: {stats['failed']}, retries: {stats['retries']}")
+                latency = stats['latency']
+                if latency['p50'] is not None:
+                    print(f"⏱️  Delivery time p50/p95/p99: "
+                          f"{latency['p50']:.1f}s / {latency['p95']:.1f}s / {latency['p99']:.1f}s")
+
         except Exception as e:
             print(f"❌ Status error: {e}")
     
+    def show_battery_history(self, node_id, hours=24):
+        """Battery range over the last day from the daemon's telemetry recorder"""
+        if not node_id or not isinstance(self.interface, mesh_daemon.DaemonInterface):
+            return
+        try:
+            result = self.interface.telemetry(node_id, 'device.batteryLevel',
+                                              since=time.time() - hours * 3600, resolution='1h')
+        except Exception:
+            return
+        points = result.get('points') or []
+        if points:
+            low = min(p['min'] for p in points)
+            high = max(p['max'] for p in points)
+            print(f"📉 Battery last {hours}h: {low:.0f}% - {high:.0f}% ({len(points)} hourly points)")
+    
     def close(self):
         """Close connection"""
+        self.output.emit('closed')
         self.running = False
+        self.stop_services()
         if self.interface:
             try:
                 self.interface.close()
@@ -224,12 +295,18 @@ class HeltecMessenger:
                 pass
 
 def main():
+    parser = argparse.ArgumentParser(description="Interactive Heltec V2 mesh messenger")
+    parser.add_argument('--json', action='store_true',
+                        help="Emit NDJSON events on stdout (human output goes to stderr)")
+    args = parser.parse_args()
+    output = JsonOutput(args.json)
+    
     print("🚀 Heltec V2 Meshtastic Messenger")
     print("=" * 40)
     print("💡 Your Heltec V2 board with AppleNet WiFi")
     print()
     
-    messenger = HeltecMessenger()
+    messenger = HeltecMessenger(output=output)
     
     # Handle clean exit
     def signal_handler(sig, frame):
@@ -243,7 +320,9 @@ def main():
     if not messenger.connect():
         print("\n❌ Could not connect to Heltec V2")
         print("💡 Make sure the device is plugged in via USB")
+        messenger.output.emit('error', message="Could not connect to Heltec V2")
         return 1
+    messenger.output.emit('connected', daemon=isinstance(messenger.interface, mesh_daemon.DaemonInterface))
     
     # Show initial status
     messenger.show_status()
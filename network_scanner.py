@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Network Scanner
+Asyncio subnet scanner for Meshtastic devices (API port 4403, HTTP and HTTPS)
+"""
+
+import sys
+import ssl
+import socket
+import asyncio
+import argparse
+import ipaddress
+
+API_PORT = 4403
+HTTP_PORT = 80
+HTTPS_PORT = 443
+MESHTASTIC_PORTS = (API_PORT, HTTP_PORT, HTTPS_PORT)
+
+# Widest subnet scanned per interface (/20 = 4094 hosts)
+MIN_PREFIX = 20
+MAX_PREFIX = 24
+
+DEFAULT_CONCURRENCY = 256
+DEFAULT_TIMEOUT = 0.5
+HTTP_TIMEOUT = 2.0
+
+
+def local_addresses():
+    """Return the IPv4 addresses of this machine's non-loopback interfaces"""
+    addresses = set()
+
+    # The address the default route would use
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect(("8.8.8.8", 80))
+        addresses.add(sock.getsockname()[0])
+        sock.close()
+    except OSError:
+        pass
+
+    # Everything the hostname resolves to (covers extra interfaces)
+    try:
+        for address in socket.gethostbyname_ex(socket.gethostname())[2]:
+            addresses.add(address)
+    except OSError:
+        pass
+
+    return sorted(a for a in addresses if not a.startswith('127.'))
+
+
+def local_networks(prefix=MAX_PREFIX):
+    """Return one IPv4 network per local interface at the given prefix length"""
+    prefix = max(MIN_PREFIX, min(MAX_PREFIX, prefix))
+    networks = []
+    for address in local_addresses():
+        network = ipaddress.IPv4Network(f"{address}/{prefix}", strict=False)
+        if network not in networks:
+            networks.append(network)
+    return networks
+
+
+def iter_hosts(networks):
+    """Yield every host address once, even if networks overlap"""
+    seen = set()
+    for network in networks:
+        for ip in network.hosts():
+            if ip not in seen:
+                seen.add(ip)
+                yield str(ip)
+
+
+async def probe_port(ip, port, timeout=DEFAULT_TIMEOUT):
+    """Return True if a TCP connection to ip:port succeeds"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def fetch_http(ip, port, timeout=HTTP_TIMEOUT):
+    """Fetch / from ip:port, returns (status, body) or None"""
+    context = None
+    if port == HTTPS_PORT:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(ip, port, ssl=context), timeout)
+    except (OSError, ssl.SSLError, asyncio.TimeoutError):
+        return None
+
+    try:
+        writer.write(f"GET / HTTP/1.0\r\nHost: {ip}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(4096), timeout)
+    except (OSError, ssl.SSLError, asyncio.TimeoutError):
+        return None
+    finally:
+        writer.close()
+
+    head, _, body = data.partition(b"\r\n\r\n")
+    try:
+        status = int(head.split(b" ", 2)[1])
+    except (IndexError, ValueError):
+        return None
+    return status, body.decode('utf-8', errors='replace')
+
+
+async def check_host(ip, ports=MESHTASTIC_PORTS, timeout=DEFAULT_TIMEOUT, http=True, semaphore=None):
+    """Probe one host, returns a result dict or None if nothing answered"""
+    semaphore = semaphore or asyncio.Semaphore(len(ports))
+
+    async def bounded_probe(port):
+        async with semaphore:
+            return await probe_port(ip, port, timeout)
+
+    open_ports = await asyncio.gather(*(bounded_probe(port) for port in ports))
+    open_ports = [port for port, is_open in zip(ports, open_ports) if is_open]
+    if not open_ports:
+        return None
+
+    result = {'ip': ip, 'ports': open_ports, 'api': API_PORT in open_ports}
+
+    # Only hosts with an open web port get the (slower) HTTP check
+    if http:
+        for port, key in ((HTTP_PORT, 'web'), (HTTPS_PORT, 'https')):
+            if port not in open_ports:
+                continue
+            async with semaphore:
+                response = await fetch_http(ip, port)
+            if response:
+                status, body = response
+                result[key] = 'meshtastic' in body.lower() or status == 200
+                if key == 'web' and result[key]:
+                    result['web_content'] = body[:200]
+
+    if not (result['api'] or result.get('web') or result.get('https')):
+        return None
+    return result
+
+
+async def scan(networks=None, ports=MESHTASTIC_PORTS, concurrency=DEFAULT_CONCURRENCY,
+               timeout=DEFAULT_TIMEOUT, http=True, prefix=MAX_PREFIX):
+    """Scan networks and yield each device result as soon as it is known
+
+    `concurrency` workers pull addresses from one host iterator, so memory
+    stays bounded by the number of hosts in flight, not the size of the range
+    """
+    if networks is None:
+        networks = local_networks(prefix)
+    for network in networks:
+        if network.prefixlen < MIN_PREFIX:
+            raise ValueError(f"Refusing to scan {network}: wider than /{MIN_PREFIX}")
+    semaphore = asyncio.Semaphore(concurrency)
+    hosts = iter_hosts(networks)
+    results = asyncio.Queue()
+    done = object()
+
+    async def worker():
+        try:
+            for ip in hosts:
+                result = await check_host(ip, ports, timeout, http, semaphore)
+                if result:
+                    results.put_nowait(result)
+        finally:
+            results.put_nowait(done)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, concurrency))]
+    try:
+        remaining = len(workers)
+        while remaining:
+            result = await results.get()
+            if result is done:
+                remaining -= 1
+            else:
+                yield result
+        # Surface an exception from any worker
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+def scan_networks(networks=None, on_result=None, **kwargs):
+    """Blocking wrapper around scan(), calls on_result for each device found"""
+    async def collect():
+        found = []
+        async for result in scan(networks, **kwargs):
+            found.append(result)
+            if on_result:
+                on_result(result)
+        return found
+
+    return asyncio.run(collect())
+
+
+def check_host_sync(ip, **kwargs):
+    """Blocking wrapper around check_host() for a single address"""
+    return asyncio.run(check_host(str(ip), **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan local networks for Meshtastic devices")
+    parser.add_argument('networks', nargs='*', help="CIDR ranges to scan (default: local interfaces)")
+    parser.add_argument('--prefix', type=int, default=MAX_PREFIX,
+                        help=f"Prefix length for local interfaces ({MIN_PREFIX}-{MAX_PREFIX})")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--api-only', action='store_true', help="Only probe port 4403")
+    args = parser.parse_args()
+
+    if args.networks:
+        networks = [ipaddress.IPv4Network(n, strict=False) for n in args.networks]
+        too_wide = [str(n) for n in networks if n.prefixlen < MIN_PREFIX]
+        if too_wide:
+            print(f"❌ Refusing to scan {', '.join(too_wide)}: use /{MIN_PREFIX} or narrower")
+            return 1
+    else:
+        networks = local_networks(args.prefix)
+    if not networks:
+        print("❌ Cannot determine local network")
+        return 1
+
+    print(f"📡 Scanning: {', '.join(str(n) for n in networks)}")
+
+    def report(result):
+        print(f"🎯 Found device at {result['ip']} (ports: {', '.join(map(str, result['ports']))})")
+
+    found = scan_networks(
+        networks,
+        on_result=report,
+        ports=(API_PORT,) if args.api_only else MESHTASTIC_PORTS,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        http=not args.api_only,
+    )
+    print(f"✅ Scan complete: {len(found)} device(s) found")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Node Index
+Node database maintained incrementally from received packets, with lookups
+by num/id/short name and sorted last-heard and SNR orderings
+"""
+
+import time
+import threading
+from bisect import bisect_left, insort
+
+from packet_handlers import ANY, NODEINFO, POSITION, TELEMETRY, packet_portnum
+
+ADDED = 'added'
+UPDATED = 'updated'
+
+
+def node_num_from_id(node_id):
+    """'!a1b2c3d4' -> 0xa1b2c3d4"""
+    if isinstance(node_id, str) and node_id.startswith('!'):
+        try:
+            return int(node_id[1:], 16)
+        except ValueError:
+            return None
+    return None
+
+
+class SortedKeys:
+    """(key, num) pairs kept sorted so range/top-N queries are a bisect away"""
+
+    def __init__(self):
+        self.items = []
+        self.keys = {}
+
+    def set(self, num, key):
+        old = self.keys.get(num)
+        if old == key:
+            return
+        if old is not None:
+            index = bisect_left(self.items, (old, num))
+            if index < len(self.items) and self.items[index] == (old, num):
+                del self.items[index]
+        if key is None:
+            self.keys.pop(num, None)
+            return
+        self.keys[num] = key
+        insort(self.items, (key, num))
+
+    def at_least(self, key):
+        """Nums whose key >= key, highest first"""
+        index = bisect_left(self.items, (key, -1))
+        return [num for _, num in reversed(self.items[index:])]
+
+    def top(self, n):
+        return [num for _, num in reversed(self.items[-n:])] if n > 0 else []
+
+    def __len__(self):
+        return len(self.items)
+
+
+class NodeIndex:
+    """Written from the dispatcher thread and read from socket/worker threads;
+    every mutation and query holds the lock, and queries return copies"""
+
+    def __init__(self):
+        self.by_num = {}
+        self.by_id = {}
+        self.by_short = {}
+        self.last_heard = SortedKeys()
+        self.snr = SortedKeys()
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.by_num)
+
+    def on_change(self, callback):
+        """callback(event, node, changed_fields) on every add/update"""
+        self.listeners.append(callback)
+
+    def seed(self, nodes):
+        """Load an interface.nodes dict once at connect time"""
+        for node in (nodes or {}).values():
+            num = node.get('num') or node_num_from_id(node.get('user', {}).get('id'))
+            if num is not None:
+                self.update(num, node, notify=False)
+
+    def register(self, registry):
+        """Keep the index current from a HandlerRegistry"""
+        registry.register(ANY, self.handle_packet)
+
+    def handle_packet(self, packet, decoded):
+        num = packet.get('from')
+        if num is None:
+            return
+        fields = {'lastHeard': packet.get('rxTime') or int(time.time())}
+        if packet.get('rxSnr') is not None:
+            fields['snr'] = packet['rxSnr']
+        if packet.get('hopStart') is not None and packet.get('hopLimit') is not None:
+            fields['hopsAway'] = packet['hopStart'] - packet['hopLimit']
+
+        portnum, decoded = packet_portnum(packet)
+        if portnum == NODEINFO and decoded.get('user'):
+            fields['user'] = decoded['user']
+        elif portnum == POSITION and decoded.get('position'):
+            fields['position'] = decoded['position']
+        elif portnum == TELEMETRY:
+            telemetry = decoded.get('telemetry', {})
+            if telemetry.get('deviceMetrics'):
+                fields['deviceMetrics'] = telemetry['deviceMetrics']
+            if telemetry.get('environmentMetrics'):
+                fields['environmentMetrics'] = telemetry['environmentMetrics']
+
+        self.update(num, fields)
+
+    def update(self, num, fields, notify=True):
+        """Merge fields into a node and keep every secondary index in step"""
+        with self.lock:
+            event, node, changed = self._merge(num, fields)
+            snapshot = dict(node)
+        # Listeners run outside the lock so they may query the index
+        if notify and (changed or event == ADDED):
+            for callback in self.listeners:
+                callback(event, snapshot, changed)
+        return snapshot
+
+    def _merge(self, num, fields):
+        node = self.by_num.get(num)
+        event = UPDATED
+        if node is None:
+            node = self.by_num[num] = {'num': num}
+            event = ADDED
+
+        changed = [k for k, v in fields.items() if k != 'raw' and node.get(k) != v]
+        if not changed and event == UPDATED:
+            return event, node, changed
+
+        if 'user' in changed and node.get('user'):
+            old_short = node['user'].get('shortName')
+            if old_short in self.by_short:
+                self.by_short[old_short].discard(num)
+                if not self.by_short[old_short]:
+                    del self.by_short[old_short]
+        for key in changed:
+            node[key] = fields[key]
+
+        if 'user' in changed:
+            user = node['user']
+            if user.get('id'):
+                self.by_id[user['id']] = num
+            if user.get('shortName'):
+                self.by_short.setdefault(user['shortName'], set()).add(num)
+        if 'lastHeard' in changed:
+            self.last_heard.set(num, node['lastHeard'])
+        if 'snr' in changed:
+            self.snr.set(num, node['snr'])
+        return event, node, changed
+
+    def get(self, key):
+        """Look a node up by num, '!hex' id or short name"""
+        with self.lock:
+            if isinstance(key, int):
+                num = key
+            else:
+                num = self.by_id.get(key)
+                if num is None:
+                    num = node_num_from_id(key)
+                if num is None and key in self.by_short:
+                    num = next(iter(self.by_short[key]))
+            node = self.by_num.get(num)
+            return dict(node) if node is not None else None
+
+    def heard_since(self, seconds=15 * 60, now=None):
+        """Nodes heard in the last `seconds`, most recent first"""
+        cutoff = (now or time.time()) - seconds
+        with self.lock:
+            return [dict(self.by_num[num]) for num in self.last_heard.at_least(cutoff)]
+
+    def recent(self, n=None):
+        """Nodes ordered by last heard (never-heard nodes last)"""
+        with self.lock:
+            heard = [dict(self.by_num[num]) for num in self.last_heard.top(n or len(self.last_heard))]
+            if n is not None and len(heard) >= n:
+                return heard
+            never = [dict(node) for num, node in self.by_num.items() if num not in self.last_heard.keys]
+        return (heard + never)[:n] if n is not None else heard + never
+
+    def top_by_snr(self, n=10):
+        with self.lock:
+            return [dict(self.by_num[num]) for num in self.snr.top(n)]
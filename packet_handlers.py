@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Packet Handlers
+Registry that routes each received packet to the handlers for its portnum
+with a single dict lookup
+"""
+
+from collections import defaultdict
+
+# Portnum names as the meshtastic library reports them (see portnums.proto)
+TEXT_MESSAGE = 'TEXT_MESSAGE_APP'
+POSITION = 'POSITION_APP'
+NODEINFO = 'NODEINFO_APP'
+ROUTING = 'ROUTING_APP'
+ADMIN = 'ADMIN_APP'
+WAYPOINT = 'WAYPOINT_APP'
+TELEMETRY = 'TELEMETRY_APP'
+TRACEROUTE = 'TRACEROUTE_APP'
+NEIGHBORINFO = 'NEIGHBORINFO_APP'
+UNKNOWN = 'UNKNOWN_APP'
+
+# Packets we could not decrypt have no 'decoded' section
+ENCRYPTED = 'ENCRYPTED'
+
+# Handlers registered under ANY see every packet after the portnum handlers
+ANY = '*'
+
+# Integer portnums from src/mesh/generated/meshtastic/portnums.pb.h
+PORTNUM_NAMES = {
+    0: UNKNOWN,
+    1: TEXT_MESSAGE,
+    2: 'REMOTE_HARDWARE_APP',
+    3: POSITION,
+    4: NODEINFO,
+    5: ROUTING,
+    6: ADMIN,
+    7: 'TEXT_MESSAGE_COMPRESSED_APP',
+    8: WAYPOINT,
+    9: 'AUDIO_APP',
+    10: 'DETECTION_SENSOR_APP',
+    11: 'ALERT_APP',
+    32: 'REPLY_APP',
+    33: 'IP_TUNNEL_APP',
+    34: 'PAXCOUNTER_APP',
+    64: 'SERIAL_APP',
+    65: 'STORE_FORWARD_APP',
+    66: 'RANGE_TEST_APP',
+    67: TELEMETRY,
+    70: TRACEROUTE,
+    71: NEIGHBORINFO,
+    73: 'MAP_REPORT_APP',
+}
+
+
+def packet_portnum(packet):
+    """Return (portnum name, decoded dict) for a packet"""
+    decoded = packet.get('decoded')
+    if not decoded:
+        return ENCRYPTED, None
+    portnum = decoded.get('portnum', UNKNOWN)
+    if isinstance(portnum, int):
+        portnum = PORTNUM_NAMES.get(portnum, UNKNOWN)
+    return portnum, decoded
+
+
+class HandlerRegistry:
+    """Maps portnum -> handlers; each handler is called as handler(packet, decoded)"""
+
+    def __init__(self):
+        self.handlers = defaultdict(list)
+        self.counts = defaultdict(int)
+        self.errors = 0
+        self.last_error = None
+
+    def register(self, portnum, handler=None):
+        """Register a handler, or use as a decorator: @registry.register(TELEMETRY)"""
+        if isinstance(portnum, int):
+            portnum = PORTNUM_NAMES.get(portnum, UNKNOWN)
+
+        def add(func):
+            self.handlers[portnum].append(func)
+            return func
+
+        return add(handler) if handler else add
+
+    def unregister(self, portnum, handler):
+        if handler in self.handlers.get(portnum, ()):
+            self.handlers[portnum].remove(handler)
+
+    def dispatch(self, packet):
+        """Run the handlers for this packet's portnum, then the ANY handlers"""
+        portnum, decoded = packet_portnum(packet)
+        self.counts[portnum] += 1
+
+        handlers = self.handlers.get(portnum)
+        if handlers:
+            self._call(handlers, packet, decoded)
+        handlers = self.handlers.get(ANY)
+        if handlers:
+            self._call(handlers, packet, decoded)
+
+    def _call(self, handlers, packet, decoded):
+        # One broken handler must not starve the others
+        for handler in handlers:
+            try:
+                handler(packet, decoded)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+
+    def stats(self):
+        return {'packets': dict(self.counts), 'errors': self.errors}
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Packet Ring
+Bounded buffer of recent packets with sequence numbers, so readers can page
+through new traffic with a cursor instead of holding everything in memory
+"""
+
+import time
+import threading
+from collections import deque
+from itertools import islice
+
+from packet_handlers import PORTNUM_NAMES, packet_portnum
+
+DEFAULT_RING_SIZE = 2000
+
+
+def packet_filter(from_ids=None, portnums=None):
+    """Build a match(packet) predicate, or None when nothing is filtered"""
+    if isinstance(from_ids, str):
+        from_ids = [from_ids]
+    if isinstance(portnums, (str, int)):
+        portnums = [portnums]
+    ids = set(from_ids or ())
+    names = {PORTNUM_NAMES.get(p, str(p)) if isinstance(p, int) else p for p in portnums or ()}
+    if not ids and not names:
+        return None
+
+    def match(packet):
+        if ids:
+            from_id = packet.get('fromId')
+            if from_id is None and packet.get('from') is not None:
+                from_id = f"!{packet['from']:08x}"
+            if from_id not in ids:
+                return False
+        if names and packet_portnum(packet)[0] not in names:
+            return False
+        return True
+
+    return match
+
+
+class PacketRing:
+    def __init__(self, size=DEFAULT_RING_SIZE):
+        self.entries = deque(maxlen=size)
+        self.seq = 0
+        self.cond = threading.Condition()
+
+    def append(self, packet, decoded=None):
+        """HandlerRegistry-compatible (register under ANY)"""
+        with self.cond:
+            self.seq += 1
+            self.entries.append((self.seq, packet))
+            self.cond.notify_all()
+
+    def read(self, cursor=None, limit=100, match=None, wait=0):
+        """Packets after `cursor` -> (packets, next_cursor, missed)
+
+        cursor None starts at the newest packet (only future traffic), 0 at the
+        oldest one still buffered. With wait > 0 the call blocks until at least
+        one matching packet arrives or the wait runs out. `missed` counts
+        packets that fell off the ring before this reader got to them.
+        """
+        deadline = time.time() + wait
+        with self.cond:
+            if cursor is None:
+                cursor = self.seq
+            missed = 0
+
+            while True:
+                # Recounted after every wait: the ring may lap a waiting reader
+                first = self.entries[0][0] if self.entries else self.seq + 1
+                missed += max(0, first - cursor - 1)
+                cursor = max(cursor, first - 1)
+                packets = []
+                for seq, packet in islice(self.entries, max(0, cursor - first + 1), None):
+                    cursor = seq
+                    if match is None or match(packet):
+                        packets.append(packet)
+                        if len(packets) >= limit:
+                            break
+
+                remaining = deadline - time.time()
+                if packets or remaining <= 0:
+                    return packets, cursor, missed
+                self.cond.wait(remaining)
+
+    def stats(self):
+        with self.cond:
+            return {'size': len(self.entries), 'capacity': self.entries.maxlen, 'seq': self.seq}
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Receive Pipeline
+Moves packets off the meshtastic reader thread into a bounded queue that is
+consumed by a dispatcher thread, a blocking iterator or an async iterator
+"""
+
+import asyncio
+import threading
+from queue import Queue, Full, Empty
+
+DEFAULT_QUEUE_SIZE = 1000
+# How long an async consumer's executor thread blocks before rechecking for
+# cancellation or stop()
+AITER_POLL = 0.5
+
+DROP_OLDEST = 'oldest'
+DROP_NEWEST = 'newest'
+
+_STOP = object()
+
+
+class ReceivePipeline:
+    def __init__(self, interface=None, maxsize=DEFAULT_QUEUE_SIZE, drop=DROP_OLDEST):
+        self.interface = interface
+        self.queue = Queue(maxsize=maxsize)
+        self.drop = drop
+        self.running = False
+        self.dispatcher = None
+        self.received = 0
+        self.dropped = 0
+        self.dispatched = 0
+        self.errors = 0
+
+    def start(self):
+        """Start receiving; works with meshtastic interfaces and DaemonInterface"""
+        if self.running:
+            return self
+        self.running = True
+        if hasattr(self.interface, 'onReceive'):
+            # mesh_daemon.DaemonInterface streams packets itself
+            self.interface.onReceive(self.on_packet)
+        else:
+            from pubsub import pub
+            pub.subscribe(self.on_packet, "meshtastic.receive")
+        return self
+
+    def stop(self):
+        """Stop receiving and wake every consumer"""
+        if not self.running:
+            return
+        self.running = False
+        if not hasattr(self.interface, 'onReceive'):
+            try:
+                from pubsub import pub
+                pub.unsubscribe(self.on_packet, "meshtastic.receive")
+            except Exception:
+                pass
+        self._put(_STOP)
+        if self.dispatcher and self.dispatcher is not threading.current_thread():
+            self.dispatcher.join(timeout=2)
+
+    def on_packet(self, packet, interface):
+        """Runs on the reader thread: enqueue and return immediately"""
+        if not self.running:
+            return
+        if self.interface is not None and interface is not self.interface:
+            return
+        self.received += 1
+        self._put(packet)
+
+    def _put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except Full:
+                if self.drop == DROP_NEWEST and item is not _STOP:
+                    self.dropped += 1
+                    return
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Next packet, or None on timeout or once the pipeline is stopped"""
+        try:
+            item = self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+        if item is _STOP:
+            # Leave the marker for any other consumer blocked on the queue
+            self._put(_STOP)
+            return None
+        return item
+
+    def __iter__(self):
+        while self.running or not self.queue.empty():
+            packet = self.get()
+            if packet is None:
+                return
+            yield packet
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        abandoned = threading.Event()
+
+        def poll():
+            packet = self.get(AITER_POLL)
+            if packet is not None and abandoned.is_set():
+                # The consumer was cancelled while we waited; hand the packet on
+                self._put(packet)
+                return None
+            return packet
+
+        try:
+            while True:
+                packet = await loop.run_in_executor(None, poll)
+                if packet is not None:
+                    yield packet
+                elif not self.running:
+                    return
+        finally:
+            abandoned.set()
+
+    def run_dispatcher(self, handler):
+        """Call handler(packet) for every packet on a dedicated thread"""
+        def dispatch():
+            for packet in self:
+                try:
+                    handler(packet)
+                    self.dispatched += 1
+                except Exception:
+                    self.errors += 1
+
+        self.start()
+        self.dispatcher = threading.Thread(target=dispatch, name="receive-dispatcher", daemon=True)
+        self.dispatcher.start()
+        return self.dispatcher
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'dropped': self.dropped,
+            'dispatched': self.dispatched,
+            'errors': self.errors,
+            'queued': self.queue.qsize(),
+        }
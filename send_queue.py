@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Send Queue
+Outbound message queue with priorities, duplicate coalescing and pacing that
+mirrors the firmware's airtime rules (src/airtime.cpp)
+"""
+
+import math
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+
+def local_node_num(interface):
+    """Our node number from a meshtastic interface or DaemonInterface"""
+    try:
+        if getattr(interface, 'myInfo', None):
+            return interface.myInfo.my_node_num
+        return (interface.getMyNodeInfo() or {}).get('num')
+    except Exception:
+        return None
+
+
+# Priorities, lowest value is sent first
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+# Message states
+QUEUED = 'queued'
+SENT = 'sent'
+ACKED = 'acked'
+FAILED = 'failed'
+
+# Limits from src/airtime.h
+MAX_CHANNEL_UTIL_PERCENT = 40
+POLITE_CHANNEL_UTIL_PERCENT = 25
+POLITE_DUTY_CYCLE_PERCENT = 50
+MS_IN_HOUR = 3600 * 1000
+
+# Region duty cycles from src/mesh/RadioInterface.cpp (everything else is 100%)
+REGION_DUTY_CYCLE = {
+    'EU_433': 10,
+    'EU_868': 10,
+    'UA_433': 10,
+    'UA_868': 1,
+}
+
+# (spreading factor, bandwidth kHz, coding rate denominator) per modem preset
+MODEM_PRESETS = {
+    'SHORT_TURBO': (7, 500, 5),
+    'SHORT_FAST': (7, 250, 5),
+    'SHORT_SLOW': (8, 250, 5),
+    'MEDIUM_FAST': (9, 250, 5),
+    'MEDIUM_SLOW': (10, 250, 5),
+    'LONG_FAST': (11, 250, 5),
+    'LONG_MODERATE': (11, 125, 8),
+    'LONG_SLOW': (12, 125, 8),
+}
+
+PREAMBLE_LENGTH = 16     # RadioInterface::preambleLength
+PACKET_HEADER_LEN = 16   # sizeof(PacketHeader)
+DATA_OVERHEAD = 4        # portnum + payload tag/length in the Data protobuf
+
+# The firmware re-checks channel utilisation every 10 s period
+CHANNEL_UTIL_BACKOFF = 10.0
+# Ignore a channelUtilization reading once it is older than this
+CHANNEL_UTIL_MAX_AGE = 15 * 60
+
+
+def airtime_ms(payload_len, preset='LONG_FAST', preamble=PREAMBLE_LENGTH):
+    """LoRa time on air (Semtech AN1200.13) for a payload on a modem preset"""
+    sf, bw_khz, cr = MODEM_PRESETS.get(preset, MODEM_PRESETS['LONG_FAST'])
+    symbol_ms = (2 ** sf) / bw_khz
+    low_data_rate = 1 if symbol_ms > 16 else 0
+    payload_symbols = 8 + max(
+        math.ceil((8 * payload_len - 4 * sf + 28 + 16) / (4 * (sf - 2 * low_data_rate))) * cr, 0)
+    return (preamble + 4.25 + payload_symbols) * symbol_ms
+
+
+def text_airtime_ms(text, preset='LONG_FAST'):
+    return airtime_ms(len(text.encode('utf-8')) + DATA_OVERHEAD + PACKET_HEADER_LEN, preset)
+
+
+def radio_settings(interface):
+    """Read (modem preset, region) from the device config, with safe defaults"""
+    preset, region = 'LONG_FAST', 'UNSET'
+    try:
+        lora = interface.localNode.localConfig
+        lora = lora.get('lora', {}) if isinstance(lora, dict) else lora.lora
+        if isinstance(lora, dict):
+            preset = lora.get('modemPreset', preset)
+            region = lora.get('region', region)
+        else:
+            preset = lora.DESCRIPTOR.fields_by_name['modem_preset'].enum_type.values_by_number[lora.modem_preset].name
+            region = lora.DESCRIPTOR.fields_by_name['region'].enum_type.values_by_number[lora.region].name
+    except Exception:
+        pass
+    return preset, region
+
+
+class AirtimeBudget:
+    """Sliding one-hour TX log, same rules as AirTime::isTxAllowed*"""
+
+    def __init__(self, duty_cycle=100, polite=True):
+        self.duty_cycle = duty_cycle
+        self.polite = polite
+        self.tx_log = deque()
+        self.tx_ms = 0.0
+        self.channel_util = 0.0
+        self.channel_util_at = 0.0
+
+    def _expire(self, now):
+        while self.tx_log and now - self.tx_log[0][0] > 3600:
+            self.tx_ms -= self.tx_log.popleft()[1]
+
+    def record(self, ms, now=None):
+        now = now or time.time()
+        self._expire(now)
+        self.tx_log.append((now, ms))
+        self.tx_ms += ms
+
+    def update_channel_util(self, percent):
+        """Feed the device's reported channelUtilization"""
+        if percent is not None:
+            self.channel_util = float(percent)
+            self.channel_util_at = time.time()
+
+    def tx_percent(self, now=None):
+        self._expire(now or time.time())
+        return self.tx_ms / MS_IN_HOUR * 100
+
+    def wait_time(self, ms, now=None):
+        """Seconds to wait before `ms` of airtime may be used (0 = send now)"""
+        now = now or time.time()
+        limit = POLITE_CHANNEL_UTIL_PERCENT if self.polite else MAX_CHANNEL_UTIL_PERCENT
+        if self.channel_util >= limit and now - self.channel_util_at < CHANNEL_UTIL_MAX_AGE:
+            return CHANNEL_UTIL_BACKOFF
+
+        if self.duty_cycle >= 100:
+            return 0.0
+        self._expire(now)
+        allowed_ms = MS_IN_HOUR * self.duty_cycle / 100 * POLITE_DUTY_CYCLE_PERCENT / 100
+        excess = self.tx_ms + ms - allowed_ms
+        if excess <= 0:
+            return 0.0
+
+        # Wait until enough old transmissions have aged out of the hour
+        for sent_at, sent_ms in self.tx_log:
+            excess -= sent_ms
+            if excess <= 0:
+                return max(0.0, sent_at + 3600 - now)
+        return 3600.0
+
+
+class OutboundMessage:
+    def __init__(self, text, destination, channel, priority, want_ack):
+        self.text = text
+        self.destination = destination or '^all'
+        self.channel = channel
+        self.priority = priority
+        self.want_ack = want_ack
+        self.state = QUEUED
+        self.packet_id = None
+        self.error = None
+        self.coalesced = 0
+        self.queued_at = time.time()
+        self.sent_at = None
+        self.done_at = None
+        self.callbacks = []
+        self.transmitted = threading.Event()
+        self.done = threading.Event()
+
+    @property
+    def key(self):
+        return (self.text, self.destination, self.channel)
+
+    @property
+    def queue_latency(self):
+        return self.sent_at - self.queued_at if self.sent_at else None
+
+    @property
+    def ack_latency(self):
+        return self.done_at - self.sent_at if self.done_at and self.sent_at else None
+
+    def finish(self, state, error=None):
+        if self.done.is_set():
+            return False
+        self.state = state
+        self.error = error
+        self.done_at = time.time()
+        self.transmitted.set()
+        self.done.set()
+        for callback in self.callbacks:
+            try:
+                callback(self)
+            except Exception:
+                pass
+        return True
+
+    def wait(self, timeout=None):
+        """Block until acked/failed (or sent, if no ack was requested)"""
+        self.done.wait(timeout)
+        return self.state
+
+    def wait_sent(self, timeout=None):
+        """Block until the message has left the queue"""
+        self.transmitted.wait(timeout)
+        return self.state
+
+    def to_dict(self):
+        return {
+            'text': self.text,
+            'destination': self.destination,
+            'channel': self.channel,
+            'state': self.state,
+            'id': self.packet_id,
+            'error': self.error,
+            'coalesced': self.coalesced,
+            'queueLatency': self.queue_latency,
+            'ackLatency': self.ack_latency,
+        }
+
+
+class SendQueue:
+    def __init__(self, interface, preset=None, region=None, want_ack=True, polite=True):
+        if preset is None or region is None:
+            device_preset, device_region = radio_settings(interface)
+            preset = preset or device_preset
+            region = region or device_region
+        self.interface = interface
+        self.my_node_num = None
+        self.preset = preset
+        self.want_ack = want_ack
+        self.budget = AirtimeBudget(REGION_DUTY_CYCLE.get(region, 100), polite)
+        self.heap = []
+        self.pending = {}
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.running = False
+        self.worker = None
+        self.next_send_at = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.listeners = []
+
+    def start(self):
+        if not self.worker:
+            self.running = True
+            self.worker = threading.Thread(target=self._run, name="send-queue", daemon=True)
+            self.worker.start()
+        return self
+
+    def stop(self, drain_timeout=10):
+        """Stop the worker, first giving queued messages a chance to go out"""
+        deadline = time.time() + drain_timeout
+        with self.cond:
+            while self.pending and self.running and time.time() < deadline:
+                self.cond.wait(0.1)
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.worker:
+            self.worker.join(timeout=5)
+            self.worker = None
+
+    def submit(self, text, destination=None, channel=0, priority=NORMAL, want_ack=None, on_done=None):
+        """Queue a message; an identical one still waiting is reused instead"""
+        message = OutboundMessage(text, destination, channel, priority,
+                                  self.want_ack if want_ack is None else want_ack)
+        with self.cond:
+            existing = self.pending.get(message.key)
+            if existing:
+                existing.coalesced += 1
+                self.coalesced += 1
+                if priority < existing.priority:
+                    existing.priority = priority
+                    heapq.heappush(self.heap, (priority, next(self.counter), existing))
+                message = existing
+            else:
+                self.pending[message.key] = message
+                heapq.heappush(self.heap, (priority, next(self.counter), message))
+            if on_done:
+                message.callbacks.append(on_done)
+            self.cond.notify()
+        return message
+
+    def on_state(self, callback):
+        """callback(message) whenever a message is sent, acked or fails"""
+        self.listeners.append(callback)
+
+    def _notify(self, message):
+        for callback in self.listeners:
+            try:
+                callback(message)
+            except Exception:
+                pass
+
+    def finish(self, message, state, error=None):
+        """Complete a message (first caller wins) and tell the listeners"""
+        if message.finish(state, error):
+            if state == FAILED:
+                self.failed += 1
+            self._notify(message)
+
+    def update_channel_util(self, percent):
+        self.budget.update_channel_util(percent)
+
+    def telemetry_handler(self, packet, decoded):
+        """HandlerRegistry handler: track our own node's channel utilisation"""
+        if self.my_node_num is None:
+            self.my_node_num = local_node_num(self.interface)
+        # Every node reports its own channel; only ours may throttle our sends
+        if self.my_node_num is None or packet.get('from') != self.my_node_num:
+            return
+        metrics = decoded.get('telemetry', {}).get('deviceMetrics', {})
+        self.update_channel_util(metrics.get('channelUtilization'))
+
+    def _live(self, entry):
+        priority, _, message = entry
+        return message.state == QUEUED and message.priority == priority \
+            and self.pending.get(message.key) is message
+
+    def _peek_message(self):
+        """Best message without popping it, dropping entries superseded by re-prioritising"""
+        while self.heap:
+            if self._live(self.heap[0]):
+                return self.heap[0][2]
+            heapq.heappop(self.heap)
+        return None
+
+    def _next_message(self):
+        """Pop the best message, skipping heap entries superseded by re-prioritising"""
+        message = self._peek_message()
+        if message:
+            heapq.heappop(self.heap)
+            del self.pending[message.key]
+        return message
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.heap:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                head = self._peek_message()
+                if not head:
+                    continue
+                cost = text_airtime_ms(head.text, self.preset)
+                wait = max(self.budget.wait_time(cost), self.next_send_at - time.time())
+                if wait > 0:
+                    self.cond.wait(wait)
+                    continue
+                message = self._next_message()
+                # Charge the message actually sent (same as head while the lock is held)
+                cost = text_airtime_ms(message.text, self.preset)
+            self._transmit(message, cost)
+
+    def _transmit(self, message, cost):
+        try:
+            packet = self.interface.sendText(message.text, destinationId=message.destination,
+                                             wantAck=message.want_ack, channelIndex=message.channel)
+        except Exception as e:
+            self.finish(message, FAILED, str(e))
+            return
+
+        now = time.time()
+        self.budget.record(cost, now)
+        # Leave the channel free for our own packet's airtime before the next one
+        self.next_send_at = now + cost / 1000
+        self.sent += 1
+        message.sent_at = now
+        message.packet_id = packet.get('id') if isinstance(packet, dict) else getattr(packet, 'id', None)
+        message.state = SENT
+        message.transmitted.set()
+        self._notify(message)
+        # Acks are matched to packet ids by delivery_tracker.DeliveryTracker
+        if not message.want_ack:
+            self.finish(message, SENT)
+
+    def stats(self):
+        with self.cond:
+            queued = len(self.pending)
+        return {
+            'queued': queued,
+            'sent': self.sent,
+            'failed': self.failed,
+            'coalesced': self.coalesced,
+            'txPercent': round(self.budget.tx_percent(), 3),
+            'channelUtil': self.budget.channel_util,
+            'preset': self.preset,
+            'dutyCycle': self.budget.duty_cycle,
+        }
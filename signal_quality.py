@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Signal Quality
+Per-node rolling windows of rxRssi/rxSnr/hop count from every received packet,
+summarised as percentiles, a trend and a LoRa link-budget estimate
+"""
+
+import math
+import time
+import threading
+from array import array
+
+from delivery_tracker import percentile
+from send_queue import MODEM_PRESETS
+
+DEFAULT_WINDOW = 256
+
+# Demodulation SNR floor per spreading factor (Semtech SX127x datasheet)
+SNR_FLOOR = {7: -7.5, 8: -10.0, 9: -12.5, 10: -15.0, 11: -17.5, 12: -20.0}
+NOISE_FIGURE_DB = 6
+TREND_MIN_SPAN = 600          # seconds of samples before a trend is reported
+TREND_STABLE_DB_PER_HOUR = 1.0
+
+
+def sensitivity_dbm(sf, bw_khz):
+    """Receiver sensitivity: thermal noise + bandwidth + noise figure + SNR floor"""
+    return -174 + 10 * math.log10(bw_khz * 1000) + NOISE_FIGURE_DB + SNR_FLOOR[sf]
+
+
+def slope_per_hour(times, values):
+    """Least-squares slope of values over time, in units per hour"""
+    n = len(times)
+    if n < 3 or times[-1] - times[0] < TREND_MIN_SPAN:
+        return None
+    mean_t = sum(times) / n
+    mean_v = sum(values) / n
+    var = sum((t - mean_t) ** 2 for t in times)
+    if not var:
+        return None
+    cov = sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values))
+    return cov / var * 3600
+
+
+def summarize(values):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return {
+        'min': ordered[0],
+        'p10': percentile(ordered, 10),
+        'p50': percentile(ordered, 50),
+        'p90': percentile(ordered, 90),
+        'max': ordered[-1],
+    }
+
+
+class SampleRing:
+    """Fixed-size ring of (time, rssi, snr, hops) in flat arrays"""
+
+    def __init__(self, size=DEFAULT_WINDOW):
+        self.size = size
+        self.times = array('d', bytes(8 * size))
+        self.rssi = array('d', bytes(8 * size))
+        self.snr = array('d', bytes(8 * size))
+        self.hops = array('b', bytes(size))   # -1 = unknown
+        self.count = 0
+        self.total = 0
+        self.head = 0
+
+    def add(self, when, rssi, snr, hops):
+        i = self.head
+        self.times[i] = when
+        self.rssi[i] = rssi if rssi is not None else math.nan
+        self.snr[i] = snr if snr is not None else math.nan
+        self.hops[i] = hops if hops is not None and 0 <= hops < 128 else -1
+        self.head = (i + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        self.total += 1
+
+    def indices(self):
+        """Oldest to newest"""
+        start = (self.head - self.count) % self.size
+        return [(start + k) % self.size for k in range(self.count)]
+
+
+class SignalQuality:
+    def __init__(self, window=DEFAULT_WINDOW, preset='LONG_FAST', my_node_num=None):
+        self.window = window
+        self.preset = preset
+        self.my_node_num = my_node_num
+        self.rings = {}
+        self.lock = threading.Lock()
+
+    def handler(self, packet, decoded):
+        """HandlerRegistry handler (register under ANY)"""
+        num = packet.get('from')
+        if num is None or num == self.my_node_num or packet.get('viaMqtt'):
+            return
+        rssi, snr = packet.get('rxRssi'), packet.get('rxSnr')
+        # Locally generated packets come back without radio metadata
+        if not rssi and snr is None:
+            return
+        hops = None
+        if packet.get('hopStart') is not None and packet.get('hopLimit') is not None:
+            hops = packet['hopStart'] - packet['hopLimit']
+        with self.lock:
+            ring = self.rings.get(num)
+            if ring is None:
+                ring = self.rings[num] = SampleRing(self.window)
+            ring.add(packet.get('rxTime') or time.time(), rssi or None, snr, hops)
+
+    def link_budget(self, rssi_p50, snr_p50):
+        """Margins above what the current modem preset can still decode"""
+        sf, bw_khz, _ = MODEM_PRESETS.get(self.preset, MODEM_PRESETS['LONG_FAST'])
+        sensitivity = sensitivity_dbm(sf, bw_khz)
+        return {
+            'preset': self.preset,
+            'snrFloor': SNR_FLOOR[sf],
+            'sensitivityDbm': round(sensitivity, 1),
+            'snrMarginDb': None if snr_p50 is None else round(snr_p50 - SNR_FLOOR[sf], 1),
+            'rssiMarginDb': None if rssi_p50 is None else round(rssi_p50 - sensitivity, 1),
+        }
+
+    def node(self, num):
+        """Percentiles, trend and link budget for one node, or None if never heard"""
+        with self.lock:
+            ring = self.rings.get(num)
+            if ring is None:
+                return None
+            idx = ring.indices()
+            times = [ring.times[i] for i in idx]
+            rssi = [ring.rssi[i] for i in idx]
+            snr = [ring.snr[i] for i in idx]
+            hops = [ring.hops[i] for i in idx]
+            total = ring.total
+
+        snr_points = [(t, v) for t, v in zip(times, snr) if not math.isnan(v)]
+        snr_stats = summarize([v for _, v in snr_points])
+        rssi_stats = summarize([v for v in rssi if not math.isnan(v)])
+        known_hops = [h for h in hops if h >= 0]
+
+        # Only direct receptions describe the radio link between us and this node
+        direct = [i for i, h in enumerate(hops) if h == 0]
+        direct_rssi = summarize([rssi[i] for i in direct if not math.isnan(rssi[i])])
+        direct_snr = summarize([snr[i] for i in direct if not math.isnan(snr[i])])
+
+        trend = slope_per_hour([t for t, _ in snr_points], [v for _, v in snr_points])
+        if trend is None:
+            direction = None
+        elif abs(trend) < TREND_STABLE_DB_PER_HOUR:
+            direction = 'stable'
+        else:
+            direction = 'improving' if trend > 0 else 'degrading'
+
+        return {
+            'num': num,
+            'id': f"!{num:08x}",
+            'samples': len(idx),
+            'totalSamples': total,
+            'lastHeard': times[-1] if times else None,
+            'rssi': rssi_stats,
+            'snr': snr_stats,
+            'hops': summarize(known_hops),
+            'direct': len(direct),
+            'trend': {'snrDbPerHour': None if trend is None else round(trend, 2), 'direction': direction},
+            'link': self.link_budget(direct_rssi and direct_rssi['p50'],
+                                     direct_snr and direct_snr['p50']) if direct else None,
+        }
+
+    def nodes(self):
+        """Every heard node, weakest direct link first (indirect-only nodes last)"""
+        with self.lock:
+            nums = list(self.rings)
+        reports = [self.node(num) for num in nums]
+
+        def margin(report):
+            link = report['link']
+            value = link and link['snrMarginDb']
+            return (value is None, value if value is not None else 0)
+
+        return sorted((r for r in reports if r), key=margin)
+
+    def overall(self, reports=None):
+        """Median direct-link SNR margin across nodes, as a coarse rating"""
+        reports = self.nodes() if reports is None else reports
+        margins = sorted(r['link']['snrMarginDb'] for r in reports
+                         if r['link'] and r['link']['snrMarginDb'] is not None)
+        median = percentile(margins, 50)
+        if median is None:
+            rating = 'unknown'
+        elif median >= 10:
+            rating = 'strong'
+        elif median >= 5:
+            rating = 'good'
+        elif median >= 0:
+            rating = 'marginal'
+        else:
+            rating = 'weak'
+        return {'directLinks': len(margins), 'medianSnrMarginDb': median, 'rating': rating}
@@ -7,9 +7,16 @@ Direct serial communication without network dependencies
 import sys
 import time
 import signal
-import glob
+import os
+import argparse
 from datetime import datetime
 
+import mesh_daemon
+import packet_handlers
+from mesh_client import MeshClient
+from mesh_json import JsonOutput, parse_input
+from receive_pipeline import ReceivePipeline
+
 try:
     import meshtastic
     import meshtastic.serial_interface
@@ -23,19 +30,19 @@ except ImportError:
     import meshtastic.serial_interface
     import serial.tools.list_ports
 
-class SimpleComm:
-    def __init__(self):
-        self.interface = None
-        self.running = False
+class SimpleComm(MeshClient):
+    def __init__(self, output=None):
+        super().__init__(output)
         
     def find_device(self):
         """Find the Heltec device"""
         print("🔍 Looking for Heltec device...")
         
         # Check for the specific device we know
-        if "/dev/cu.usbserial-0001" in glob.glob("/dev/cu.usbserial*"):
-            print("✅ Found Heltec at /dev/cu.usbserial-0001")
-            return "/dev/cu.usbserial-0001"
+        device = mesh_daemon.DEFAULT_DEVICE
+        if os.path.exists(device):
+            print(f"✅ Found Heltec at {device}")
+            return device
         
         # Check all USB serial devices
         ports = []
@@ -52,6 +59,11 @@ class SimpleComm:
     
     def connect(self):
         """Connect to device"""
+        self.interface = mesh_daemon.connect_daemon()
+        if self.interface:
+            print("⚡ Attached to mesh daemon")
+            return True
+        
         port = self.find_device()
         if not port:
             return False
@@ -97,10 +109,11 @@ class SimpleComm:
                     print(f"⚡ Voltage: {voltage}V")
             
             # Check nodes in mesh
-            nodes = self.interface.nodes
-            print(f"\n🌐 Mesh nodes: {len(nodes)} discovered")
+            self.load_nodes()
+            print(f"\n🌐 Mesh nodes: {len(self.node_index)} discovered")
+            self.output.emit('nodes', node=node_info, nodes=self.node_index.recent())
             
-            for node in nodes.values():
+            for node in self.node_index.recent():
                 user = node.get('user', {})
                 name = user.get('longName', user.get('shortName', 'Unknown'))
                 last_heard = node.get('lastHeard', 0)
@@ -124,8 +137,11 @@ class SimpleComm:
             else:
                 print(f"📢 Broadcasting: {text}")
                 
-            self.interface.sendText(text, destinationId=destination)
-            print("✅ Message sent!")
+            delivery = self.queue_message(text, destination)
+            self.output.emit('queued', text=text, destination=delivery.destination,
+                             coalesced=bool(delivery.attempts[-1].coalesced))
+            if delivery.attempts[-1].coalesced:
+                print("♻️  Same message already queued")
             return True
             
         except Exception as e:
@@ -138,20 +154,23 @@ class SimpleComm:
         print("   Type messages to send, or /quit to exit")
         print("-" * 40)
         
-        def on_receive(packet, interface):
-            try:
-                decoded = packet.get('decoded', {})
-                if decoded.get('text'):
-                    text = decoded['text']
-                    from_id = packet.get('fromId', 'Unknown')
-                    timestamp = datetime.now().strftime('%H:%M:%S')
-                    print(f"\n[{timestamp}] 📥 {from_id}: {text}")
-                    print("📝 Message: ", end="", flush=True)
-            except:
-                pass
+        def on_text(packet, decoded):
+            text = decoded.get('text')
+            if text:
+                from_id = packet.get('fromId', 'Unknown')
+                timestamp = datetime.now().strftime('%H:%M:%S')
+                print(f"\n[{timestamp}] 📥 {from_id}: {text}")
+                print("📝 Message: ", end="", flush=True)
+        
+        self.handlers.register(packet_handlers.TEXT_MESSAGE, on_text)
+        if self.output.enabled:
+            self.handlers.register(packet_handlers.ANY, self.emit_packet)
+        
+        self.start_store()
         
         # Subscribe to messages
-        self.interface.onReceive(on_receive)
+        self.pipeline = ReceivePipeline(self.interface)
+        self.pipeline.run_dispatcher(self.handlers.dispatch)
         self.running = True
         
         # Interactive messaging
@@ -169,24 +188,35 @@ class SimpleComm:
                     print("  /quit  - Exit")
                     print("  Text   - Send message")
                 elif user_input:
-                    self.send_message(user_input)
+                    request = parse_input(user_input, self.output.enabled)
+                    if request:
+                        self.send_message(*request)
                     
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):
             pass
         
         self.running = False
+        self.pipeline.stop()
         print("\n👋 Goodbye!")
     
     def close(self):
         """Close connection"""
+        self.output.emit('closed')
+        self.stop_services()
         if self.interface:
             self.interface.close()
 
 def main():
+    parser = argparse.ArgumentParser(description="Simple serial messaging for Heltec V2")
+    parser.add_argument('--json', action='store_true',
+                        help="Emit NDJSON events on stdout (human output goes to stderr)")
+    args = parser.parse_args()
+    output = JsonOutput(args.json)
+    
     print("🚀 Heltec V2 Meshtastic Communication")
     print("=" * 40)
     
-    comm = SimpleComm()
+    comm = SimpleComm(output=output)
     
     # Handle Ctrl+C cleanly
     def signal_handler(sig, frame):
@@ -203,7 +233,9 @@ def main():
         print("   1. Ensure device is connected via USB")
         print("   2. Check no other apps are using the device")
         print("   3. Try unplugging and reconnecting")
+        comm.output.emit('error', message="Could not connect to device")
         return 1
+    comm.output.emit('connected', daemon=isinstance(comm.interface, mesh_daemon.DaemonInterface))
     
     # Show device info
     comm.show_info()
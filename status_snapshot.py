@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Status Snapshot
+Cached view of our own node (info, device metrics, channels, mesh size) that
+telemetry packets keep fresh, so status reads rarely touch the device
+"""
+
+import copy
+import time
+import threading
+
+from delivery_tracker import local_node_num
+from mesh_daemon import device_config, to_jsonable
+
+DEFAULT_MAX_AGE = 300
+
+# deviceMetrics field -> snapshot field
+METRIC_FIELDS = {
+    'batteryLevel': 'battery',
+    'voltage': 'voltage',
+    'channelUtilization': 'channelUtilization',
+    'airUtilTx': 'airUtilTx',
+    'uptimeSeconds': 'uptimeSeconds',
+}
+
+
+class StatusSnapshot:
+    def __init__(self, interface, node_index=None):
+        self.interface = interface
+        self.node_index = node_index
+        self.my_num = local_node_num(interface)
+        self.data = None
+        self.updated_at = 0
+        self.refreshes = 0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Read everything from the interface (the slow path)"""
+        node_info = self.interface.getMyNodeInfo() or {}
+        config = device_config(self.interface)
+        user = node_info.get('user', {})
+        metrics = node_info.get('deviceMetrics', {})
+        network = config.get('localConfig', {}).get('network', {})
+        channels = config.get('channels', [])
+
+        data = {
+            'connected': True,
+            'nodeId': user.get('id'),
+            'nodeName': user.get('longName'),
+            'meshNodes': len(self.interface.nodes or {}),
+            'primaryChannel': next((c for c in channels if c.get('role') == 'PRIMARY'),
+                                   channels[0] if channels else None),
+            'channels': channels,
+            'wifiConfigured': bool(network.get('wifiEnabled') or network.get('wifiSsid')),
+        }
+        for field, name in METRIC_FIELDS.items():
+            data[name] = metrics.get(field)
+
+        with self.lock:
+            self.data = to_jsonable(data)
+            self.updated_at = time.time()
+            self.refreshes += 1
+
+    def telemetry_handler(self, packet, decoded):
+        """HandlerRegistry handler: fold our own device metrics into the snapshot"""
+        if self.my_num is None or packet.get('from') != self.my_num:
+            return
+        metrics = decoded.get('telemetry', {}).get('deviceMetrics')
+        if not metrics:
+            return
+        with self.lock:
+            if self.data is None:
+                return
+            for field, name in METRIC_FIELDS.items():
+                if field in metrics:
+                    self.data[name] = metrics[field]
+            self.updated_at = time.time()
+
+    def get(self, max_age=DEFAULT_MAX_AGE):
+        """Snapshot no older than max_age seconds (0 forces a refresh)"""
+        if self.data is None or time.time() - self.updated_at > max_age:
+            self.refresh()
+        with self.lock:
+            data = copy.deepcopy(self.data)
+            data['age'] = time.time() - self.updated_at
+        if self.node_index is not None and len(self.node_index):
+            data['meshNodes'] = len(self.node_index)
+        return data
+
+    def stats(self):
+        return {'refreshes': self.refreshes, 'age': time.time() - self.updated_at if self.data else None}
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Heltec V2 Telemetry Recorder
+Time series of every node's device/environment telemetry in append-only,
+array-backed column files with 1m/1h/1d rollups and range queries
+"""
+
+import os
+import re
+import sys
+import math
+import time
+import argparse
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from queue import Queue, Full, Empty
+
+from mesh_daemon import STATE_DIR
+from message_store import parse_since
+
+DEFAULT_PATH = os.environ.get('HELTEC_TELEMETRY_DIR', os.path.join(STATE_DIR, 'telemetry'))
+
+FLUSH_INTERVAL = 2.0
+COMPACT_INTERVAL = 3600    # seconds between retention passes in the writer thread
+QUEUE_SIZE = 10000
+MAX_POINTS = 1000
+
+# Telemetry variant -> metric prefix
+KINDS = {
+    'deviceMetrics': 'device',
+    'environmentMetrics': 'environment',
+    'powerMetrics': 'power',
+    'airQualityMetrics': 'airQuality',
+}
+
+RAW = 'raw'
+# Rollup name -> (bucket seconds, retention seconds); raw keeps two days
+ROLLUPS = {
+    '1m': (60, 30 * 86400),
+    '1h': (3600, 400 * 86400),
+    '1d': (86400, None),
+}
+RAW_RETENTION = 2 * 86400
+
+# Column files per resolution: suffix -> array typecode
+RAW_COLUMNS = {'t': 'd', 'v': 'f'}
+ROLLUP_COLUMNS = {'t': 'd', 'n': 'I', 'min': 'f', 'max': 'f', 'sum': 'd'}
+
+# Metric names contain dots, but a name made only of dots would walk the tree
+SAFE_NAME = re.compile(r'^(?!\.+$)[A-Za-z0-9_.!]+$')
+_STOP = object()
+
+
+def telemetry_samples(packet, decoded, received_at=None):
+    """(node_id, metric, time, value) for every numeric telemetry field
+
+    Samples are stamped with the local receive time: the telemetry's own
+    `time` comes from the sender's RTC, which may be unset or wrong, and the
+    series files must stay sorted by time
+    """
+    telemetry = (decoded or {}).get('telemetry') or {}
+    node_num = packet.get('from')
+    node_id = packet.get('fromId') or (f"!{node_num:08x}" if node_num is not None else None)
+    if not node_id:
+        return []
+    when = received_at or time.time()
+    samples = []
+    for kind, prefix in KINDS.items():
+        for field, value in (telemetry.get(kind) or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                samples.append((node_id, f"{prefix}.{field}", float(when), float(value)))
+    return samples
+
+
+def read_column(path, typecode):
+    column = array(typecode)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return column
+    column.frombytes(data[:len(data) - len(data) % column.itemsize])
+    return column
+
+
+class Series:
+    """One (node, metric): raw samples plus one open bucket per rollup"""
+
+    def __init__(self, path):
+        self.path = path
+        self.buckets = {}      # rollup -> [start, n, min, max, sum]
+        self.pending = {RAW: []}
+        self.last = self._last_time()
+
+    def _last_time(self):
+        """Time of the newest raw sample on disk, 0 if there is none"""
+        path = os.path.join(self.path, f"{RAW}.t")
+        column = array(RAW_COLUMNS['t'])
+        try:
+            with open(path, 'rb') as f:
+                end = f.seek(0, os.SEEK_END)
+                end -= end % column.itemsize
+                if end:
+                    f.seek(end - column.itemsize)
+                    column.frombytes(f.read(column.itemsize))
+        except FileNotFoundError:
+            pass
+        return column[-1] if column else 0.0
+
+    def add(self, when, value):
+        # Queries bisect the time column; never let a wall-clock step back unsort it
+        when = max(when, self.last)
+        self.last = when
+        self.pending[RAW].append((when, value))
+        for name, (seconds, _) in ROLLUPS.items():
+            start = when - when % seconds
+            bucket = self.buckets.get(name)
+            if bucket and bucket[0] == start:
+                bucket[1] += 1
+                bucket[2] = min(bucket[2], value)
+                bucket[3] = max(bucket[3], value)
+                bucket[4] += value
+                continue
+            # A new bucket closes the previous one (late samples get their own row)
+            if bucket:
+                self.pending.setdefault(name, []).append(tuple(bucket))
+            self.buckets[name] = [start, 1, value, value, value]
+
+    def flush(self, close_buckets=False):
+        """Append pending rows to the column files"""
+        if close_buckets:
+            for name, bucket in self.buckets.items():
+                self.pending.setdefault(name, []).append(tuple(bucket))
+            self.buckets = {}
+        os.makedirs(self.path, exist_ok=True)
+        written = 0
+        for name, rows in self.pending.items():
+            if not rows:
+                continue
+            columns = RAW_COLUMNS if name == RAW else ROLLUP_COLUMNS
+            for i, (suffix, typecode) in enumerate(columns.items()):
+                with open(os.path.join(self.path, f"{name}.{suffix}"), 'ab') as f:
+                    array(typecode, [row[i] for row in rows]).tofile(f)
+            written += len(rows)
+        self.pending = {RAW: []}
+        return written
+
+    def load(self, name):
+        """All columns of one resolution, trimmed to the shortest (torn append)"""
+        columns = RAW_COLUMNS if name == RAW else ROLLUP_COLUMNS
+        data = {suffix: read_column(os.path.join(self.path, f"{name}.{suffix}"), typecode)
+                for suffix, typecode in columns.items()}
+        length = min(len(c) for c in data.values())
+        return {suffix: c[:length] if len(c) > length else c for suffix, c in data.items()}
+
+
+class TelemetryRecorder:
+    def __init__(self, path=DEFAULT_PATH, flush_interval=FLUSH_INTERVAL,
+                 compact_interval=COMPACT_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.queue = Queue(maxsize=QUEUE_SIZE)
+        self.series = {}
+        self.lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.compacted = 0
+        self.writer = None
+        os.makedirs(path, exist_ok=True)
+
+    def start(self):
+        """Start the background writer thread"""
+        if not self.writer:
+            self.writer = threading.Thread(target=self._write_loop, name="telemetry-recorder", daemon=True)
+            self.writer.start()
+        return self
+
+    def handler(self, packet, decoded):
+        """HandlerRegistry-compatible entry point (register under TELEMETRY)"""
+        for sample in telemetry_samples(packet, decoded, time.time()):
+            try:
+                self.queue.put_nowait(sample)
+            except Full:
+                self.dropped += 1
+
+    def _series(self, node_id, metric):
+        if not SAFE_NAME.match(node_id) or not SAFE_NAME.match(metric):
+            raise ValueError(f"Invalid series name: {node_id}/{metric}")
+        key = (node_id, metric)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = Series(os.path.join(self.path, node_id, metric))
+        return series
+
+    def _write_loop(self):
+        # Retention runs once at start and then on a timer, so raw samples
+        # are kept for RAW_RETENTION without a manual --compact
+        next_compact = time.time()
+        stopping = False
+        while not stopping:
+            if self.compact_interval and time.time() >= next_compact:
+                try:
+                    self.compacted += self.compact()
+                except (OSError, ValueError):
+                    pass
+                next_compact = time.time() + self.compact_interval
+            try:
+                item = self.queue.get(timeout=self.compact_interval or None)
+            except Empty:
+                continue
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.time() + self.flush_interval
+            while True:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.time()))
+                except Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            with self.lock:
+                touched = set()
+                for node_id, metric, when, value in batch:
+                    try:
+                        series = self._series(node_id, metric)
+                    except ValueError:
+                        self.dropped += 1
+                        continue
+                    series.add(when, value)
+                    touched.add(series)
+                for series in touched:
+                    self.written += series.flush()
+        with self.lock:
+            for series in self.series.values():
+                self.written += series.flush(close_buckets=True)
+
+    def stop(self):
+        """Flush pending samples (and open buckets) and stop the writer"""
+        if self.writer:
+            self.queue.put(_STOP)
+            self.writer.join(timeout=10)
+            self.writer = None
+
+    def close(self):
+        self.stop()
+
+    def nodes(self):
+        try:
+            return sorted(os.listdir(self.path))
+        except FileNotFoundError:
+            return []
+
+    def metrics(self, node_id):
+        if not isinstance(node_id, str) or not SAFE_NAME.match(node_id):
+            raise ValueError(f"Invalid node id: {node_id}")
+        try:
+            return sorted(os.listdir(os.path.join(self.path, node_id)))
+        except FileNotFoundError:
+            return []
+
+    def pick_resolution(self, start, end, max_points=MAX_POINTS):
+        """Finest resolution that still covers `start` and fits in max_points"""
+        now = time.time()
+        span = (end or now) - start
+        if now - start <= RAW_RETENTION and span / 60 <= max_points:
+            return RAW
+        for name, (seconds, retention) in ROLLUPS.items():
+            if (retention is None or now - start <= retention) and span / seconds <= max_points:
+                return name
+        return '1d'
+
+    def query(self, node_id, metric, start, end=None, resolution=None, max_points=MAX_POINTS):
+        """Points with start <= time < end, oldest first
+
+        Raw points are {'time', 'value'}; rollup points are
+        {'time', 'count', 'min', 'max', 'mean'} (bucket start time).
+        """
+        resolution = resolution or self.pick_resolution(start, end, max_points)
+        if resolution != RAW and resolution not in ROLLUPS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        if resolution != RAW:
+            # Include the bucket that contains `start`
+            start -= start % ROLLUPS[resolution][0]
+        with self.lock:
+            series = self._series(node_id, metric)
+            data = series.load(resolution)
+            open_bucket = series.buckets.get(resolution)
+            pending = list(series.pending.get(resolution, []))
+
+        times = data['t']
+        lo = bisect_left(times, start)
+        hi = bisect_left(times, end) if end is not None else len(times)
+
+        if resolution == RAW:
+            points = [{'time': times[i], 'value': data['v'][i]} for i in range(lo, hi)]
+            return {'resolution': RAW, 'points': points[-max_points:]}
+
+        # Partial buckets written across restarts share a start time; merge them
+        merged = {}
+        rows = [(times[i], data['n'][i], data['min'][i], data['max'][i], data['sum'][i])
+                for i in range(lo, hi)]
+        rows += [r for r in pending + ([tuple(open_bucket)] if open_bucket else [])
+                 if r[0] >= start and (end is None or r[0] < end)]
+        for t, n, low, high, total in rows:
+            if t in merged:
+                m = merged[t]
+                merged[t] = (m[0] + n, min(m[1], low), max(m[2], high), m[3] + total)
+            else:
+                merged[t] = (n, low, high, total)
+        points = [{'time': t, 'count': n, 'min': low, 'max': high, 'mean': total / n if n else math.nan}
+                  for t, (n, low, high, total) in sorted(merged.items())]
+        return {'resolution': resolution, 'points': points[-max_points:]}
+
+    def compact(self):
+        """Drop raw and rollup rows past their retention by rewriting each column file"""
+        now = time.time()
+        retention = {RAW: RAW_RETENTION, **{name: keep for name, (_, keep) in ROLLUPS.items()}}
+        removed = 0
+        with self.lock:
+            for node_id in self.nodes():
+                for metric in self.metrics(node_id):
+                    series = self._series(node_id, metric)
+                    for name, keep in retention.items():
+                        if keep is None:
+                            continue
+                        data = series.load(name)
+                        cut = bisect_left(data['t'], now - keep)
+                        if not cut:
+                            continue
+                        columns = RAW_COLUMNS if name == RAW else ROLLUP_COLUMNS
+                        for suffix in columns:
+                            target = os.path.join(series.path, f"{name}.{suffix}")
+                            with open(target + '.tmp', 'wb') as f:
+                                data[suffix][cut:].tofile(f)
+                            os.replace(target + '.tmp', target)
+                        removed += cut
+        return removed
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'compacted': self.compacted,
+                'queued': self.queue.qsize(), 'series': len(self.series)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query recorded mesh telemetry")
+    parser.add_argument('--dir', default=DEFAULT_PATH)
+    parser.add_argument('--node', help="Node id (e.g. !a1b2c3d4); omit to list recorded nodes")
+    parser.add_argument('--metric', help="e.g. device.batteryLevel; omit to list the node's metrics")
+    parser.add_argument('--since', default='24h', help="Range start: epoch or age like 2h, 7d")
+    parser.add_argument('--until', help="Range end: epoch or age like 1h")
+    parser.add_argument('--resolution', choices=[RAW, *ROLLUPS], help="Default: picked from the range")
+    parser.add_argument('--compact', action='store_true', help="Drop rows past their retention")
+    args = parser.parse_args()
+
+    recorder = TelemetryRecorder(args.dir)
+    if args.compact:
+        print(f"🧹 Removed {recorder.compact()} old rows")
+        return 0
+    if not args.node:
+        nodes = recorder.nodes()
+        print(f"📡 Telemetry recorded for {len(nodes)} nodes")
+        for node_id in nodes:
+            print(f"  {node_id}: {', '.join(recorder.metrics(node_id))}")
+        return 0
+    if not args.metric:
+        print(f"📈 {args.node}: {', '.join(recorder.metrics(args.node)) or 'no metrics'}")
+        return 0
+
+    result = recorder.query(args.node, args.metric, parse_since(args.since),
+                            parse_since(args.until) if args.until else None, args.resolution)
+    print(f"📈 {args.node} {args.metric} ({result['resolution']}, {len(result['points'])} points)")
+    for point in result['points']:
+        timestamp = datetime.fromtimestamp(point['time']).strftime('%Y-%m-%d %H:%M:%S')
+        if 'value' in point:
+            print(f"[{timestamp}] {point['value']:.2f}")
+        else:
+            print(f"[{timestamp}] mean {point['mean']:.2f}  min {point['min']:.2f}  "
+                  f"max {point['max']:.2f}  ({point['count']} samples)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
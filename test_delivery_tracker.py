@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Unit tests for delivery_tracker.py against a real SendQueue and a fake radio
+"""
+
+import time
+import itertools
+
+import pytest
+
+from delivery_tracker import DeliveryTracker, percentile
+from packet_handlers import HandlerRegistry
+from send_queue import ACKED, FAILED, SENT, SendQueue
+
+MY_NODE = 1
+PEER = '!00000002'
+
+
+class FakeInterface:
+    """Records sends and hands out packet ids like meshtastic's sendText"""
+
+    def __init__(self):
+        self.ids = itertools.count(100)
+        self.sent = []
+
+    def sendText(self, text, destinationId=None, wantAck=False, channelIndex=0):
+        packet = {'id': next(self.ids), 'to': destinationId, 'wantAck': wantAck}
+        self.sent.append(packet)
+        return packet
+
+    def getMyNodeInfo(self):
+        return {'num': MY_NODE}
+
+
+@pytest.fixture
+def mesh():
+    interface = FakeInterface()
+    queue = SendQueue(interface, preset='SHORT_TURBO', region='US').start()
+    registry = HandlerRegistry()
+    trackers = []
+
+    def tracker(**kwargs):
+        kwargs.setdefault('backoff', 0.01)
+        trackers.append(DeliveryTracker(queue, registry, **kwargs).start())
+        return trackers[-1]
+
+    yield interface, registry, tracker
+    for t in trackers:
+        t.stop()
+    queue.stop(drain_timeout=0)
+
+
+def routing(request_id, from_num=2, reason='NONE'):
+    return {'from': from_num, 'decoded': {'portnum': 'ROUTING_APP', 'requestId': request_id,
+                                          'routing': {'errorReason': reason}}}
+
+
+def sent(delivery, attempt=1, timeout=2):
+    """Packet id of the given attempt once the queue has transmitted it"""
+    deadline = time.time() + timeout
+    while len(delivery.attempts) < attempt and time.time() < deadline:
+        time.sleep(0.005)
+    delivery.attempts[attempt - 1].wait_sent(timeout)
+    return delivery.attempts[attempt - 1].packet_id
+
+
+def test_broadcast_is_done_when_sent(mesh):
+    interface, registry, tracker = mesh
+    tracker = tracker()
+    delivery = tracker.send('hello all')
+
+    assert delivery.wait(2) == SENT
+    assert interface.sent[0]['wantAck'] is False
+    stats = tracker.stats()
+    assert (stats['broadcast'], stats['unacknowledged'], stats['awaitingAck']) == (1, 0, 0)
+
+
+def test_direct_message_acked_by_routing_packet(mesh):
+    interface, registry, tracker = mesh
+    tracker = tracker()
+    delivery = tracker.send('hi', PEER)
+    registry.dispatch(routing(sent(delivery)))
+
+    assert delivery.wait(2) == ACKED
+    assert delivery.latency is not None
+    stats = tracker.stats()
+    assert (stats['acked'], stats['awaitingAck']) == (1, 0)
+    assert stats['latency']['p50'] == delivery.latency
+
+
+def test_nak_retries_then_fails(mesh):
+    interface, registry, tracker = mesh
+    tracker = tracker(max_retries=2)
+    delivery = tracker.send('hi', PEER)
+    # Each nak schedules the next attempt after a short backoff
+    for attempt in (1, 2, 3):
+        registry.dispatch(routing(sent(delivery, attempt), reason='MAX_RETRANSMIT'))
+
+    assert delivery.wait(2) == FAILED
+    assert delivery.error == 'MAX_RETRANSMIT'
+    assert delivery.retries == 2
+    assert len(interface.sent) == 3
+    assert tracker.stats()['retries'] == 2
+
+
+def test_retry_can_still_be_acked(mesh):
+    interface, registry, tracker = mesh
+    tracker = tracker(max_retries=1)
+    delivery = tracker.send('hi', PEER)
+    registry.dispatch(routing(sent(delivery), reason='NO_RESPONSE'))
+    registry.dispatch(routing(sent(delivery, attempt=2)))
+
+    assert delivery.wait(2) == ACKED
+    assert delivery.retries == 1
+
+
+def test_ack_for_an_unknown_packet_is_ignored(mesh):
+    interface, registry, tracker = mesh
+    tracker = tracker()
+    delivery = tracker.send('hi', PEER)
+    sent(delivery)
+    registry.dispatch(routing(12345))
+
+    assert not delivery.done.is_set()
+    assert tracker.stats()['awaitingAck'] == 1
+
+
+def test_ack_timeout_fails_without_an_implicit_ack(mesh):
+    interface, registry, tracker = mesh
+    tracker = tracker(max_retries=0, ack_timeout=0.05)
+    delivery = tracker.send('hi', PEER)
+
+    assert delivery.wait(2) == FAILED
+    assert delivery.error == 'TIMEOUT'
+
+
+def test_own_rebroadcast_counts_as_implicit_ack_on_timeout(mesh):
+    interface, registry, tracker = mesh
+    tracker = tracker(max_retries=0, ack_timeout=0.1)
+    delivery = tracker.send('hi', PEER)
+    registry.dispatch(routing(sent(delivery), from_num=MY_NODE))
+
+    assert delivery.wait(2) == ACKED
+    assert delivery.implicit_ack
+
+
+def test_want_ack_override_for_a_direct_message(mesh):
+    interface, registry, tracker = mesh
+    tracker = tracker()
+    delivery = tracker.send('hi', PEER, want_ack=False)
+
+    assert delivery.wait(2) == SENT
+    assert interface.sent[0]['wantAck'] is False
+    assert tracker.stats()['broadcast'] == 1
+
+
+def test_on_done_callback_runs_once(mesh):
+    interface, registry, tracker = mesh
+    tracker = tracker()
+    done = []
+    delivery = tracker.send('hi', PEER, on_done=done.append)
+    packet_id = sent(delivery)
+    registry.dispatch(routing(packet_id))
+    registry.dispatch(routing(packet_id))
+    delivery.wait(2)
+
+    assert done == [delivery]
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([], 50) is None
@@ -3,9 +3,13 @@
 Heltec V2 Status Check and Basic Messaging
 """
 
+import os
 import sys
 import signal
-import glob
+import argparse
+
+import mesh_daemon
+from mesh_json import JsonOutput
 
 try:
     import meshtastic
@@ -18,19 +22,51 @@ except ImportError:
     import meshtastic.serial_interface
 
 def main():
+    parser = argparse.ArgumentParser(description="Quick Heltec V2 status check")
+    parser.add_argument('--json', action='store_true', help="Print one JSON status document on stdout")
+    parser.add_argument('--no-send-test', dest='send_test', action='store_false',
+                        help="Only read status, don't broadcast the test message")
+    args = parser.parse_args()
+    output = JsonOutput(args.json)
+    
+    # Same fields as the MCP worker's status call
+    status = {
+        'connected': False,
+        'daemon': False,
+        'nodeId': None,
+        'nodeName': None,
+        'battery': None,
+        'voltage': None,
+        'meshNodes': 0,
+        'primaryChannel': None,
+        'testMessageSent': False,
+        'wifiConfigured': False,
+        'error': None,
+    }
+    
     print("🚀 Heltec V2 Quick Test")
     print("=" * 30)
     
+    # Reuse the daemon's link if one is running
+    interface = mesh_daemon.connect_daemon()
+    
     # Find device
-    device = "/dev/cu.usbserial-0001"
-    if device not in glob.glob("/dev/cu.usbserial*"):
-        print("❌ Device not found at /dev/cu.usbserial-0001")
+    device = mesh_daemon.DEFAULT_DEVICE
+    if not interface and not os.path.exists(device):
+        print(f"❌ Device not found at {device}")
+        status['error'] = f"Device not found at {device}"
+        output.document(status)
         return 1
     
     try:
-        print(f"🔌 Connecting to {device}...")
-        interface = meshtastic.serial_interface.SerialInterface(device)
+        if interface:
+            print("⚡ Attached to mesh daemon")
+            status['daemon'] = True
+        else:
+            print(f"🔌 Connecting to {device}...")
+            interface = meshtastic.serial_interface.SerialInterface(device)
         print("✅ Connected!")
+        status['connected'] = True
         
         # Get device info
         print("\n📊 Device Status:")
@@ -38,6 +74,8 @@ def main():
         if node_info:
             user = node_info.get('user', {})
             print(f"📛 Node: {user.get('longName', 'Unknown')} ({user.get('id', 'Unknown')})")
+            status['nodeName'] = user.get('longName')
+            status['nodeId'] = user.get('id')
             
             # Check for device metrics
             metrics = node_info.get('deviceMetrics', {})
@@ -45,35 +83,44 @@ def main():
                 battery = metrics.get('batteryLevel')
                 if battery:
                     print(f"🔋 Battery: {battery}%")
+                    status['battery'] = battery
                 voltage = metrics.get('voltage')
                 if voltage:
                     print(f"⚡ Voltage: {voltage}V")
+                    status['voltage'] = voltage
                     
         # Check mesh network
         nodes = interface.nodes
         print(f"🌐 Mesh nodes: {len(nodes)} discovered")
+        status['meshNodes'] = len(nodes)
         
         # Check for WiFi status by looking at config
         config = interface.localNode.getChannelByChannelIndex(0)
         print(f"📡 Primary channel: {config}")
+        status['primaryChannel'] = mesh_daemon.to_jsonable(config)
         
-        print("\n📱 Send a test message:")
-        test_msg = f"Hello from Heltec V2! Time: {interface.getMyNodeInfo()}"
-        print(f"Sending: {test_msg[:50]}...")
-        
-        try:
-            interface.sendText("Hello from Heltec V2! 🚀")
-            print("✅ Test message sent to mesh!")
-        except Exception as e:
-            print(f"⚠️  Message send error: {e}")
+        if args.send_test:
+            print("\n📱 Send a test message:")
+            test_msg = f"Hello from Heltec V2! Time: {interface.getMyNodeInfo()}"
+            print(f"Sending: {test_msg[:50]}...")
+            
+            try:
+                interface.sendText("Hello from Heltec V2! 🚀")
+                print("✅ Test message sent to mesh!")
+                status['testMessageSent'] = True
+            except Exception as e:
+                print(f"⚠️  Message send error: {e}")
+        else:
+            print("\n📱 Test message skipped (--no-send-test)")
         
         # Check if device has WiFi configured
         print("\n🌐 WiFi Status Check:")
         try:
             # This will show us if WiFi is configured
             prefs = interface.localNode.localConfig
-            if hasattr(prefs, 'network'):
+            if hasattr(prefs, 'network') or (isinstance(prefs, dict) and 'network' in prefs):
                 print("✅ WiFi configuration found")
+                status['wifiConfigured'] = True
             else:
                 print("ℹ️  WiFi config not accessible via this method")
         except Exception as e:
@@ -85,8 +132,11 @@ def main():
         
     except Exception as e:
         print(f"❌ Error: {e}")
+        status['error'] = str(e)
+        output.document(status)
         return 1
     
+    output.document(status)
     return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Unit tests for bin/exception_decoder.py: crash scanning and the ELF symbol index
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent / "bin"))
+import exception_decoder  # noqa: E402
+from exception_decoder import AddressResolver, CrashScanner, ElfIndex, decode_stream  # noqa: E402
+
+S3_LOG = """\
+Guru Meditation Error: Core  1 panic'ed (LoadProhibited). Exception was unhandled.
+
+Core  1 register dump:
+PC      : 0x42012345  PS      : 0x00060830  A0      : 0x82013456  A1      : 0x3fcebd40
+EXCVADDR: 0x00000010  LBEG    : 0x40056f5c  LEND    : 0x40056f72  LCOUNT  : 0xffffffff
+
+
+Backtrace: 0x42012345:0x3fcebd40 0x42013453:0x3fcebd60 0x4037a1b2:0x3fcebd80 |<-CORRUPTED
+"""
+
+C3_LOG = """\
+Guru Meditation Error: Core  0 panic'ed (Load access fault). Exception was unhandled.
+
+Core  0 register dump:
+MEPC    : 0x42004d6a  RA      : 0x42004d60  SP      : 0x3fc8f0a0  GP      : 0x3fc8a200
+MSTATUS : 0x00001881  MTVEC   : 0x40380001  MCAUSE  : 0x00000005  MTVAL   : 0x00000004
+
+Stack memory:
+3fc8f0a0: 0x00000000 0x42004d60 0x3fc8f0d0 0x42006b2c
+3fc8f0b0: 0x3fc8f100 0x00000001 0x00000000 0x00000000
+Guru Meditation Error: Core  0 panic'ed (Instruction access fault). Exception was unhandled.
+MEPC    : 0x00000000  RA      : 0x42007000  SP      : 0x3fc8f000  GP      : 0x3fc8a200
+Stack memory:
+3fc8f000: 0x42008000
+"""
+
+ESP8266_LOG = """\
+Exception (28):
+epc1=0x4020b4e4 epc2=0x00000000 epc3=0x00000000 excvaddr=0x00000000 depc=0x00000000
+
+ctx: cont
+sp: 3ffffdb0 end: 3fffffc0 offset: 01a0
+
+>>>stack>>>
+3ffffdb0:  40203b39 3ffee8d0 3ffee8d0 40203b2e
+<<<stack<<<
+"""
+
+PROGRAM = """\
+static int counter;
+
+int add(int a, int b)
+{
+    return a + b;
+}
+
+int main(void)
+{
+    counter = add(1, 2);
+    return counter;
+}
+"""
+
+
+def scan(platform, text):
+    scanner = CrashScanner(platform)
+    crashes = [crash for crash in map(scanner.feed, text.splitlines()) if crash]
+    last = scanner.finish()
+    return crashes + ([last] if last else [])
+
+
+def test_esp32s3_backtrace_and_registers():
+    [crash] = scan("ESP32S3", S3_LOG)
+    assert crash["backtrace"] == ["0x42012345", "0x42013453", "0x4037a1b2"]
+    assert crash["corrupted"]
+    assert (crash["reason"], crash["core"]) == ("LoadProhibited", 1)
+    assert (crash["pc"], crash["excvaddr"]) == ("0x42012345", "0x00000010")
+
+
+def test_stale_panic_header_is_not_attached():
+    filler = "\n".join("log line %d" % i for i in range(exception_decoder.CONTEXT_LINES + 1))
+    log = S3_LOG.replace("\n\nBacktrace:", "\n" + filler + "\nBacktrace:")
+    [crash] = scan("ESP32", log)
+    assert crash["reason"] is None
+    assert len(crash["backtrace"]) == 3
+
+
+def test_esp32c3_stack_memory_dumps():
+    first, second = scan("ESP32C3", C3_LOG)
+    assert first["reason"] == "Load access fault"
+    assert (first["pc"], first["excvaddr"]) == ("0x42004d6a", "0x00000004")
+    assert first["stack"][:2] == ["0x42004d6a", "0x42004d60"]
+    assert len(first["stack"]) == 2 + 8
+    assert not first["truncated"]
+
+    # The second panic starts on the line that ended the first dump
+    assert second["reason"] == "Instruction access fault"
+    assert second["stack"] == ["0x00000000", "0x42007000", "0x42008000"]
+    assert second["truncated"]
+
+
+def test_esp32c3_without_panic_header_is_ignored():
+    assert scan("ESP32C3", "Stack memory:\n3fc8f000: 0x42008000\n") == []
+
+
+def test_esp8266_exception_block():
+    [crash] = scan("ESP8266", ESP8266_LOG)
+    assert crash["exception"] == 28
+    assert crash["pc"] == "0x4020b4e4"
+    assert crash["stack"] == ["40203b39", "3ffee8d0", "3ffee8d0", "40203b2e"]
+    assert not crash["truncated"]
+
+
+@pytest.fixture(scope="module")
+def elf(tmp_path_factory):
+    pytest.importorskip("elftools")
+    if not shutil.which("gcc"):
+        pytest.skip("gcc is not installed")
+    directory = tmp_path_factory.mktemp("elf")
+    source = directory / "prog.c"
+    source.write_text(PROGRAM)
+    binary = directory / "prog"
+    subprocess.run(["gcc", "-g", "-O0", "-no-pie", "-o", str(binary), str(source)], check=True)
+    return str(binary)
+
+
+def symbol(index, name):
+    for i in range(len(index.sym_lo)):
+        if index.names[index.sym_name[i]] == name:
+            return index.sym_lo[i]
+    raise KeyError(name)
+
+
+def test_elf_index_lookup(elf):
+    index = ElfIndex(elf)
+    [(function, path, line)] = index.lookup(symbol(index, "add"))
+    assert function == "add"
+    assert path.endswith("prog.c")
+    assert line == 4
+
+
+def test_elf_index_save_load_round_trip(elf, tmp_path):
+    index = ElfIndex(elf)
+    path = str(tmp_path / "prog.idx")
+    index.save(path)
+    loaded = ElfIndex.load(path)
+
+    assert list(loaded.files) == list(index.files)
+    for address in list(index.sym_lo) + list(index.line_addr):
+        assert loaded.lookup(address) == index.lookup(address)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_elf_index_load_rejects_bad_files(elf, tmp_path):
+    path = tmp_path / "prog.idx"
+    ElfIndex(elf).save(str(path))
+    data = path.read_bytes()
+
+    path.write_bytes(b"NOTINDEX" + data[8:])
+    with pytest.raises(ValueError):
+        ElfIndex.load(str(path))
+    path.write_bytes(data[: len(data) // 2])
+    with pytest.raises(ValueError):
+        ElfIndex.load(str(path))
+
+
+def test_load_index_reuses_the_cache(elf, tmp_path):
+    first = exception_decoder.load_index(elf, cache_dir=str(tmp_path))
+    [cached] = os.listdir(tmp_path)
+    second = exception_decoder.load_index(elf, cache_dir=str(tmp_path))
+
+    assert cached.endswith(".idx")
+    assert isinstance(second.sym_lo, memoryview)
+    address = symbol(first, "main")
+    assert second.lookup(address) == first.lookup(address)
+
+
+def test_decode_stream_resolves_backtrace_and_code_words(elf):
+    index = ElfIndex(elf)
+    add, main = "0x%08x" % symbol(index, "add"), "0x%08x" % symbol(index, "main")
+    log = "Backtrace: {}:0x3ffb0000 {}:0x3ffb0010\n".format(add, main)
+    log += C3_LOG.replace("0x42006b2c", add).replace("0x42004d6a", main)
+
+    resolver = AddressResolver(None, elf, index)
+    esp32 = list(decode_stream(log.splitlines(), CrashScanner("ESP32"), resolver))
+    assert [f["function"] for f in esp32[0]["frames"]] == ["add", "main"]
+
+    c3 = list(decode_stream(log.splitlines(), CrashScanner("ESP32C3"), resolver))
+    # Only the stack words that resolve to code become frames
+    assert [f["function"] for f in c3[0]["frames"]] == ["main", "add"]
+    assert c3[0]["pc"]["function"] == "main"
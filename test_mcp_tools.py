@@ -9,16 +9,17 @@ to test each tool's underlying Python script functionality.
 import subprocess
 import sys
 import time
-import os
 from pathlib import Path
 
-# Ensure we're in the right directory
-os.chdir('/Users/david/Documents/HeltecV2')
+from mesh_daemon import DEFAULT_DEVICE
+
+PROJECT_ROOT = Path(__file__).resolve().parent
 
 class MCPToolTester:
     def __init__(self):
-        self.python_path = '.venv/bin/python'
-        self.project_root = Path('/Users/david/Documents/HeltecV2')
+        venv_python = PROJECT_ROOT / '.venv' / 'bin' / 'python'
+        self.python_path = str(venv_python) if venv_python.exists() else sys.executable
+        self.project_root = PROJECT_ROOT
         self.success_count = 0
         self.total_tests = 0
         
@@ -71,7 +72,7 @@ class MCPToolTester:
         print("🚀 HELTEC V2 MCP TOOLS COMPREHENSIVE TEST")
         print("=" * 60)
         print("Testing all 8 tools with connected Heltec V2 board...")
-        print("Board should be at /dev/cu.usbserial-0001")
+        print(f"Board should be at {DEFAULT_DEVICE}")
         
         # Tool 1: check_device_status
         self.run_test(
@@ -97,9 +98,10 @@ class MCPToolTester:
 import meshtastic
 import meshtastic.serial_interface
 import sys
+from mesh_daemon import DEFAULT_DEVICE as DEVICE
 
 try:
-    interface = meshtastic.serial_interface.SerialInterface("/dev/cu.usbserial-0001")
+    interface = meshtastic.serial_interface.SerialInterface(DEVICE)
     print("✅ Connected to device")
     
     # Get node info
@@ -149,10 +151,11 @@ except Exception as e:
 import meshtastic
 import meshtastic.serial_interface
 import sys
+from mesh_daemon import DEFAULT_DEVICE as DEVICE
 import time
 
 try:
-    interface = meshtastic.serial_interface.SerialInterface("/dev/cu.usbserial-0001")
+    interface = meshtastic.serial_interface.SerialInterface(DEVICE)
     print("✅ Connected to device for message test")
     
     # Send test message
@@ -198,9 +201,10 @@ except Exception as e:
 import meshtastic
 import meshtastic.serial_interface
 import sys
+from mesh_daemon import DEFAULT_DEVICE as DEVICE
 
 try:
-    interface = meshtastic.serial_interface.SerialInterface("/dev/cu.usbserial-0001")
+    interface = meshtastic.serial_interface.SerialInterface(DEVICE)
     print("✅ Connected to device for signal quality check")
     
     # Get device metrics
@@ -263,9 +267,10 @@ except Exception as e:
 import meshtastic
 import meshtastic.serial_interface
 import sys
+from mesh_daemon import DEFAULT_DEVICE as DEVICE
 
 try:
-    interface = meshtastic.serial_interface.SerialInterface("/dev/cu.usbserial-0001")
+    interface = meshtastic.serial_interface.SerialInterface(DEVICE)
     print("✅ Connected to device for configuration check")
     
     # Get device configuration
@@ -323,11 +328,12 @@ except Exception as e:
 import meshtastic
 import meshtastic.serial_interface
 import sys
+from mesh_daemon import DEFAULT_DEVICE as DEVICE
 import time
 import threading
 
 try:
-    interface = meshtastic.serial_interface.SerialInterface("/dev/cu.usbserial-0001")
+    interface = meshtastic.serial_interface.SerialInterface(DEVICE)
     print("✅ Connected to device for message monitoring")
     print("👂 Monitoring for incoming messages (10 seconds)...")
     
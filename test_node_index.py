@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Unit tests for node_index.py
+"""
+
+from node_index import NodeIndex, ADDED, UPDATED, node_num_from_id
+from packet_handlers import HandlerRegistry
+
+
+def nodeinfo(num, node_id, short, rx_time, snr=None):
+    packet = {'from': num, 'rxTime': rx_time,
+              'decoded': {'portnum': 'NODEINFO_APP',
+                          'user': {'id': node_id, 'shortName': short, 'longName': short.upper()}}}
+    if snr is not None:
+        packet['rxSnr'] = snr
+    return packet
+
+
+def test_node_num_from_id():
+    assert node_num_from_id('!a1b2c3d4') == 0xa1b2c3d4
+    assert node_num_from_id('!xyz') is None
+    assert node_num_from_id('a1b2c3d4') is None
+    assert node_num_from_id(5) is None
+
+
+def test_lookup_by_num_id_and_short_name():
+    index = NodeIndex()
+    index.handle_packet(nodeinfo(0x10, '!00000010', 'ab', 100), None)
+
+    assert index.get(0x10)['user']['id'] == '!00000010'
+    assert index.get('!00000010')['num'] == 0x10
+    assert index.get('ab')['num'] == 0x10
+    assert index.get('zz') is None
+
+
+def test_short_name_change_moves_lookup():
+    index = NodeIndex()
+    index.handle_packet(nodeinfo(1, '!00000001', 'old', 100), None)
+    index.handle_packet(nodeinfo(1, '!00000001', 'new', 101), None)
+
+    assert index.get('old') is None
+    assert index.get('new')['num'] == 1
+
+
+def test_heard_since_and_recent_order():
+    index = NodeIndex()
+    for num, heard in ((1, 100), (2, 300), (3, 200)):
+        index.update(num, {'lastHeard': heard})
+    index.update(4, {'user': {'id': '!00000004'}})  # never heard
+
+    assert [n['num'] for n in index.heard_since(150, now=350)] == [2, 3]
+    assert [n['num'] for n in index.recent()] == [2, 3, 1, 4]
+    assert [n['num'] for n in index.recent(2)] == [2, 3]
+
+
+def test_last_heard_update_reorders():
+    index = NodeIndex()
+    index.update(1, {'lastHeard': 100})
+    index.update(2, {'lastHeard': 200})
+    index.update(1, {'lastHeard': 300})
+
+    assert [n['num'] for n in index.recent()] == [1, 2]
+    assert len(index.last_heard) == 2
+
+
+def test_top_by_snr():
+    index = NodeIndex()
+    for num, snr in ((1, -5.0), (2, 7.5), (3, 1.0)):
+        index.handle_packet({'from': num, 'rxTime': 100, 'rxSnr': snr}, None)
+
+    assert [n['num'] for n in index.top_by_snr(2)] == [2, 3]
+    assert index.top_by_snr(0) == []
+
+
+def test_hops_and_telemetry_fields():
+    index = NodeIndex()
+    index.handle_packet({'from': 1, 'rxTime': 100, 'hopStart': 3, 'hopLimit': 1,
+                         'decoded': {'portnum': 'TELEMETRY_APP',
+                                     'telemetry': {'deviceMetrics': {'batteryLevel': 80}}}}, None)
+    node = index.get(1)
+    assert node['hopsAway'] == 2
+    assert node['deviceMetrics'] == {'batteryLevel': 80}
+
+
+def test_listeners_see_added_then_changed_fields_only():
+    index = NodeIndex()
+    events = []
+    index.on_change(lambda event, node, changed: events.append((event, sorted(changed))))
+
+    index.update(1, {'lastHeard': 100, 'snr': 1.0})
+    index.update(1, {'lastHeard': 100, 'snr': 1.0})  # nothing changed
+    index.update(1, {'lastHeard': 200, 'snr': 1.0})
+
+    assert events == [(ADDED, ['lastHeard', 'snr']), (UPDATED, ['lastHeard'])]
+
+
+def test_seed_does_not_notify():
+    index = NodeIndex()
+    events = []
+    index.on_change(lambda *args: events.append(args))
+    index.seed({'!00000007': {'user': {'id': '!00000007', 'shortName': 'sv'}, 'lastHeard': 50}})
+
+    assert events == []
+    assert index.get('sv')['num'] == 7
+
+
+def test_queries_return_copies():
+    index = NodeIndex()
+    index.update(1, {'lastHeard': 100})
+    index.get(1)['lastHeard'] = 0
+    index.recent()[0]['lastHeard'] = 0
+
+    assert index.get(1)['lastHeard'] == 100
+
+
+def test_register_tracks_every_packet():
+    registry = HandlerRegistry()
+    index = NodeIndex()
+    index.register(registry)
+    registry.dispatch({'from': 9, 'rxTime': 100, 'decoded': {'portnum': 'TEXT_MESSAGE_APP', 'text': 'hi'}})
+
+    assert index.get(9)['lastHeard'] == 100
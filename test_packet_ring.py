@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Unit tests for packet_ring.py (cursor paging and missed-packet accounting)
+"""
+
+import threading
+import time
+
+from packet_ring import PacketRing, packet_filter
+
+
+def text(from_id, body='hi'):
+    return {'fromId': from_id, 'decoded': {'portnum': 'TEXT_MESSAGE_APP', 'text': body}}
+
+
+def fill(ring, count, start=0):
+    for i in range(start, start + count):
+        ring.append({'id': i})
+
+
+def ids(packets):
+    return [p['id'] for p in packets]
+
+
+def test_none_cursor_only_sees_future_traffic():
+    ring = PacketRing(size=10)
+    fill(ring, 3)
+    packets, cursor, missed = ring.read(None)
+    assert (packets, cursor, missed) == ([], 3, 0)
+
+    fill(ring, 2, start=3)
+    packets, cursor, missed = ring.read(cursor)
+    assert ids(packets) == [3, 4]
+    assert (cursor, missed) == (5, 0)
+
+
+def test_zero_cursor_starts_at_oldest_buffered():
+    ring = PacketRing(size=10)
+    fill(ring, 4)
+    packets, cursor, missed = ring.read(0)
+    assert ids(packets) == [0, 1, 2, 3]
+    assert (cursor, missed) == (4, 0)
+
+
+def test_limit_pages_without_losing_packets():
+    ring = PacketRing(size=10)
+    fill(ring, 5)
+    first, cursor, _ = ring.read(0, limit=2)
+    second, cursor, _ = ring.read(cursor, limit=2)
+    third, cursor, _ = ring.read(cursor, limit=2)
+    assert ids(first) + ids(second) + ids(third) == [0, 1, 2, 3, 4]
+    assert cursor == 5
+
+
+def test_missed_counts_packets_that_fell_off_the_ring():
+    ring = PacketRing(size=3)
+    fill(ring, 8)  # seq 1..8, only 6..8 still buffered
+    packets, cursor, missed = ring.read(2)
+    assert ids(packets) == [5, 6, 7]
+    assert (cursor, missed) == (8, 3)
+
+    # A caught-up reader misses nothing
+    fill(ring, 1, start=8)
+    packets, cursor, missed = ring.read(cursor)
+    assert (ids(packets), cursor, missed) == ([8], 9, 0)
+
+
+def test_filtered_packets_still_advance_the_cursor():
+    ring = PacketRing(size=10)
+    for from_id in ('!00000001', '!00000002', '!00000001'):
+        ring.append(text(from_id))
+    match = packet_filter(from_ids='!00000002')
+    packets, cursor, missed = ring.read(0, match=match)
+    assert [p['fromId'] for p in packets] == ['!00000002']
+    assert cursor == 3
+
+
+def test_packet_filter_by_numeric_portnum_and_from_num():
+    match = packet_filter(from_ids=['!0000000a'], portnums=1)
+    assert match({'from': 10, 'decoded': {'portnum': 'TEXT_MESSAGE_APP'}})
+    assert not match({'from': 10, 'decoded': {'portnum': 'POSITION_APP'}})
+    assert not match({'from': 11, 'decoded': {'portnum': 'TEXT_MESSAGE_APP'}})
+    assert packet_filter() is None
+
+
+def test_wait_returns_when_a_packet_arrives():
+    ring = PacketRing(size=10)
+    timer = threading.Timer(0.05, ring.append, args=({'id': 'late'},))
+    timer.start()
+    started = time.time()
+    packets, cursor, missed = ring.read(None, wait=2)
+    timer.join()
+    assert ids(packets) == ['late']
+    assert time.time() - started < 1
+
+
+def test_wait_recounts_missed_when_the_ring_laps_a_waiting_reader():
+    ring = PacketRing(size=2)
+    fill(ring, 2)
+    match = packet_filter(portnums='TEXT_MESSAGE_APP')
+
+    def burst():
+        # One atomic burst (the condition's lock is reentrant): laps the reader
+        with ring.cond:
+            fill(ring, 5, start=2)
+            ring.append(text('!00000001'))
+
+    timer = threading.Timer(0.05, burst)
+    timer.start()
+    packets, cursor, missed = ring.read(2, match=match, wait=2)
+    timer.join()
+    assert len(packets) == 1
+    assert cursor == 8
+    assert missed == 4
+
+
+def test_wait_times_out_empty():
+    ring = PacketRing(size=10)
+    packets, cursor, missed = ring.read(None, wait=0.05)
+    assert (packets, cursor, missed) == ([], 0, 0)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Unit tests for send_queue.AirtimeBudget (duty cycle and channel utilisation)
+"""
+
+import pytest
+
+from send_queue import (AirtimeBudget, CHANNEL_UTIL_BACKOFF, CHANNEL_UTIL_MAX_AGE,
+                        MS_IN_HOUR, POLITE_DUTY_CYCLE_PERCENT, SendQueue, text_airtime_ms)
+
+NOW = 1_000_000.0
+
+
+def test_unlimited_duty_cycle_never_waits():
+    budget = AirtimeBudget(duty_cycle=100)
+    budget.record(MS_IN_HOUR, now=NOW)
+    assert budget.wait_time(1000, now=NOW) == 0.0
+
+
+def test_duty_cycle_allows_polite_share_of_the_hour():
+    budget = AirtimeBudget(duty_cycle=10)
+    allowed = MS_IN_HOUR * 10 / 100 * POLITE_DUTY_CYCLE_PERCENT / 100
+    budget.record(allowed - 1000, now=NOW)
+    assert budget.wait_time(1000, now=NOW) == 0.0
+    assert budget.wait_time(1001, now=NOW) > 0
+
+
+def test_wait_until_enough_airtime_ages_out():
+    budget = AirtimeBudget(duty_cycle=10)
+    allowed = MS_IN_HOUR * 10 / 100 * POLITE_DUTY_CYCLE_PERCENT / 100
+    budget.record(allowed / 2, now=NOW)
+    budget.record(allowed / 2, now=NOW + 600)
+
+    # The first half must expire, an hour after it was sent
+    assert budget.wait_time(1000, now=NOW + 1200) == pytest.approx(3600 - 1200)
+    assert budget.wait_time(1000, now=NOW + 3601) == 0.0
+
+
+def test_tx_percent_expires_after_an_hour():
+    budget = AirtimeBudget(duty_cycle=10)
+    budget.record(36_000, now=NOW)
+    assert budget.tx_percent(now=NOW + 10) == pytest.approx(1.0)
+    assert budget.tx_percent(now=NOW + 3601) == 0.0
+
+
+def test_busy_channel_backs_off_until_the_reading_is_stale(monkeypatch):
+    budget = AirtimeBudget(duty_cycle=100, polite=True)
+    monkeypatch.setattr('send_queue.time.time', lambda: NOW)
+    budget.update_channel_util(30)
+
+    assert budget.wait_time(100, now=NOW + 1) == CHANNEL_UTIL_BACKOFF
+    assert budget.wait_time(100, now=NOW + CHANNEL_UTIL_MAX_AGE + 1) == 0.0
+
+
+def test_impolite_budget_tolerates_more_channel_use(monkeypatch):
+    monkeypatch.setattr('send_queue.time.time', lambda: NOW)
+    budget = AirtimeBudget(polite=False)
+    budget.update_channel_util(30)
+    assert budget.wait_time(100, now=NOW) == 0.0
+    budget.update_channel_util(45)
+    assert budget.wait_time(100, now=NOW) == CHANNEL_UTIL_BACKOFF
+
+
+def test_missing_reading_is_ignored():
+    budget = AirtimeBudget()
+    budget.update_channel_util(None)
+    assert budget.channel_util == 0.0
+
+
+def test_airtime_grows_with_payload_and_slower_presets():
+    assert text_airtime_ms('x' * 100) > text_airtime_ms('x')
+    assert text_airtime_ms('hello', 'LONG_SLOW') > text_airtime_ms('hello', 'SHORT_TURBO')
+
+
+class FakeInterface:
+    def getMyNodeInfo(self):
+        return {'num': 1}
+
+
+def test_only_our_own_channel_utilisation_throttles():
+    queue = SendQueue(FakeInterface(), preset='SHORT_TURBO', region='US')
+
+    def telemetry(num, util):
+        return {'from': num}, {'telemetry': {'deviceMetrics': {'channelUtilization': util}}}
+
+    queue.telemetry_handler(*telemetry(2, 90))
+    assert queue.budget.channel_util == 0.0
+    queue.telemetry_handler(*telemetry(1, 12.5))
+    assert queue.budget.channel_util == 12.5